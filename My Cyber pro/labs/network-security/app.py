@@ -1,4 +1,11 @@
-from flask import Flask, render_template_string, request, jsonify
+from flask import Flask, Response, render_template_string, request, jsonify
+from captures import CaptureError, CaptureExists, CaptureManager
+from live import FilterError, LiveFeeds, Subscription, compile_filter
+from netstats import NetStats
+from pcap_index import PcapFormatError, PcapIndexCache
+from sweep import MAX_CONCURRENCY, SweepError, parse_ports, run_sweep, sweep_hosts
+import json
+import time
 import subprocess
 import os
 
@@ -26,10 +33,24 @@ HTML_TEMPLATE = '''
         
         <div class="section">
             <h2>Packet Capture</h2>
+            <input type="text" id="capture-name" placeholder="Name" value="default">
+            <input type="text" id="capture-interface" placeholder="Interface" value="any">
+            <input type="text" id="capture-filter" placeholder="BPF filter (e.g. tcp port 502)">
+            <input type="number" id="capture-rotate-mb" placeholder="MB per file" value="100" style="width: 90px;">
+            <input type="number" id="capture-files" placeholder="Files kept" value="5" style="width: 70px;">
+            <br>
             <button onclick="startCapture()">Start Capture</button>
             <button onclick="stopCapture()">Stop Capture</button>
             <button onclick="viewCapture()">View Packets</button>
+            <button onclick="pageCapture(-1)">&#9664; Older</button>
+            <button onclick="pageCapture(1)">Newer &#9654;</button>
+            <button onclick="listCaptures()">List Captures</button>
             <pre id="capture-output"></pre>
+            <input type="text" id="live-filter" placeholder="Live filter (e.g. tcp port 502 and not host 10.0.0.5)" style="width: 400px;">
+            <input type="number" id="live-rate" placeholder="Lines/s" value="50" style="width: 80px;">
+            <button id="live-button" onclick="toggleLive()">Live View</button>
+            <pre id="live-stats"></pre>
+            <pre id="live-output" style="max-height: 400px; overflow-y: auto;"></pre>
         </div>
         
         <div class="section">
@@ -38,17 +59,39 @@ HTML_TEMPLATE = '''
             <button onclick="pingHost()">Ping</button>
             <pre id="ping-output"></pre>
         </div>
+
+        <div class="section">
+            <h2>Host Sweep</h2>
+            <input type="text" id="sweep-cidr" placeholder="Network (e.g. 192.168.2.0/24)" value="192.168.2.0/24">
+            <input type="text" id="sweep-ports" placeholder="TCP ports" value="22,80,443,502">
+            <button onclick="sweepNetwork()">Sweep</button>
+            <pre id="sweep-output"></pre>
+        </div>
         
         <div class="section">
             <h2>Interface Info</h2>
-            <button onclick="getInterfaces()">Show Interfaces</button>
+            <button id="interface-button" onclick="toggleInterfaces()">Show Interfaces</button>
             <pre id="interface-output"></pre>
         </div>
     </div>
     
     <script>
+        function captureName() {
+            return document.getElementById('capture-name').value || 'default';
+        }
+
         function startCapture() {
-            fetch('/api/capture/start', {method: 'POST'})
+            fetch('/api/captures', {
+                method: 'POST',
+                headers: {'Content-Type': 'application/json'},
+                body: JSON.stringify({
+                    name: captureName(),
+                    interface: document.getElementById('capture-interface').value || 'any',
+                    filter: document.getElementById('capture-filter').value,
+                    rotate_mb: parseInt(document.getElementById('capture-rotate-mb').value) || 0,
+                    files: parseInt(document.getElementById('capture-files').value) || 5
+                })
+            })
                 .then(r => r.json())
                 .then(data => {
                     document.getElementById('capture-output').textContent = data.message;
@@ -56,21 +99,84 @@ HTML_TEMPLATE = '''
         }
         
         function stopCapture() {
-            fetch('/api/capture/stop', {method: 'POST'})
+            fetch('/api/captures/' + encodeURIComponent(captureName()), {method: 'DELETE'})
                 .then(r => r.json())
                 .then(data => {
                     document.getElementById('capture-output').textContent = data.message;
                 });
         }
+
+        function listCaptures() {
+            fetch('/api/captures')
+                .then(r => r.json())
+                .then(data => {
+                    document.getElementById('capture-output').textContent = data.length ? data.map(c =>
+                        `${c.name} [${c.running ? 'running' : 'stopped'}] ${c.interface} ${c.filter || ''}\n` +
+                        `  ${c.packets} packets, ${c.dropped} dropped, ${(c.bytes_on_disk / 1e6).toFixed(1)} MB in ${c.files.length} file(s)` +
+                        (c.error ? `\n  error: ${c.error}` : '')
+                    ).join('\n') : 'No captures';
+                });
+        }
         
-        function viewCapture() {
-            fetch('/api/capture/view')
+        const PAGE_SIZE = 50;
+        let viewOffset = null;
+
+        function viewCapture(offset) {
+            let url = '/api/capture/view?limit=' + PAGE_SIZE + '&name=' + encodeURIComponent(captureName());
+            if (offset !== undefined && offset !== null) url += '&offset=' + offset;
+            fetch(url)
                 .then(r => r.json())
                 .then(data => {
-                    document.getElementById('capture-output').textContent = data.output || 'No packets captured';
+                    viewOffset = data.offset;
+                    const header = data.total !== undefined
+                        ? `${data.file}: packets ${data.offset + 1}-${data.offset + data.count} of ${data.total}\n\n`
+                        : '';
+                    document.getElementById('capture-output').textContent =
+                        data.output ? header + data.output : 'No packets captured';
                 });
         }
+
+        function pageCapture(direction) {
+            if (viewOffset === null) return viewCapture();
+            viewCapture(Math.max(viewOffset + direction * PAGE_SIZE, 0));
+        }
         
+        const LIVE_LINES = 500;
+        let liveSource = null;
+
+        function toggleLive() {
+            const button = document.getElementById('live-button');
+            if (liveSource) {
+                liveSource.close();
+                liveSource = null;
+                button.textContent = 'Live View';
+                return;
+            }
+            const params = new URLSearchParams({
+                filter: document.getElementById('live-filter').value,
+                rate: document.getElementById('live-rate').value || 50
+            });
+            const output = document.getElementById('live-output');
+            output.textContent = '';
+            liveSource = new EventSource('/api/captures/' + encodeURIComponent(captureName()) + '/stream?' + params);
+            liveSource.onmessage = (event) => {
+                const lines = (output.textContent + JSON.parse(event.data).join('\n') + '\n').split('\n');
+                output.textContent = lines.slice(-LIVE_LINES - 1).join('\n');
+                output.scrollTop = output.scrollHeight;
+            };
+            liveSource.addEventListener('stats', (event) => {
+                const s = JSON.parse(event.data);
+                document.getElementById('live-stats').textContent =
+                    `${s.matched}/${s.seen} packets matched, ${s.sent} shown, ` +
+                    `${s.rate_limited} over the rate limit, ${s.dropped} dropped`;
+            });
+            liveSource.addEventListener('stopped', (event) => {
+                document.getElementById('live-stats').textContent += '\n' + JSON.parse(event.data).message;
+                toggleLive();
+            });
+            button.textContent = 'Stop Live View';
+        }
+
         function pingHost() {
             const target = document.getElementById('ping-target').value;
             fetch('/api/ping?target=' + target)
@@ -80,58 +186,238 @@ HTML_TEMPLATE = '''
                 });
         }
         
+        async function sweepNetwork() {
+            const output = document.getElementById('sweep-output');
+            const params = new URLSearchParams({
+                cidr: document.getElementById('sweep-cidr').value,
+                ports: document.getElementById('sweep-ports').value
+            });
+            output.textContent = 'Sweeping...\n';
+            const response = await fetch('/api/sweep?' + params);
+            if (!response.ok) {
+                output.textContent = (await response.json()).message;
+                return;
+            }
+            // Results arrive one JSON line per host as hosts finish
+            const reader = response.body.getReader();
+            const decoder = new TextDecoder();
+            let buffer = '';
+            while (true) {
+                const {value, done} = await reader.read();
+                if (done) break;
+                buffer += decoder.decode(value, {stream: true});
+                const lines = buffer.split('\n');
+                buffer = lines.pop();
+                for (const line of lines.filter(Boolean)) {
+                    const result = JSON.parse(line);
+                    if (result.done) {
+                        output.textContent += result.error
+                            ? `Error: ${result.error}\n`
+                            : `\n${result.up}/${result.hosts} hosts up in ${result.elapsed}s (ICMP: ${result.icmp})\n`;
+                    } else if (result.up) {
+                        output.textContent += `${result.host.padEnd(16)} ${String(result.rtt_ms).padStart(8)} ms` +
+                            `${result.icmp ? '  icmp' : ''}${result.open.length ? '  open: ' + result.open.join(',') : ''}\n`;
+                    } else if (result.error) {
+                        output.textContent += `${result.host.padEnd(16)} error: ${result.error}\n`;
+                    }
+                }
+            }
+        }
+
+        let interfaceTimer = null;
+
+        function formatRate(bytesPerSecond) {
+            const bits = bytesPerSecond * 8;
+            if (bits >= 1e9) return (bits / 1e9).toFixed(2) + ' Gbps';
+            if (bits >= 1e6) return (bits / 1e6).toFixed(2) + ' Mbps';
+            return (bits / 1e3).toFixed(1) + ' kbps';
+        }
+
         function getInterfaces() {
             fetch('/api/interfaces')
                 .then(r => r.json())
                 .then(data => {
-                    document.getElementById('interface-output').textContent = data.output;
+                    document.getElementById('interface-output').textContent = Object.entries(data.interfaces).map(([name, i]) => {
+                        const r = i.rates || {rx_bytes: 0, tx_bytes: 0, rx_packets: 0, tx_packets: 0,
+                                              rx_errors: 0, tx_errors: 0, rx_dropped: 0, tx_dropped: 0};
+                        return `${name} [${i.state}] mtu ${i.mtu} ${i.mac || ''} ${i.ipv4 || ''} ${i.ipv6.join(' ')}\n` +
+                            `  rx ${formatRate(r.rx_bytes).padStart(12)} ${String(r.rx_packets).padStart(9)} pps` +
+                            `  errors ${r.rx_errors}/s  drops ${r.rx_dropped}/s\n` +
+                            `  tx ${formatRate(r.tx_bytes).padStart(12)} ${String(r.tx_packets).padStart(9)} pps` +
+                            `  errors ${r.tx_errors}/s  drops ${r.tx_dropped}/s`;
+                    }).join('\n\n');
                 });
         }
+
+        function toggleInterfaces() {
+            const button = document.getElementById('interface-button');
+            if (interfaceTimer) {
+                clearInterval(interfaceTimer);
+                interfaceTimer = null;
+                button.textContent = 'Show Interfaces';
+                return;
+            }
+            getInterfaces();
+            interfaceTimer = setInterval(getInterfaces, 1000);
+            button.textContent = 'Stop Updating';
+        }
     </script>
 </body>
 </html>
 '''
 
-capture_process = None
+STREAM_MAX_RATE = 1000
+STREAM_STATS_INTERVAL = 1.0
+
+capture_manager = CaptureManager()
+live_feeds = LiveFeeds()
+net_stats = NetStats(
+    interval=float(os.environ.get('NETSTATS_INTERVAL', 1.0)),
+    history=int(os.environ.get('NETSTATS_HISTORY', 300))
+)
+pcap_indexes = PcapIndexCache()
 
 @app.route('/')
 def index():
     return render_template_string(HTML_TEMPLATE)
 
+@app.route('/api/captures', methods=['GET'])
+def list_captures():
+    return jsonify(capture_manager.list())
+
+@app.route('/api/captures', methods=['POST'])
+def create_capture():
+    options = request.get_json(silent=True) or {}
+    name = str(options.get('name', 'default'))
+    try:
+        capture = capture_manager.start(
+            name,
+            interface=str(options.get('interface', 'any')),
+            bpf=str(options.get('filter', '')),
+            rotate_mb=max(int(options.get('rotate_mb', 100)), 0),
+            rotate_seconds=max(int(options.get('rotate_seconds', 0)), 0),
+            files=max(int(options.get('files', 5)), 1)
+        )
+    except (TypeError, ValueError):
+        return jsonify({'message': 'rotate_mb, rotate_seconds and files must be integers'}), 400
+    except CaptureExists as e:
+        return jsonify({'message': f'Error: {e}'}), 409
+    except CaptureError as e:
+        return jsonify({'message': f'Error: {e}'}), 400
+    filter_text = f" ({capture.bpf})" if capture.bpf else ''
+    return jsonify({'message': f"Capture '{name}' started on {capture.interface}{filter_text}",
+                    'capture': capture.info()}), 201
+
+@app.route('/api/captures/<name>', methods=['GET'])
+def get_capture(name):
+    try:
+        return jsonify(capture_manager.get(name).info())
+    except KeyError:
+        return jsonify({'message': f"No capture named '{name}'"}), 404
+
+@app.route('/api/captures/<name>', methods=['DELETE'])
+def delete_capture(name):
+    try:
+        capture = capture_manager.stop(name)
+    except KeyError:
+        return jsonify({'message': f"No capture named '{name}'"}), 404
+    info = capture.info()
+    return jsonify({'message': f"Capture '{name}' stopped: {info['packets']} packets, {info['dropped']} dropped",
+                    'capture': info})
+
+@app.route('/api/captures/<name>/stream')
+def stream_capture(name):
+    """Server-Sent Events of one-line summaries of matching packets as they are captured"""
+    try:
+        capture = capture_manager.get(name)
+    except KeyError:
+        return jsonify({'message': f"No capture named '{name}'"}), 404
+    try:
+        predicate = compile_filter(request.args.get('filter', ''))
+        rate = min(max(int(request.args.get('rate', 50)), 1), STREAM_MAX_RATE)
+    except FilterError as e:
+        return jsonify({'message': f'Error: {e}'}), 400
+    except ValueError:
+        return jsonify({'message': 'Error: rate must be an integer'}), 400
+
+    subscription = Subscription(predicate, rate)
+    feed = live_feeds.subscribe(capture, subscription)
+
+    def generate():
+        yield 'retry: 2000\n\n'
+        last_stats = time.monotonic()
+        try:
+            while True:
+                # Lines queued within one wait are sent as one event
+                lines = subscription.get(STREAM_STATS_INTERVAL)
+                if lines:
+                    yield f'data: {json.dumps(lines)}\n\n'
+                now = time.monotonic()
+                if now - last_stats >= STREAM_STATS_INTERVAL:
+                    last_stats = now
+                    yield f'event: stats\ndata: {json.dumps(subscription.stats)}\n\n'
+                    if not capture.running:
+                        yield f"event: stopped\ndata: {json.dumps({'message': f'Capture {name} stopped'})}\n\n"
+                        return
+        finally:
+            live_feeds.unsubscribe(feed, subscription)
+
+    response = Response(generate(), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
 @app.route('/api/capture/start', methods=['POST'])
 def start_capture():
-    global capture_process
     try:
-        capture_process = subprocess.Popen(
-            ['tcpdump', '-i', 'any', '-w', '/tmp/capture.pcap'],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE
-        )
+        capture_manager.start('default', interface='any')
         return jsonify({'message': 'Capture started on all interfaces'})
-    except Exception as e:
-        return jsonify({'message': f'Error: {str(e)}'})
+    except CaptureExists as e:
+        return jsonify({'message': f'Error: {str(e)}'}), 409
+    except CaptureError as e:
+        return jsonify({'message': f'Error: {str(e)}'}), 400
 
 @app.route('/api/capture/stop', methods=['POST'])
 def stop_capture():
-    global capture_process
-    if capture_process:
-        capture_process.terminate()
-        capture_process = None
+    try:
+        capture = capture_manager.get('default')
+    except KeyError:
+        capture = None
+    if capture is not None and capture.running:
+        capture.stop()
         return jsonify({'message': 'Capture stopped'})
     return jsonify({'message': 'No capture running'})
 
 @app.route('/api/capture/view')
 def view_capture():
+    name = request.args.get('name', 'default')
     try:
-        result = subprocess.run(
-            ['tcpdump', '-r', '/tmp/capture.pcap', '-n', '-c', '50'],
-            capture_output=True,
-            text=True,
-            timeout=5
-        )
-        return jsonify({'output': result.stdout})
-    except Exception as e:
+        files = capture_manager.get(name).file_list()
+    except KeyError:
+        files = []
+    if not files:
+        return jsonify({'output': ''})
+
+    # Only files of this capture can be opened
+    by_name = {os.path.basename(path): path for path in files}
+    file_name = request.args.get('file') or os.path.basename(files[-1])
+    if file_name not in by_name:
+        return jsonify({'output': f'Error: no file {file_name} in capture {name}'}), 404
+    try:
+        limit = min(max(int(request.args.get('limit', 50)), 1), 1000)
+        offset = request.args.get('offset')
+        offset = int(offset) if offset not in (None, '') else None
+    except ValueError:
+        return jsonify({'output': 'Error: offset and limit must be integers'}), 400
+
+    try:
+        page = pcap_indexes.page(by_name[file_name], offset, limit)
+    except (OSError, PcapFormatError) as e:
         return jsonify({'output': f'Error: {str(e)}'})
+    page['file'] = file_name
+    page['files'] = list(by_name)
+    page['output'] = '\n'.join(page['packets'])
+    return jsonify(page)
 
 @app.route('/api/ping')
 def ping():
@@ -147,25 +433,42 @@ def ping():
     except Exception as e:
         return jsonify({'output': f'Error: {str(e)}'})
 
+@app.route('/api/sweep')
+def sweep_network():
+    try:
+        hosts = sweep_hosts(request.args.get('cidr', ''))
+        ports = parse_ports(request.args.get('ports'))
+        timeout = min(max(float(request.args.get('timeout', 1.0)), 0.1), 10.0)
+        concurrency = min(max(int(request.args.get('concurrency', 128)), 1), MAX_CONCURRENCY)
+    except SweepError as e:
+        return jsonify({'message': f'Error: {e}'}), 400
+    except ValueError:
+        return jsonify({'message': 'Error: timeout and concurrency must be numbers'}), 400
+    icmp = request.args.get('icmp', '1') not in ('0', 'false', 'no')
+
+    def generate():
+        for result in run_sweep(hosts, ports, timeout, concurrency, icmp):
+            yield json.dumps(result) + '\n'
+
+    return Response(generate(), mimetype='application/x-ndjson',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
 @app.route('/api/interfaces')
 def interfaces():
+    return jsonify({'interval': net_stats.interval, 'updated': net_stats.updated,
+                    'interfaces': net_stats.interfaces()})
+
+@app.route('/api/interfaces/<name>/history')
+def interface_history(name):
     try:
-        result = subprocess.run(
-            ['ip', 'addr'],
-            capture_output=True,
-            text=True,
-            timeout=5
-        )
-        return jsonify({'output': result.stdout})
-    except:
-        # Fallback to ifconfig
-        result = subprocess.run(
-            ['ifconfig'],
-            capture_output=True,
-            text=True,
-            timeout=5
-        )
-        return jsonify({'output': result.stdout})
+        seconds = request.args.get('seconds')
+        seconds = float(seconds) if seconds else None
+    except ValueError:
+        return jsonify({'message': 'seconds must be a number'}), 400
+    try:
+        return jsonify(net_stats.interface_history(name, seconds))
+    except KeyError:
+        return jsonify({'message': f"No interface named '{name}'"}), 404
 
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=8082, debug=False)
@@ -0,0 +1,242 @@
+"""
+Capture manager for the Network Security Lab
+
+Each named capture is a tcpdump process with its own interface, BPF filter
+and directory. Files rotate by size (tcpdump -C) and/or time (-G) and only
+the newest `files` are kept, so a long capture cannot fill the disk.
+Packet and drop counters come from the running tcpdump: it prints them on
+SIGUSR1, and a reader thread parses its stderr.
+"""
+
+import glob
+import os
+import re
+import shutil
+import signal
+import subprocess
+import threading
+import time
+
+CAPTURE_DIR = os.environ.get('CAPTURE_DIR', '/tmp/captures')
+MAX_CAPTURES = 8
+STATS_INTERVAL = 2.0
+# Longest wait for tcpdump to report it is listening (or to fail) on start
+STARTUP_TIMEOUT = 2.0
+
+NAME_PATTERN = re.compile(r'^[A-Za-z0-9_-]{1,32}$')
+COUNTER_PATTERN = re.compile(r'^(\d+) packets? (captured|received by filter|dropped by kernel|dropped by interface)')
+COUNTER_KEYS = {
+    'captured': 'packets',
+    'received by filter': 'received',
+    'dropped by kernel': 'dropped_kernel',
+    'dropped by interface': 'dropped_interface'
+}
+
+
+class CaptureError(Exception):
+    pass
+
+
+class CaptureExists(CaptureError):
+    pass
+
+
+class Capture:
+    def __init__(self, name, interface='any', bpf='', rotate_mb=100, rotate_seconds=0, files=5):
+        self.name = name
+        self.interface = interface
+        self.bpf = bpf
+        self.rotate_mb = rotate_mb
+        self.rotate_seconds = rotate_seconds
+        self.files = files
+        self.directory = os.path.join(CAPTURE_DIR, name)
+        self.process = None
+        self.started = None
+        self.stopped = None
+        self.error = None
+        self.counters = {'packets': 0, 'received': 0, 'dropped_kernel': 0, 'dropped_interface': 0}
+        self.last_message = None
+        self._reader = None
+        self.listening = False
+        self._ready = threading.Event()
+
+    def command(self):
+        if self.rotate_seconds:
+            # Time rotation needs a strftime name; -W would stop tcpdump, so old files are pruned here
+            path = os.path.join(self.directory, f'{self.name}-%Y%m%d-%H%M%S.pcap')
+        else:
+            path = os.path.join(self.directory, f'{self.name}.pcap')
+        # -U writes each packet out at once so live streams can tail the file
+        command = ['tcpdump', '-i', self.interface, '-n', '-U', '-Z', 'root', '-w', path]
+        if self.rotate_mb:
+            command += ['-C', str(self.rotate_mb)]
+        if self.rotate_seconds:
+            command += ['-G', str(self.rotate_seconds)]
+        elif self.rotate_mb:
+            # Size-only rotation: tcpdump reuses name.pcap0..N-1 as a ring
+            command += ['-W', str(self.files)]
+        if self.bpf:
+            command.append(self.bpf)
+        return command
+
+    @property
+    def running(self):
+        return self.process is not None and self.process.poll() is None
+
+    def start(self):
+        os.makedirs(self.directory, exist_ok=True)
+        self.process = subprocess.Popen(
+            self.command(),
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+            text=True
+        )
+        self.started = time.time()
+        self.stopped = None
+        self._reader = threading.Thread(target=self._read_stderr, daemon=True)
+        self._reader.start()
+        # tcpdump prints 'listening on' once the interface and filter are
+        # accepted, or exits with the reason; the reader signals either
+        if self._ready.wait(STARTUP_TIMEOUT) and not self.listening:
+            try:
+                self.process.wait(timeout=1)  # stderr closed: tcpdump is exiting
+            except subprocess.TimeoutExpired:
+                pass
+        if self.process.poll() is not None:
+            self.exited()
+            raise CaptureError(self.error or 'tcpdump exited on startup')
+
+    def exited(self):
+        """Record why tcpdump ended on its own"""
+        self.process.wait()
+        self._reader.join(timeout=1)
+        self.stopped = time.time()
+        if self.process.returncode:
+            self.error = self.last_message or f'tcpdump exited with status {self.process.returncode}'
+
+    def _read_stderr(self):
+        for line in self.process.stderr:
+            line = line.strip()
+            match = COUNTER_PATTERN.match(line)
+            if match:
+                self.counters[COUNTER_KEYS[match.group(2)]] = int(match.group(1))
+            elif 'listening on' in line:
+                self.listening = True
+                self._ready.set()
+            elif line:
+                self.last_message = line
+        # stderr closes when tcpdump exits
+        self._ready.set()
+
+    def request_counters(self):
+        """Ask tcpdump to print its counters; they are picked up from stderr"""
+        if self.running:
+            try:
+                self.process.send_signal(signal.SIGUSR1)
+            except OSError:
+                pass
+
+    def stop(self):
+        if self.running:
+            self.process.send_signal(signal.SIGINT)
+            try:
+                self.process.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+                self.process.wait()
+        self.stopped = self.stopped or time.time()
+
+    def file_list(self):
+        """Capture files, oldest first"""
+        paths = glob.glob(os.path.join(self.directory, f'{self.name}*.pcap*'))
+        return sorted(paths, key=lambda path: (os.path.getmtime(path), path))
+
+    def prune(self):
+        """Keep only the newest `files` files (time rotation)"""
+        paths = self.file_list()
+        # The newest file, the one being written, is always kept
+        for path in paths[:max(len(paths) - self.files, 0)]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def info(self):
+        files = []
+        for path in self.file_list():
+            try:
+                files.append({'file': os.path.basename(path), 'bytes': os.path.getsize(path),
+                              'modified': os.path.getmtime(path)})
+            except OSError:
+                pass
+        end = self.stopped or time.time()
+        return {
+            'name': self.name,
+            'interface': self.interface,
+            'filter': self.bpf,
+            'running': self.running,
+            'started': self.started,
+            'stopped': self.stopped,
+            'duration': end - self.started if self.started else 0,
+            'rotate_mb': self.rotate_mb,
+            'rotate_seconds': self.rotate_seconds,
+            'max_files': self.files,
+            'packets': self.counters['packets'],
+            'received': self.counters['received'],
+            'dropped': self.counters['dropped_kernel'] + self.counters['dropped_interface'],
+            'bytes_on_disk': sum(f['bytes'] for f in files),
+            'files': files,
+            'error': self.error
+        }
+
+
+class CaptureManager:
+    def __init__(self):
+        self.captures = {}
+        self.lock = threading.Lock()
+        threading.Thread(target=self._maintain, daemon=True).start()
+
+    def start(self, name, **options):
+        if not NAME_PATTERN.match(name):
+            raise CaptureError('Capture names use letters, digits, - and _ (up to 32)')
+        if not shutil.which('tcpdump'):
+            raise CaptureError('tcpdump is not installed')
+        if not options.get('rotate_mb', 100) and not options.get('rotate_seconds'):
+            raise CaptureError('Set rotate_mb or rotate_seconds so old files can be removed')
+        with self.lock:
+            existing = self.captures.get(name)
+            if existing is not None and existing.running:
+                raise CaptureExists(f"Capture '{name}' is already running")
+            if sum(capture.running for capture in self.captures.values()) >= MAX_CAPTURES:
+                raise CaptureError(f'At most {MAX_CAPTURES} captures can run at once')
+            capture = Capture(name, **options)
+            self.captures[name] = capture
+        capture.start()
+        return capture
+
+    def stop(self, name):
+        capture = self.get(name)
+        capture.stop()
+        return capture
+
+    def get(self, name):
+        capture = self.captures.get(name)
+        if capture is None:
+            raise KeyError(name)
+        return capture
+
+    def list(self):
+        return [capture.info() for capture in list(self.captures.values())]
+
+    def _maintain(self):
+        """Refresh counters and prune rotated files of running captures"""
+        while True:
+            time.sleep(STATS_INTERVAL)
+            for capture in list(self.captures.values()):
+                if capture.running:
+                    capture.request_counters()
+                    if capture.rotate_seconds:
+                        capture.prune()
+                elif capture.process is not None and capture.stopped is None:
+                    # tcpdump exited on its own (interface gone, killed)
+                    capture.exited()
@@ -0,0 +1,329 @@
+"""
+Live packet streams for the Network Security Lab
+
+One LiveFeed per capture tails the capture's newest file (following
+rotation) and decodes each new record once. Every client subscription has
+its own filter, a token bucket capping the lines per second it is sent and
+a bounded queue; packets that do not match are skipped, and packets over
+the rate or queue limit are dropped and counted instead of being sent, so
+a browser tab on a busy segment only receives what it asked for.
+
+Filters use tcpdump's primitive syntax on the decoded fields:
+`tcp port 502 and not host 10.0.0.5`, `src net 192.168.2.0/24`,
+`udp or arp`, `dst port 53 || icmp`.
+"""
+
+from collections import deque
+import ipaddress
+import mmap
+import os
+import struct
+import threading
+import time
+
+from pcap_index import PCAP_MAGIC, decode, summarize
+
+POLL_INTERVAL = 0.1
+ROTATION_CHECK = 1.0
+READ_SIZE = 1 << 20
+
+PROTOCOLS = {'tcp': ('ip', 6), 'udp': ('ip', 17), 'icmp': ('ip', 1), 'icmp6': ('ip6', 58)}
+FAMILIES = ('ip', 'ip6', 'arp')
+
+
+class FilterError(ValueError):
+    pass
+
+
+def _address_primitive(kind, direction, value):
+    try:
+        if kind == 'host':
+            target = str(ipaddress.ip_address(value))
+            match = lambda address: address == target
+        else:
+            network = ipaddress.ip_network(value, strict=False)
+            match = lambda address: ipaddress.ip_address(address) in network
+    except ValueError:
+        raise FilterError(f'Invalid {kind}: {value}')
+
+    def check(packet, fields=('src', 'dst') if direction is None else (direction,)):
+        return any(packet[field] is not None and match(packet[field]) for field in fields)
+    return check
+
+
+def _port_primitive(direction, value):
+    try:
+        port = int(value)
+    except ValueError:
+        raise FilterError(f'Invalid port: {value}')
+    fields = ('sport', 'dport') if direction is None else (direction[0] + 'port',)
+    return lambda packet: any(packet[field] == port for field in fields)
+
+
+class FilterParser:
+    """Recursive descent over tokens: or > and (or juxtaposition) > not > primitive"""
+
+    def __init__(self, text):
+        self.tokens = text.replace('(', ' ( ').replace(')', ' ) ').replace('!', ' ! ').split()
+        self.position = 0
+
+    def peek(self):
+        return self.tokens[self.position] if self.position < len(self.tokens) else None
+
+    def take(self):
+        token = self.peek()
+        if token is None:
+            raise FilterError('Filter ends unexpectedly')
+        self.position += 1
+        return token
+
+    def parse(self):
+        predicate = self.expression()
+        if self.peek() is not None:
+            raise FilterError(f'Unexpected {self.peek()!r} in filter')
+        return predicate
+
+    def expression(self):
+        terms = [self.term()]
+        while self.peek() in ('or', '||'):
+            self.take()
+            terms.append(self.term())
+        return terms[0] if len(terms) == 1 else lambda packet: any(term(packet) for term in terms)
+
+    def term(self):
+        factors = [self.factor()]
+        while self.peek() not in (None, 'or', '||', ')'):
+            if self.peek() in ('and', '&&'):
+                self.take()
+            factors.append(self.factor())
+        return factors[0] if len(factors) == 1 else lambda packet: all(factor(packet) for factor in factors)
+
+    def factor(self):
+        token = self.take()
+        if token in ('not', '!'):
+            inner = self.factor()
+            return lambda packet: not inner(packet)
+        if token == '(':
+            inner = self.expression()
+            if self.take() != ')':
+                raise FilterError('Missing )')
+            return inner
+        return self.primitive(token)
+
+    def primitive(self, token):
+        direction = None
+        if token in ('src', 'dst'):
+            direction, token = token, self.take()
+        if token in ('host', 'net'):
+            return _address_primitive(token, direction, self.take())
+        if token == 'port':
+            return _port_primitive(direction, self.take())
+        if direction is None and token in PROTOCOLS:
+            family, protocol = PROTOCOLS[token]
+            return lambda packet: packet['family'] == family and packet['protocol'] == protocol
+        if direction is None and token in FAMILIES:
+            return lambda packet: packet['family'] == token
+        raise FilterError(f'Unknown filter term {token!r}')
+
+
+def compile_filter(text):
+    """Predicate over decoded packets; an empty filter matches everything"""
+    if not text or not text.strip():
+        return lambda packet: True
+    return FilterParser(text.lower()).parse()
+
+
+class Subscription:
+    def __init__(self, predicate, rate=50, queue_size=1000):
+        self.predicate = predicate
+        self.rate = rate
+        self.tokens = float(rate)
+        self.updated = time.monotonic()
+        self.queue = deque()
+        self.queue_size = queue_size
+        self.ready = threading.Condition()
+        self.stats = {'seen': 0, 'matched': 0, 'sent': 0, 'rate_limited': 0, 'dropped': 0}
+
+    def wants(self, packet):
+        """Count and filter a packet; True when its summary should be queued"""
+        self.stats['seen'] += 1
+        if not self.predicate(packet):
+            return False
+        self.stats['matched'] += 1
+        now = time.monotonic()
+        self.tokens = min(self.rate, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens < 1:
+            self.stats['rate_limited'] += 1
+            return False
+        self.tokens -= 1
+        return True
+
+    def put(self, lines):
+        with self.ready:
+            room = self.queue_size - len(self.queue)
+            if room < len(lines):
+                self.stats['dropped'] += len(lines) - max(room, 0)
+                lines = lines[:max(room, 0)]
+            self.queue.extend(lines)
+            self.ready.notify()
+
+    def get(self, timeout):
+        """Queued lines, waiting up to timeout for at least one"""
+        with self.ready:
+            if not self.queue:
+                self.ready.wait(timeout)
+            lines = list(self.queue)
+            self.queue.clear()
+            self.stats['sent'] += len(lines)
+            return lines
+
+
+class LiveFeed:
+    """Tails one capture and fans decoded packets out to its subscriptions"""
+
+    def __init__(self, capture, on_idle):
+        self.capture = capture
+        self.on_idle = on_idle
+        self.subscriptions = []
+        self.lock = threading.Lock()
+        self.path = None
+        self.offset = 0
+        self.record = None
+        self.resolution = None
+        self.linktype = None
+        self.packets = 0
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def subscribe(self, subscription):
+        with self.lock:
+            self.subscriptions.append(subscription)
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            self.subscriptions.remove(subscription)
+
+    def _open(self, path, from_end):
+        """Start tailing path at its end (first subscriber) or its first record (rotation)"""
+        with open(path, 'rb') as f:
+            header = f.read(24)
+        if len(header) < 24 or header[:4] not in PCAP_MAGIC:
+            return False
+        order, self.resolution = PCAP_MAGIC[header[:4]]
+        self.record = struct.Struct(order + 'IIII')
+        self.linktype = struct.unpack_from(order + 'I', header, 20)[0] & 0x0FFFFFFF
+        self.path = path
+        self.offset = self._complete_end(path) if from_end else 24
+        return True
+
+    def _complete_end(self, path):
+        """Offset just past the last complete record"""
+        size = os.path.getsize(path)
+        offset = 24
+        if size <= offset:
+            return offset
+        with open(path, 'rb') as f:
+            mm = mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ)
+        try:
+            while offset + 16 <= size:
+                captured = self.record.unpack_from(mm, offset)[2]
+                if offset + 16 + captured > size:
+                    break
+                offset += 16 + captured
+        finally:
+            mm.close()
+        return offset
+
+    def _read_new(self):
+        """Decode and dispatch records appended since the last read"""
+        try:
+            size = os.path.getsize(self.path)
+        except OSError:
+            return 0
+        if size < self.offset:
+            self.offset = 24  # file was reused by size rotation
+        if size - self.offset < 16:
+            return 0
+        with open(self.path, 'rb') as f:
+            f.seek(self.offset)
+            chunk = f.read(min(size - self.offset, READ_SIZE))
+        with self.lock:
+            subscriptions = list(self.subscriptions)
+        batches = [[] for _ in subscriptions]
+        position = 0
+        count = 0
+        record = self.record
+        while position + 16 <= len(chunk):
+            seconds, fraction, captured, length = record.unpack_from(chunk, position)
+            end = position + 16 + captured
+            if end > len(chunk):
+                break
+            data = chunk[position + 16:end]
+            packet = decode(data, self.linktype)
+            line = None
+            for subscription, batch in zip(subscriptions, batches):
+                if subscription.wants(packet):
+                    if line is None:
+                        line = summarize(seconds + fraction * self.resolution, data, length,
+                                         self.linktype, packet)
+                    batch.append(line)
+            position = end
+            count += 1
+        for subscription, batch in zip(subscriptions, batches):
+            if batch:
+                subscription.put(batch)
+        self.offset += position
+        self.packets += count
+        return count
+
+    def _newest_file(self):
+        files = self.capture.file_list()
+        return files[-1] if files else None
+
+    def _run(self):
+        last_check = 0
+        while True:
+            if not self.subscriptions and self.on_idle(self):
+                return
+            now = time.monotonic()
+            if self.path is None or now - last_check >= ROTATION_CHECK:
+                last_check = now
+                newest = self._newest_file()
+                if newest is not None and newest != self.path:
+                    if self.path is not None:
+                        self._read_new()  # finish the rotated file
+                    try:
+                        self._open(newest, from_end=self.path is None)
+                    except OSError:
+                        pass
+            if self.path is None or not self._read_new():
+                time.sleep(POLL_INTERVAL)
+
+
+class LiveFeeds:
+    """The running LiveFeed of each capture, started on first subscription"""
+
+    def __init__(self):
+        self.feeds = {}
+        self.lock = threading.Lock()
+
+    def subscribe(self, capture, subscription):
+        with self.lock:
+            feed = self.feeds.get(capture.name)
+            if feed is None or feed.capture is not capture:
+                feed = self.feeds[capture.name] = LiveFeed(capture, self._idle)
+            feed.subscribe(subscription)
+        return feed
+
+    def _idle(self, feed):
+        """Retire a feed unless a subscription arrived meanwhile"""
+        with self.lock, feed.lock:
+            if feed.subscriptions:
+                return False
+            if self.feeds.get(feed.capture.name) is feed:
+                del self.feeds[feed.capture.name]
+            return True
+
+    def unsubscribe(self, feed, subscription):
+        # The feed thread notices it has no subscribers and retires itself
+        feed.unsubscribe(subscription)
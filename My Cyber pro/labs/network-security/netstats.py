@@ -0,0 +1,172 @@
+"""
+Interface statistics for the Network Security Lab
+
+A background thread reads /proc/net/dev every `interval` seconds and keeps
+per-interface rates (bytes, packets, errors and drops per second) in a ring
+of the last `history` samples. Link details come from /sys/class/net and
+addresses from an ioctl and /proc/net/if_inet6, so requests are answered
+from memory without starting `ip` or `ifconfig`.
+"""
+
+from collections import deque
+import fcntl
+import ipaddress
+import os
+import socket
+import struct
+import threading
+import time
+
+PROC_NET_DEV = '/proc/net/dev'
+PROC_IF_INET6 = '/proc/net/if_inet6'
+SYS_CLASS_NET = '/sys/class/net'
+
+SIOCGIFADDR = 0x8915
+SIOCGIFNETMASK = 0x891B
+
+# /proc/net/dev columns that are kept, by position after the interface name
+COUNTERS = {
+    'rx_bytes': 0, 'rx_packets': 1, 'rx_errors': 2, 'rx_dropped': 3,
+    'tx_bytes': 8, 'tx_packets': 9, 'tx_errors': 10, 'tx_dropped': 11
+}
+RATES = tuple(COUNTERS)
+
+
+def read_counters():
+    """{interface: {counter: value}} from /proc/net/dev"""
+    counters = {}
+    with open(PROC_NET_DEV) as f:
+        for line in f.readlines()[2:]:
+            name, _, values = line.partition(':')
+            values = values.split()
+            counters[name.strip()] = {key: int(values[i]) for key, i in COUNTERS.items()}
+    return counters
+
+
+def read_sys(name, attribute):
+    try:
+        with open(os.path.join(SYS_CLASS_NET, name, attribute)) as f:
+            return f.read().strip()
+    except OSError:
+        # speed is unreadable on virtual and down links
+        return None
+
+
+def ipv4_address(sock, name):
+    request = struct.pack('256s', name.encode()[:15])
+    try:
+        address = socket.inet_ntoa(fcntl.ioctl(sock, SIOCGIFADDR, request)[20:24])
+        netmask = socket.inet_ntoa(fcntl.ioctl(sock, SIOCGIFNETMASK, request)[20:24])
+    except OSError:
+        return None
+    return str(ipaddress.ip_interface(f'{address}/{netmask}'))
+
+
+def ipv6_addresses():
+    """{interface: ['addr/prefix', ...]} from /proc/net/if_inet6"""
+    addresses = {}
+    try:
+        with open(PROC_IF_INET6) as f:
+            for line in f:
+                address, _, prefix, _, _, name = line.split()
+                text = str(ipaddress.IPv6Address(bytes.fromhex(address)))
+                addresses.setdefault(name, []).append(f'{text}/{int(prefix, 16)}')
+    except OSError:
+        pass
+    return addresses
+
+
+def link_details(names):
+    """State, MTU, speed, MAC and addresses of each interface"""
+    details = {}
+    ipv6 = ipv6_addresses()
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        for name in names:
+            speed = read_sys(name, 'speed')
+            mtu = read_sys(name, 'mtu')
+            details[name] = {
+                'state': read_sys(name, 'operstate'),
+                'mtu': int(mtu) if mtu else None,
+                'speed_mbps': int(speed) if speed and int(speed) > 0 else None,
+                'mac': read_sys(name, 'address'),
+                'ipv4': ipv4_address(sock, name),
+                'ipv6': ipv6.get(name, [])
+            }
+    return details
+
+
+class NetStats:
+    def __init__(self, interval=1.0, history=300, details_every=10):
+        self.interval = interval
+        self.history_size = history
+        self.details_every = details_every
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.details = {}
+        self.rates = {}
+        self.history = {}
+        self.updated = None
+        self._last = None
+        self._samples = 0
+        self.sample()
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def sample(self):
+        now = time.monotonic()
+        counters = read_counters()
+        details = self.details
+        if self._samples % self.details_every == 0 or set(counters) != set(details):
+            details = link_details(counters)
+
+        rates = {}
+        if self._last is not None:
+            elapsed = now - self._last
+            for name, values in counters.items():
+                previous = self.counters.get(name)
+                if previous is None:
+                    continue
+                # A counter that went backwards means the interface was recreated
+                rates[name] = {key: round(max(values[key] - previous[key], 0) / elapsed, 1) for key in RATES}
+
+        stamp = time.time()
+        with self.lock:
+            self.counters = counters
+            self.details = details
+            self.rates = rates
+            for name, rate in rates.items():
+                ring = self.history.get(name)
+                if ring is None:
+                    ring = self.history[name] = deque(maxlen=self.history_size)
+                ring.append((stamp,) + tuple(rate[key] for key in RATES))
+            for name in list(self.history):
+                if name not in counters:
+                    del self.history[name]
+            self.updated = stamp
+        self._last = now
+        self._samples += 1
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.sample()
+            except (OSError, ValueError):
+                pass
+
+    def interfaces(self):
+        with self.lock:
+            return {
+                name: dict(self.details.get(name, {}), counters=counters, rates=self.rates.get(name))
+                for name, counters in self.counters.items()
+            }
+
+    def interface_history(self, name, seconds=None):
+        """Samples of one interface, oldest first; KeyError if unknown"""
+        with self.lock:
+            if name not in self.counters:
+                raise KeyError(name)
+            samples = list(self.history.get(name, ()))
+        if seconds is not None:
+            cutoff = time.time() - seconds
+            samples = [sample for sample in samples if sample[0] >= cutoff]
+        return {'fields': ('timestamp',) + RATES, 'samples': samples}
@@ -0,0 +1,273 @@
+"""
+Indexed pcap reader for the Network Security Lab
+
+The first request for a file scans its record headers once through mmap
+and stores each packet's offset; later requests only scan bytes appended
+since (tcpdump keeps writing while a capture runs). Any page, including
+the newest packets, is then read directly, and one-line summaries are
+cached, so browsing does not depend on the size of the capture.
+"""
+
+from array import array
+from collections import OrderedDict
+from datetime import datetime
+import mmap
+import os
+import socket
+import struct
+import threading
+
+PCAP_MAGIC = {
+    b'\xd4\xc3\xb2\xa1': ('<', 1e-6),
+    b'\xa1\xb2\xc3\xd4': ('>', 1e-6),
+    b'\x4d\x3c\xb2\xa1': ('<', 1e-9),
+    b'\xa1\xb2\x3c\x4d': ('>', 1e-9),
+}
+
+LINKTYPE_ETHERNET = 1
+LINKTYPE_RAW = 101
+LINKTYPE_LINUX_SLL = 113
+LINKTYPE_LINUX_SLL2 = 276
+
+TCP_FLAGS = ((0x01, 'F'), (0x02, 'S'), (0x04, 'R'), (0x08, 'P'), (0x20, 'U'))
+IP_PROTOCOLS = {1: 'ICMP', 2: 'IGMP', 6: 'TCP', 17: 'UDP', 47: 'GRE', 50: 'ESP', 58: 'ICMP6', 89: 'OSPF'}
+
+SUMMARY_CACHE = 50000
+MAX_INDEXES = 16
+
+
+class PcapFormatError(ValueError):
+    pass
+
+
+def tcp_flags(flags):
+    text = ''.join(name for bit, name in TCP_FLAGS if flags & bit)
+    return f"[{text}{'.' if flags & 0x10 else ''}]"
+
+
+def link_payload(data, linktype):
+    """(ethertype, offset of the network header) or (None, 0)"""
+    if linktype == LINKTYPE_ETHERNET and len(data) >= 14:
+        ethertype, offset = struct.unpack_from('!H', data, 12)[0], 14
+        while ethertype in (0x8100, 0x88A8) and len(data) >= offset + 4:
+            ethertype = struct.unpack_from('!H', data, offset + 2)[0]
+            offset += 4
+        return ethertype, offset
+    if linktype == LINKTYPE_LINUX_SLL and len(data) >= 16:
+        return struct.unpack_from('!H', data, 14)[0], 16
+    if linktype == LINKTYPE_LINUX_SLL2 and len(data) >= 20:
+        return struct.unpack_from('!H', data, 0)[0], 20
+    if linktype == LINKTYPE_RAW and data:
+        return (0x0800 if data[0] >> 4 == 4 else 0x86DD), 0
+    return None, 0
+
+
+def decode_transport(packet, data, offset):
+    protocol = packet['protocol']
+    if protocol in (6, 17) and len(data) >= offset + 4:
+        packet['sport'], packet['dport'] = struct.unpack_from('!HH', data, offset)
+        if protocol == 6 and len(data) >= offset + 14:
+            packet['flags'] = data[offset + 13]
+    elif protocol in (1, 58) and len(data) >= offset + 2:
+        packet['icmp'] = (data[offset], data[offset + 1])
+
+
+def decode(data, linktype):
+    """Addresses, protocol and ports of a packet, None where absent"""
+    ethertype, offset = link_payload(data, linktype)
+    packet = {'ethertype': ethertype, 'family': None, 'src': None, 'dst': None,
+              'protocol': None, 'sport': None, 'dport': None}
+    if ethertype == 0x0800 and len(data) >= offset + 20:
+        packet['family'] = 'ip'
+        packet['protocol'] = data[offset + 9]
+        packet['src'] = socket.inet_ntoa(data[offset + 12:offset + 16])
+        packet['dst'] = socket.inet_ntoa(data[offset + 16:offset + 20])
+        packet['fragment'] = struct.unpack_from('!H', data, offset + 6)[0] & 0x1FFF
+        if not packet['fragment']:
+            decode_transport(packet, data, offset + (data[offset] & 0x0F) * 4)
+    elif ethertype == 0x86DD and len(data) >= offset + 40:
+        packet['family'] = 'ip6'
+        packet['protocol'] = data[offset + 6]
+        packet['src'] = socket.inet_ntop(socket.AF_INET6, data[offset + 8:offset + 24])
+        packet['dst'] = socket.inet_ntop(socket.AF_INET6, data[offset + 24:offset + 40])
+        decode_transport(packet, data, offset + 40)
+    elif ethertype == 0x0806 and len(data) >= offset + 28:
+        packet['family'] = 'arp'
+        packet['operation'] = struct.unpack_from('!H', data, offset + 6)[0]
+        packet['mac'] = data[offset + 8:offset + 14].hex(':')
+        packet['src'] = socket.inet_ntoa(data[offset + 14:offset + 18])
+        packet['dst'] = socket.inet_ntoa(data[offset + 24:offset + 28])
+    return packet
+
+
+def transport_summary(packet):
+    protocol, src, dst = packet['protocol'], packet['src'], packet['dst']
+    if 'flags' in packet:
+        return f"{src}.{packet['sport']} > {dst}.{packet['dport']}: TCP {tcp_flags(packet['flags'])}"
+    if protocol == 17 and packet['sport'] is not None:
+        return f"{src}.{packet['sport']} > {dst}.{packet['dport']}: UDP"
+    if 'icmp' in packet:
+        return f"{src} > {dst}: {IP_PROTOCOLS[protocol]} type {packet['icmp'][0]} code {packet['icmp'][1]}"
+    return f"{src} > {dst}: {IP_PROTOCOLS.get(protocol, f'proto {protocol}')}"
+
+
+def summarize(timestamp, data, length, linktype, packet=None):
+    """tcpdump-style one-line summary of a packet, optionally already decoded"""
+    when = datetime.fromtimestamp(timestamp).strftime('%H:%M:%S.%f')
+    if packet is None:
+        packet = decode(data, linktype)
+    family = packet['family']
+    if family == 'ip' and packet['fragment']:
+        text = f"IP {packet['src']} > {packet['dst']}: fragment offset {packet['fragment'] * 8}"
+    elif family == 'ip':
+        text = 'IP ' + transport_summary(packet)
+    elif family == 'ip6':
+        text = 'IP6 ' + transport_summary(packet)
+    elif family == 'arp' and packet['operation'] == 1:
+        text = f"ARP, Request who-has {packet['dst']} tell {packet['src']}"
+    elif family == 'arp':
+        text = f"ARP, Reply {packet['src']} is-at {packet['mac']}"
+    elif packet['ethertype'] is None:
+        text = f"link type {linktype}"
+    else:
+        text = f"ethertype 0x{packet['ethertype']:04x}"
+    return f"{when} {text}, length {length}"
+
+
+class PcapIndex:
+    """Packet offsets of one classic pcap file, extended as the file grows"""
+
+    def __init__(self, path):
+        self.path = path
+        stat = os.stat(path)
+        self.inode = stat.st_ino
+        self.mtime = stat.st_mtime_ns
+        self.ctime = stat.st_ctime_ns
+        # Header of the first record, to notice the file being rewritten in place
+        self.first_record = None
+        self.offsets = array('Q')
+        self.scanned = 0
+        self.order = None
+        self.resolution = None
+        self.linktype = None
+        self.summaries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def refresh(self):
+        """Index records appended since the last call; returns the packet count"""
+        with self.lock:
+            stat = os.stat(self.path)
+            size = stat.st_size
+            self.mtime = stat.st_mtime_ns
+            self.ctime = stat.st_ctime_ns
+            if size <= self.scanned:
+                return len(self.offsets)
+            with open(self.path, 'rb') as f:
+                mm = mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ)
+            try:
+                if self.order is None:
+                    self._read_header(mm)
+                record = struct.Struct(self.order + 'IIII')
+                offset = self.scanned
+                append = self.offsets.append
+                while offset + 16 <= size:
+                    captured = record.unpack_from(mm, offset)[2]
+                    if offset + 16 + captured > size:
+                        break  # record still being written
+                    append(offset)
+                    offset += 16 + captured
+                self.scanned = offset
+                if self.first_record is None and self.offsets:
+                    self.first_record = mm[24:40]
+            finally:
+                mm.close()
+            return len(self.offsets)
+
+    def _read_header(self, mm):
+        if len(mm) < 24:
+            raise PcapFormatError('file too short for a pcap header')
+        magic = mm[:4]
+        if magic not in PCAP_MAGIC:
+            raise PcapFormatError('not a pcap file (pcapng is not supported)')
+        self.order, self.resolution = PCAP_MAGIC[magic]
+        self.linktype = struct.unpack_from(self.order + 'I', mm, 20)[0] & 0x0FFFFFFF
+        self.scanned = 24
+
+    def stale(self, stat):
+        """
+        True when path no longer holds the indexed file: replaced, shrunk,
+        its times moved backwards, or rewritten in place (tcpdump -C/-W
+        truncates and reuses the same inode).
+        """
+        if stat.st_ino != self.inode or stat.st_size < self.scanned:
+            return True
+        if stat.st_mtime_ns < self.mtime or stat.st_ctime_ns < self.ctime:
+            return True
+        if self.first_record is None:
+            return False
+        with open(self.path, 'rb') as f:
+            f.seek(24)
+            return f.read(16) != self.first_record
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def summaries_for(self, start, stop):
+        """Summaries of packets start..stop-1"""
+        lines = []
+        missing = [i for i in range(start, stop) if i not in self.summaries]
+        if missing:
+            with open(self.path, 'rb') as f:
+                mm = mmap.mmap(f.fileno(), self.scanned, access=mmap.ACCESS_READ)
+            try:
+                record = struct.Struct(self.order + 'IIII')
+                for i in missing:
+                    offset = self.offsets[i]
+                    seconds, fraction, captured, length = record.unpack_from(mm, offset)
+                    data = mm[offset + 16:offset + 16 + captured]
+                    self.summaries[i] = summarize(seconds + fraction * self.resolution, data,
+                                                  length, self.linktype)
+            finally:
+                mm.close()
+        for i in range(start, stop):
+            lines.append(self.summaries[i])
+            self.summaries.move_to_end(i)
+        while len(self.summaries) > SUMMARY_CACHE:
+            self.summaries.popitem(last=False)
+        return lines
+
+
+class PcapIndexCache:
+    """One PcapIndex per file, rebuilt when a file is replaced, truncated or reused"""
+
+    def __init__(self):
+        self.indexes = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, path):
+        stat = os.stat(path)
+        with self.lock:
+            index = self.indexes.get(path)
+            if index is None or index.stale(stat):
+                index = PcapIndex(path)
+                self.indexes[path] = index
+            self.indexes.move_to_end(path)
+            while len(self.indexes) > MAX_INDEXES:
+                self.indexes.popitem(last=False)
+        index.refresh()
+        return index
+
+    def page(self, path, offset=None, limit=50):
+        """
+        Summaries of up to `limit` packets from `offset`, or the newest
+        `limit` packets when offset is None.
+        """
+        index = self.get(path)
+        total = len(index)
+        if offset is None:
+            offset = max(total - limit, 0)
+        offset = min(max(offset, 0), total)
+        stop = min(offset + limit, total)
+        with index.lock:
+            lines = index.summaries_for(offset, stop)
+        return {'total': total, 'offset': offset, 'count': stop - offset, 'packets': lines}
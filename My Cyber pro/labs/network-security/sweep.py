@@ -0,0 +1,261 @@
+"""
+Host sweep for the Network Security Lab
+
+Probes every address of a subnet concurrently on one asyncio loop: an ICMP
+echo and a TCP connect to each port. One ICMP socket is shared by all
+probes (an unprivileged datagram socket where ping_group_range allows it,
+a raw socket otherwise) and replies are matched to waiting probes by
+address and sequence number. At most `concurrency` hosts are in flight and
+each is given `timeout` seconds, so a /24 takes a few seconds however many
+hosts are down. Open TCP sockets are also capped at half the process's file
+descriptor limit, so a wide sweep waits for sockets instead of failing with
+EMFILE. Results are yielded as each host finishes.
+"""
+
+import asyncio
+import ipaddress
+import os
+import queue
+import resource
+import socket
+import struct
+import threading
+import time
+
+DEFAULT_PORTS = (22, 80, 443, 502)
+MAX_HOSTS = 4096
+MAX_PORTS = 32
+MAX_CONCURRENCY = 512
+
+ICMP_ECHO_REQUEST = 8
+ICMP_ECHO_REPLY = 0
+ICMP_HEADER = struct.Struct('!BBHHH')
+PAYLOAD = b'network-security-lab-sweep'
+
+
+class SweepError(ValueError):
+    pass
+
+
+def sweep_hosts(cidr):
+    """Addresses to probe; a bare address sweeps just that host"""
+    try:
+        network = ipaddress.ip_network(cidr.strip(), strict=False)
+    except ValueError:
+        raise SweepError(f'Invalid network: {cidr}')
+    if network.version != 4:
+        raise SweepError('Only IPv4 networks can be swept')
+    if network.num_addresses > MAX_HOSTS:
+        raise SweepError(f'At most {MAX_HOSTS} addresses per sweep (a /20)')
+    if network.num_addresses <= 2:
+        return [str(address) for address in network]
+    return [str(address) for address in network.hosts()]
+
+
+def parse_ports(text):
+    if text is None:
+        return list(DEFAULT_PORTS)
+    try:
+        ports = sorted({int(port) for port in text.split(',') if port.strip()})
+    except ValueError:
+        raise SweepError('ports must be a comma-separated list of numbers')
+    if any(not 0 < port < 65536 for port in ports):
+        raise SweepError('ports must be between 1 and 65535')
+    if len(ports) > MAX_PORTS:
+        raise SweepError(f'At most {MAX_PORTS} ports per sweep')
+    return ports
+
+
+def checksum(data):
+    if len(data) % 2:
+        data += b'\0'
+    total = sum(struct.unpack(f'!{len(data) // 2}H', data))
+    total = (total >> 16) + (total & 0xFFFF)
+    total += total >> 16
+    return ~total & 0xFFFF
+
+
+class IcmpProber:
+    """Echo requests over one shared socket, replies dispatched by (address, seq)"""
+
+    def __init__(self, loop):
+        self.loop = loop
+        try:
+            self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_ICMP)
+            self.mode = 'datagram'
+        except OSError:
+            # Needs root or CAP_NET_RAW; the caller falls back to TCP only
+            self.sock = socket.socket(socket.AF_INET, socket.SOCK_RAW, socket.IPPROTO_ICMP)
+            self.mode = 'raw'
+        self.sock.setblocking(False)
+        # Datagram sockets get the identifier from the kernel and only see their own replies
+        self.ident = os.getpid() & 0xFFFF
+        self.seq = 0
+        self.pending = {}
+        loop.add_reader(self.sock.fileno(), self._read)
+
+    def close(self):
+        self.loop.remove_reader(self.sock.fileno())
+        self.sock.close()
+
+    async def probe(self, address, timeout):
+        """Round-trip time in ms, or None without a reply"""
+        self.seq = (self.seq + 1) & 0xFFFF
+        seq = self.seq
+        header = ICMP_HEADER.pack(ICMP_ECHO_REQUEST, 0, 0, self.ident, seq)
+        packet = ICMP_HEADER.pack(ICMP_ECHO_REQUEST, 0, checksum(header + PAYLOAD), self.ident, seq) + PAYLOAD
+        future = self.loop.create_future()
+        self.pending[(address, seq)] = future
+        sent = time.monotonic()
+        try:
+            self.sock.sendto(packet, (address, 0))
+            await asyncio.wait_for(future, timeout)
+            return round((time.monotonic() - sent) * 1000, 2)
+        except (asyncio.TimeoutError, OSError):
+            return None
+        finally:
+            self.pending.pop((address, seq), None)
+
+    def _read(self):
+        while True:
+            try:
+                data, (address, _) = self.sock.recvfrom(2048)
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError:
+                return
+            if self.mode == 'raw':
+                data = data[(data[0] & 0x0F) * 4:]
+            if len(data) < ICMP_HEADER.size or data[0] != ICMP_ECHO_REPLY:
+                continue
+            ident, seq = ICMP_HEADER.unpack_from(data)[3:]
+            if self.mode == 'raw' and ident != self.ident:
+                continue  # another process's ping
+            future = self.pending.get((address, seq))
+            if future is not None and not future.done():
+                future.set_result(None)
+
+
+def socket_limit():
+    """TCP sockets a sweep may hold open: half the descriptor limit, leaving the rest to the server"""
+    soft, _ = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft == resource.RLIM_INFINITY:
+        return MAX_CONCURRENCY * MAX_PORTS
+    return max(soft // 2, 1)
+
+
+async def tcp_probe(loop, sockets, address, port, timeout):
+    """
+    ('open' | 'closed', rtt ms) when the host answered, (None, None) when it
+    did not, ('error', message) when no socket could be opened
+    """
+    async with sockets:
+        try:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        except OSError as e:
+            return 'error', str(e)
+        started = time.monotonic()
+        try:
+            sock.setblocking(False)
+            await asyncio.wait_for(loop.sock_connect(sock, (address, port)), timeout)
+            state = 'open'
+        except ConnectionRefusedError:
+            state = 'closed'
+        except (asyncio.TimeoutError, OSError):
+            return None, None
+        finally:
+            sock.close()
+    return state, round((time.monotonic() - started) * 1000, 2)
+
+
+async def probe_host(loop, prober, sockets, address, ports, timeout):
+    probes = [tcp_probe(loop, sockets, address, port, timeout) for port in ports]
+    if prober is not None:
+        probes.append(prober.probe(address, timeout))
+    results = await asyncio.gather(*probes)
+    icmp_rtt = results.pop() if prober is not None else None
+    open_ports = [port for port, (state, _) in zip(ports, results) if state == 'open']
+    closed_ports = [port for port, (state, _) in zip(ports, results) if state == 'closed']
+    errors = [message for state, message in results if state == 'error']
+    rtts = [rtt for state, rtt in results if state in ('open', 'closed')]
+    if icmp_rtt is not None:
+        rtts.append(icmp_rtt)
+    result = {
+        'host': address,
+        'up': bool(rtts),
+        'rtt_ms': min(rtts) if rtts else None,
+        'icmp': icmp_rtt is not None,
+        'open': open_ports,
+        'closed': closed_ports
+    }
+    if errors:
+        # Ports that could not be probed; the host may still be up
+        result['error'] = errors[0]
+    return result
+
+
+async def sweep(hosts, ports, timeout, concurrency, icmp, emit, stop):
+    """Probe hosts with `concurrency` workers, calling emit(result) per host"""
+    loop = asyncio.get_running_loop()
+    prober = None
+    icmp_mode = 'disabled'
+    if icmp:
+        try:
+            prober = IcmpProber(loop)
+            icmp_mode = prober.mode
+        except OSError:
+            icmp_mode = 'unavailable'
+
+    pending = iter(hosts)
+    sockets = asyncio.Semaphore(socket_limit())
+    counts = {'hosts': 0, 'up': 0}
+
+    async def worker():
+        for address in pending:
+            if stop.is_set():
+                return
+            result = await probe_host(loop, prober, sockets, address, ports, timeout)
+            counts['hosts'] += 1
+            counts['up'] += result['up']
+            emit(result)
+
+    started = time.monotonic()
+    try:
+        await asyncio.gather(*(worker() for _ in range(min(concurrency, len(hosts)))))
+    finally:
+        if prober is not None:
+            prober.close()
+    return {
+        'done': True,
+        'hosts': counts['hosts'],
+        'up': counts['up'],
+        'ports': ports,
+        'icmp': icmp_mode,
+        'elapsed': round(time.monotonic() - started, 2)
+    }
+
+
+def run_sweep(hosts, ports=DEFAULT_PORTS, timeout=1.0, concurrency=128, icmp=True):
+    """
+    Generator of per-host results followed by a summary with 'done': True.
+    The sweep runs on its own event loop thread; closing the generator
+    (a client disconnecting) stops it after the hosts in flight.
+    """
+    results = queue.Queue()
+    stop = threading.Event()
+
+    def run():
+        try:
+            results.put(asyncio.run(sweep(hosts, list(ports), timeout, concurrency, icmp, results.put, stop)))
+        except Exception as e:
+            results.put({'done': True, 'error': str(e)})
+
+    threading.Thread(target=run, daemon=True).start()
+    try:
+        while True:
+            result = results.get()
+            yield result
+            if result.get('done'):
+                return
+    finally:
+        stop.set()
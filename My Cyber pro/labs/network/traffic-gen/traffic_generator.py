@@ -2,133 +2,469 @@
 """
 Network Traffic Generator
 Generates various types of network traffic for monitoring and analysis
+
+Traffic comes from profiles in the lab's config.json (`traffic_profiles`).
+A profile is a set of flows, each with a packet type, targets (addresses or
+networks), a rate in packets per second and an inter-arrival distribution,
+plus an optional time-of-day curve scaling every rate. One scheduler keeps
+the next send time of every flow in a heap and sends whatever is due, so
+hundreds of flows need no extra threads, and a profile seed makes a run
+reproducible.
+
+Each flow's packet is built with scapy and serialized once into a frame
+template. Per send only the varying fields (destination, source port,
+sequence number, transaction ids, ARP target) are patched in place, with
+checksums adjusted incrementally, and frames go out in batches through a
+raw IP socket (or a packet socket for layer 2 frames), optionally capped by
+token buckets for packets and bits per second.
 """
 
 from scapy.all import *
+import argparse
+from bisect import bisect_right
+import heapq
+import ipaddress
+import json
+import os
+import socket
+import struct
 import time
 import random
 import threading
 
+DEFAULT_CONFIG = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'config.json')
+MODBUS_READ_HOLDING_REGISTERS = 3
+MAX_TARGETS = 65536
+# How often a flow whose rate is currently zero checks the curve again
+IDLE_RECHECK = 1.0
+# A flow more than this far behind schedule skips ahead instead of bursting
+MAX_LAG = 1.0
+
+
+def adjust_checksum(checksum, old, new):
+    """RFC 1624 incremental update of a ones' complement checksum for one changed 16-bit word"""
+    total = (~checksum & 0xFFFF) + (~old & 0xFFFF) + new
+    total = (total & 0xFFFF) + (total >> 16)
+    total = (total & 0xFFFF) + (total >> 16)
+    return ~total & 0xFFFF
+
+
+class FrameTemplate:
+    """A packet serialized once; varying fields are rewritten in place for each send"""
+
+    def __init__(self, name, packet):
+        self.name = name
+        self.link = Ether in packet
+        self.frame = bytearray(bytes(packet))
+        self.destination = packet[IP].dst if IP in packet else None
+        self.destinations = None
+        self.ip_offset = 14 if self.link else 0
+        # (offset, 16-bit words, checksum offset or None, value for the nth send)
+        self.patches = []
+        self.count = 0
+
+    @property
+    def l4_offset(self):
+        return self.ip_offset + (self.frame[self.ip_offset] & 0x0F) * 4
+
+    def vary(self, offset, words, checksum, value):
+        self.patches.append((offset, words, checksum, value))
+        return self
+
+    def cycle_destinations(self, addresses, checksum):
+        """Send to each address in turn; checksum is the layer 4 checksum covering the pseudo-header"""
+        self.destinations = addresses
+        values = [struct.unpack('!I', socket.inet_aton(address))[0] for address in addresses]
+        return self.vary(self.ip_offset + 16, 2, checksum, lambda n: values[n % len(values)])
+
+    def next_frame(self):
+        """Patch the template for its next send and return it"""
+        frame = self.frame
+        n = self.count
+        self.count += 1
+        if self.destinations:
+            self.destination = self.destinations[n % len(self.destinations)]
+        for offset, words, checksum, value in self.patches:
+            value = value(n)
+            for word in range(words - 1, -1, -1):
+                position = offset + 2 * word
+                old = struct.unpack_from('!H', frame, position)[0]
+                new = value & 0xFFFF
+                value >>= 16
+                if old == new:
+                    continue
+                struct.pack_into('!H', frame, position, new)
+                if checksum is not None:
+                    struct.pack_into('!H', frame, checksum,
+                                     adjust_checksum(struct.unpack_from('!H', frame, checksum)[0], old, new))
+        return frame
+
+
+def source_port(n):
+    return 1024 + n % 64000
+
+
+def sequence(n):
+    return (n * 2654435761) & 0xFFFFFFFF
+
+
+def transaction_id(n):
+    return n & 0xFFFF
+
+
+def expand_targets(targets):
+    """Addresses of a list of addresses and networks"""
+    addresses = []
+    for target in targets:
+        network = ipaddress.ip_network(target, strict=False)
+        hosts = network if network.num_addresses <= 2 else network.hosts()
+        addresses.extend(str(address) for address in hosts)
+        if len(addresses) > MAX_TARGETS:
+            raise ValueError(f'more than {MAX_TARGETS} targets')
+    if not addresses:
+        raise ValueError('no targets')
+    return addresses
+
+
+def ip_layer(flow, target):
+    return IP(src=flow['source'], dst=target) if flow.get('source') else IP(dst=target)
+
+
+def dns_templates(name, flow, targets):
+    """One template per domain, each cycling through the resolvers"""
+    templates = []
+    for domain in flow.get('domains', ['example.com']):
+        packet = ip_layer(flow, targets[0])/UDP(sport=1024, dport=53)/DNS(rd=1, qd=DNSQR(qname=domain))
+        template = FrameTemplate(f'{name} {domain}', packet)
+        l4 = template.l4_offset
+        template.cycle_destinations(targets, l4 + 6)
+        template.vary(l4, 1, l4 + 6, source_port).vary(l4 + 8, 1, l4 + 6, transaction_id)
+        templates.append(template)
+    return templates
+
+
+def syn_templates(name, flow, targets):
+    """TCP connection attempts to one port"""
+    packet = ip_layer(flow, targets[0])/TCP(sport=1024, dport=flow.get('port', 80), flags="S")
+    template = FrameTemplate(name, packet)
+    l4 = template.l4_offset
+    template.cycle_destinations(targets, l4 + 16)
+    template.vary(l4, 1, l4 + 16, source_port).vary(l4 + 4, 2, l4 + 16, sequence)
+    return [template]
+
+
+def modbus_templates(name, flow, targets):
+    """Modbus/TCP requests (read holding registers by default)"""
+    request = struct.pack('!HHHBBHH', 0, 0, 6, flow.get('unit', 1),
+                          flow.get('function', MODBUS_READ_HOLDING_REGISTERS),
+                          flow.get('address', 0), flow.get('count', 10))
+    packet = ip_layer(flow, targets[0])/TCP(sport=1024, dport=flow.get('port', 502), flags="PA")/Raw(request)
+    template = FrameTemplate(name, packet)
+    l4 = template.l4_offset
+    payload = l4 + (template.frame[l4 + 12] >> 4) * 4
+    template.cycle_destinations(targets, l4 + 16)
+    template.vary(l4, 1, l4 + 16, source_port).vary(l4 + 4, 2, l4 + 16, sequence)
+    template.vary(payload, 1, l4 + 16, transaction_id)
+    return [template]
+
+
+def icmp_templates(name, flow, targets):
+    """Echo requests"""
+    template = FrameTemplate(name, ip_layer(flow, targets[0])/ICMP())
+    l4 = template.l4_offset
+    # The ICMP checksum does not cover the IP addresses
+    template.cycle_destinations(targets, None)
+    template.vary(l4 + 4, 1, l4 + 2, transaction_id).vary(l4 + 6, 1, l4 + 2, transaction_id)
+    return [template]
+
+
+def arp_templates(name, flow, targets):
+    """Broadcast who-has requests for each target in turn"""
+    template = FrameTemplate(name, Ether(dst="ff:ff:ff:ff:ff:ff")/ARP(pdst=targets[0]))
+    values = [struct.unpack('!I', socket.inet_aton(target))[0] for target in targets]
+    return [template.vary(14 + 24, 2, None, lambda n: values[n % len(values)])]
+
+
+FLOW_TYPES = {
+    'dns': dns_templates,
+    'syn': syn_templates,
+    'modbus': modbus_templates,
+    'icmp': icmp_templates,
+    'arp': arp_templates
+}
+
+ARRIVALS = ('constant', 'poisson', 'uniform')
+
+
+class Flow:
+    """One stream of packets: its templates, rate and inter-arrival distribution"""
+
+    def __init__(self, name, templates, rate, arrival='poisson', seed=None):
+        if arrival not in ARRIVALS:
+            raise ValueError(f"arrival must be one of {', '.join(ARRIVALS)}")
+        self.name = name
+        self.templates = templates
+        self.rate = rate
+        self.arrival = arrival
+        self.random = random.Random(seed)
+        self.count = 0
+        self.sent = 0
+        self.bytes = 0
+
+    def interval(self, factor):
+        """Seconds until the next packet at the current curve factor"""
+        rate = self.rate * factor
+        if rate <= 0:
+            return IDLE_RECHECK
+        if self.arrival == 'constant':
+            return 1 / rate
+        if self.arrival == 'poisson':
+            return self.random.expovariate(rate)
+        return self.random.uniform(0, 2 / rate)
+
+    def next_template(self):
+        template = self.templates[self.count % len(self.templates)]
+        self.count += 1
+        return template
+
+
+class DayCurve:
+    """Piecewise-linear rate factor over the hours of a day"""
+
+    def __init__(self, points=None, start_hour=None, time_scale=1.0):
+        points = sorted(points or [[0, 1.0]])
+        # Wrap around midnight so interpolation works at both ends
+        self.hours = [hour - 24 for hour, _ in points[-1:]] + [hour for hour, _ in points] + [points[0][0] + 24]
+        self.factors = [points[-1][1]] + [factor for _, factor in points] + [points[0][1]]
+        if start_hour is None:
+            now = time.localtime()
+            start_hour = now.tm_hour + now.tm_min / 60 + now.tm_sec / 3600
+        self.start_hour = start_hour
+        self.time_scale = time_scale
+        self.started = time.monotonic()
+
+    def hour(self, now):
+        return (self.start_hour + (now - self.started) * self.time_scale / 3600) % 24
+
+    def factor(self, now):
+        hour = self.hour(now)
+        i = bisect_right(self.hours, hour) - 1
+        span = self.hours[i + 1] - self.hours[i]
+        weight = (hour - self.hours[i]) / span if span else 0
+        return self.factors[i] + (self.factors[i + 1] - self.factors[i]) * weight
+
+
+def load_profile(path, name):
+    with open(path) as f:
+        profiles = json.load(f).get('traffic_profiles', {})
+    if name not in profiles:
+        raise ValueError(f"No traffic profile '{name}' in {path} (have: {', '.join(profiles) or 'none'})")
+    return profiles[name]
+
+
+def build_flows(profile, rate_scale=1.0):
+    seed = profile.get('seed')
+    flows = []
+    for i, flow in enumerate(profile['flows']):
+        name = flow.get('name', f"{flow['type']}-{i}")
+        if flow['type'] not in FLOW_TYPES:
+            raise ValueError(f"flow {name}: unknown type {flow['type']!r} (use {', '.join(FLOW_TYPES)})")
+        try:
+            targets = expand_targets(flow['targets'])
+        except (KeyError, ValueError) as e:
+            raise ValueError(f'flow {name}: invalid targets ({e})')
+        templates = FLOW_TYPES[flow['type']](name, flow, targets)
+        flows.append(Flow(name, templates, float(flow['rate']) * rate_scale, flow.get('arrival', 'poisson'),
+                          None if seed is None else seed + i))
+    return flows
+
+
+class TokenBucket:
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def consume(self, amount):
+        """Take amount tokens, sleeping off any deficit"""
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= amount
+        if self.tokens < 0:
+            time.sleep(-self.tokens / self.rate)
+
+
+class SendEngine:
+    """
+    Sends every flow on its own schedule from one heap of next-send times,
+    in batches of whatever is due, optionally capped in packet and bit rate.
+    """
+
+    def __init__(self, flows, curve=None, pps=None, mbps=None, batch=32, iface=None):
+        self.flows = flows
+        self.curve = curve or DayCurve()
+        self.batch = batch
+        self.iface = iface or conf.iface
+        self.packet_bucket = TokenBucket(pps, batch) if pps else None
+        self.bit_bucket = TokenBucket(mbps * 1e6, batch * 1514 * 8) if mbps else None
+        self.sent = 0
+        self.bytes = 0
+        self.errors = 0
+        self.late = 0
+        self.last_error = None
+        self.running = False
+        self.ip_socket = None
+        self.link_socket = None
+
+    def templates(self):
+        return [template for flow in self.flows for template in flow.templates]
+
+    def open(self):
+        if any(not template.link for template in self.templates()):
+            # IPPROTO_RAW implies IP_HDRINCL; the kernel fills in the IP checksum
+            self.ip_socket = socket.socket(socket.AF_INET, socket.SOCK_RAW, socket.IPPROTO_RAW)
+        if any(template.link for template in self.templates()):
+            self.link_socket = socket.socket(socket.AF_PACKET, socket.SOCK_RAW)
+            self.link_socket.bind((str(self.iface), 0))
+
+    def run(self):
+        self.running = True
+        ip_send = self.ip_socket.sendto if self.ip_socket else None
+        link_send = self.link_socket.send if self.link_socket else None
+        now = time.monotonic()
+        factor = self.curve.factor(now)
+        # (next send time, index, flow); the index breaks ties deterministically
+        heap = [(now + flow.interval(factor), i, flow) for i, flow in enumerate(self.flows)]
+        heapq.heapify(heap)
+        while self.running and heap:
+            now = time.monotonic()
+            factor = self.curve.factor(now)
+            due = []
+            while heap[0][0] <= now and len(due) < self.batch:
+                when, i, flow = heap[0]
+                if now - when > MAX_LAG:
+                    self.late += 1
+                    when = now
+                heapq.heapreplace(heap, (when + flow.interval(factor), i, flow))
+                if flow.rate * factor > 0:
+                    due.append(flow)
+            if not due:
+                time.sleep(min(max(heap[0][0] - time.monotonic(), 0), 0.1))
+                continue
+
+            if self.packet_bucket:
+                self.packet_bucket.consume(len(due))
+            sent = sent_bytes = 0
+            for flow in due:
+                template = flow.next_template()
+                frame = template.next_frame()
+                try:
+                    if template.link:
+                        link_send(frame)
+                    else:
+                        ip_send(frame, (template.destination, 0))
+                except OSError as e:
+                    self.errors += 1
+                    self.last_error = str(e)
+                    continue
+                flow.sent += 1
+                flow.bytes += len(frame)
+                sent += 1
+                sent_bytes += len(frame)
+            self.sent += sent
+            self.bytes += sent_bytes
+            if self.bit_bucket:
+                self.bit_bucket.consume(sent_bytes * 8)
+
+    def stop(self):
+        self.running = False
+
+
 class TrafficGenerator:
-    def __init__(self):
+    def __init__(self, profile_name, profile, pps=None, mbps=None, batch=32, iface=None, rate_scale=1.0):
         self.running = False
         self.packet_count = 0
-        
-    def generate_http_traffic(self):
-        """Generate simulated HTTP traffic"""
-        domains = [
-            'example.com',
-            'test-server.local',
-            'api.industrial.local',
-            'scada.control.local',
-            'plc.network.local'
-        ]
-        
-        while self.running:
-            try:
-                domain = random.choice(domains)
-                # Simulate DNS query
-                dns_query = IP(dst="8.8.8.8")/UDP(dport=53)/DNS(rd=1, qd=DNSQR(qname=domain))
-                
-                # Simulate HTTP request
-                http_request = IP(dst="192.168.1.100")/TCP(dport=80, flags="S")
-                
-                self.packet_count += 2
-                
-                time.sleep(random.uniform(1, 5))
-            except Exception as e:
-                print(f"HTTP traffic error: {e}")
-                time.sleep(5)
-    
-    def generate_modbus_traffic(self):
-        """Generate simulated Modbus/TCP traffic"""
-        while self.running:
-            try:
-                # Simulate Modbus read holding registers
-                modbus_packet = IP(dst="192.168.1.50")/TCP(dport=502)
-                
-                self.packet_count += 1
-                
-                time.sleep(random.uniform(2, 4))
-            except Exception as e:
-                print(f"Modbus traffic error: {e}")
-                time.sleep(5)
-    
-    def generate_icmp_traffic(self):
-        """Generate ICMP ping traffic"""
-        targets = [
-            '192.168.1.1',
-            '192.168.1.10',
-            '192.168.1.50',
-            '192.168.1.100'
-        ]
-        
-        while self.running:
-            try:
-                target = random.choice(targets)
-                icmp_packet = IP(dst=target)/ICMP()
-                
-                self.packet_count += 1
-                
-                time.sleep(random.uniform(3, 8))
-            except Exception as e:
-                print(f"ICMP traffic error: {e}")
-                time.sleep(5)
-    
-    def generate_broadcast_traffic(self):
-        """Generate broadcast/multicast traffic"""
-        while self.running:
-            try:
-                # Simulate ARP broadcast
-                arp_packet = Ether(dst="ff:ff:ff:ff:ff:ff")/ARP(pdst="192.168.1.0/24")
-                
-                self.packet_count += 1
-                
-                time.sleep(random.uniform(10, 20))
-            except Exception as e:
-                print(f"Broadcast traffic error: {e}")
-                time.sleep(5)
-    
+        self.profile_name = profile_name
+        self.profile = profile
+        self.pps = pps
+        self.mbps = mbps
+        self.batch = batch
+        self.iface = iface
+        self.rate_scale = rate_scale
+        self.engine = None
+
     def print_stats(self):
-        """Print traffic statistics"""
+        """Print achieved rates, overall and per flow"""
+        engine = self.engine
+        last_time = time.monotonic()
+        last_sent, last_bytes = 0, 0
+        last_flows = {flow.name: 0 for flow in engine.flows}
         while self.running:
-            print(f"\n📊 Traffic Statistics:")
-            print(f"   Total Packets Generated: {self.packet_count}")
-            print(f"   Rate: ~{self.packet_count / max(1, int(time.time() - self.start_time)):.2f} packets/sec")
-            print("-" * 50)
             time.sleep(10)
-    
+            now = time.monotonic()
+            elapsed = now - last_time
+            sent, sent_bytes = engine.sent, engine.bytes
+            self.packet_count = sent
+            caps = [f"{self.pps} pps" if self.pps else None, f"{self.mbps} Mbps" if self.mbps else None]
+            caps = ', '.join(cap for cap in caps if cap) or 'none'
+            print(f"\n📊 Traffic Statistics ({self.profile_name}, clock {engine.curve.hour(now):05.2f}h, "
+                  f"rate x{engine.curve.factor(now):.2f}):")
+            print(f"   Total Packets Sent: {sent}")
+            print(f"   Rate: {(sent - last_sent) / elapsed:.0f} packets/sec, "
+                  f"{(sent_bytes - last_bytes) * 8 / elapsed / 1e6:.2f} Mbps (cap {caps})")
+            for flow in engine.flows:
+                print(f"   {flow.name:<24} {(flow.sent - last_flows[flow.name]) / elapsed:10.1f} pps")
+                last_flows[flow.name] = flow.sent
+            if engine.errors:
+                print(f"   Send Errors: {engine.errors} (last: {engine.last_error})")
+            if engine.late:
+                print(f"   Fell behind schedule {engine.late} times")
+            print("-" * 50)
+            last_time, last_sent, last_bytes = now, sent, sent_bytes
+
     def run(self):
         """Start traffic generation"""
         self.running = True
         self.start_time = time.time()
-        
+
         print("""
     ╔════════════════════════════════════════╗
     ║   Network Traffic Generator v1.0       ║
     ║   Simulating Industrial Network        ║
     ╚════════════════════════════════════════╝
         """)
-        
-        print("🌐 Starting traffic generation...")
-        print("   - HTTP/HTTPS traffic")
-        print("   - Modbus/TCP traffic")
-        print("   - ICMP ping traffic")
-        print("   - Broadcast traffic")
+
+        try:
+            flows = build_flows(self.profile, self.rate_scale)
+        except (KeyError, ValueError) as e:
+            print(f"✗ Invalid profile {self.profile_name}: {e}")
+            return
+        curve = DayCurve(self.profile.get('curve'), self.profile.get('start_hour'),
+                         self.profile.get('time_scale', 1.0))
+        self.engine = SendEngine(flows, curve, self.pps, self.mbps, self.batch, self.iface)
+        try:
+            self.engine.open()
+        except PermissionError:
+            print("✗ Sending needs root or CAP_NET_RAW")
+            return
+        except OSError as e:
+            # ENODEV and friends: the interface is missing or down
+            print(f"✗ Cannot open raw sockets on interface {self.engine.iface}: {e.strerror or e}")
+            return
+
+        print(f"🌐 Starting traffic profile '{self.profile_name}'"
+              f"{': ' + self.profile['description'] if self.profile.get('description') else ''}")
+        for flow in flows:
+            print(f"   - {flow.name}: {flow.rate:g} pps {flow.arrival}, "
+                  f"{sum(len(t.destinations or [t.destination]) for t in flow.templates)} target(s)")
         print("\n" + "=" * 50)
-        
-        # Start traffic generation threads
-        threads = [
-            threading.Thread(target=self.generate_http_traffic, daemon=True),
-            threading.Thread(target=self.generate_modbus_traffic, daemon=True),
-            threading.Thread(target=self.generate_icmp_traffic, daemon=True),
-            threading.Thread(target=self.generate_broadcast_traffic, daemon=True),
-            threading.Thread(target=self.print_stats, daemon=True)
-        ]
-        
-        for thread in threads:
-            thread.start()
-        
+
+        sender = threading.Thread(target=self.engine.run, daemon=True)
+        sender.start()
+        threading.Thread(target=self.print_stats, daemon=True).start()
+
         try:
             # Keep main thread alive
             while self.running:
@@ -136,9 +472,28 @@ class TrafficGenerator:
         except KeyboardInterrupt:
             print("\n\n🛑 Stopping traffic generation...")
             self.running = False
-            time.sleep(2)
-            print(f"✓ Total packets generated: {self.packet_count}")
+            self.engine.stop()
+            sender.join(timeout=2)
+            elapsed = time.time() - self.start_time
+            self.packet_count = self.engine.sent
+            print(f"✓ Total packets sent: {self.packet_count} "
+                  f"({self.packet_count / max(elapsed, 1e-9):.0f} packets/sec average)")
+
 
 if __name__ == "__main__":
-    generator = TrafficGenerator()
+    parser = argparse.ArgumentParser(description='Industrial network traffic generator')
+    parser.add_argument('--config', default=os.environ.get('TRAFFIC_CONFIG', DEFAULT_CONFIG),
+                        help='Config file with traffic_profiles')
+    parser.add_argument('--profile', default='normal_shift', help='Traffic profile to run')
+    parser.add_argument('--scale', type=float, default=1.0, help='Multiply every flow rate')
+    parser.add_argument('--pps', type=int, help='Cap on total packets per second')
+    parser.add_argument('--mbps', type=float, help='Cap on total megabits per second')
+    parser.add_argument('--batch', type=int, default=32, help='Most frames sent per scheduler step')
+    parser.add_argument('--iface', help='Interface for layer 2 frames (default: scapy conf.iface)')
+    args = parser.parse_args()
+    try:
+        profile = load_profile(args.config, args.profile)
+    except (OSError, ValueError) as e:
+        raise SystemExit(f"✗ {e}")
+    generator = TrafficGenerator(args.profile, profile, args.pps, args.mbps, args.batch, args.iface, args.scale)
     generator.run()
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+OilSprings Log Aggregates
+Rolling per-service x per-level counts in fixed time buckets
+"""
+
+from threading import Lock
+import time
+
+# (name, bucket width in seconds, buckets kept)
+RESOLUTIONS = (
+    ('1s', 1, 300),
+    ('1m', 60, 180),
+    ('1h', 3600, 72),
+)
+
+
+class BucketRing:
+    """Fixed ring of time buckets; a slot is reset when its bucket id changes"""
+
+    def __init__(self, width, size):
+        self.width = width
+        self.size = size
+        self.bucket_ids = [-1] * size
+        self.counts = [None] * size
+
+    def add(self, ts, key, n):
+        bucket_id = int(ts // self.width)
+        slot = bucket_id % self.size
+        if bucket_id < self.bucket_ids[slot]:
+            return  # older than the ring's window
+        if self.bucket_ids[slot] != bucket_id:
+            # Stale slot from an earlier lap: evict it
+            self.bucket_ids[slot] = bucket_id
+            self.counts[slot] = {}
+        counts = self.counts[slot]
+        counts[key] = counts.get(key, 0) + n
+
+    def series(self, now, points):
+        """Yield (bucket start, counts) for the newest `points` buckets, oldest first"""
+        current = int(now // self.width)
+        for bucket_id in range(current - min(points, self.size) + 1, current + 1):
+            slot = bucket_id % self.size
+            counts = self.counts[slot] if self.bucket_ids[slot] == bucket_id else {}
+            yield bucket_id * self.width, counts
+
+
+class LogAggregates:
+    """Incremental time-bucketed counts keyed by (service, level)"""
+
+    def __init__(self):
+        self.rings = {name: BucketRing(width, size) for name, width, size in RESOLUTIONS}
+        self.last_seen = {}
+        self._lock = Lock()
+
+    def add_many(self, ts, keys):
+        """Count a batch of (service, level) pairs ingested at ts"""
+        batch = {}
+        for key in keys:
+            batch[key] = batch.get(key, 0) + 1
+        with self._lock:
+            for ring in self.rings.values():
+                for key, n in batch.items():
+                    ring.add(ts, key, n)
+            for service, _ in batch:
+                self.last_seen[service] = max(ts, self.last_seen.get(service, 0.0))
+
+    def active_services(self, window, now=None):
+        """Number of services that logged within the last `window` seconds"""
+        cutoff = (now or time.time()) - window
+        with self._lock:
+            return sum(1 for ts in self.last_seen.values() if ts >= cutoff)
+
+    def timeseries(self, resolution='1m', points=60, service=None, level=None, now=None):
+        """Bucketed totals with a per-level breakdown, oldest bucket first"""
+        ring = self.rings[resolution]
+        now = now or time.time()
+        buckets = []
+        with self._lock:
+            for start, counts in ring.series(now, points):
+                levels = {}
+                for (key_service, key_level), n in counts.items():
+                    if service is not None and key_service != service:
+                        continue
+                    if level is not None and key_level != level:
+                        continue
+                    levels[key_level] = levels.get(key_level, 0) + n
+                buckets.append({'time': start, 'total': sum(levels.values()), 'levels': levels})
+        return buckets
@@ -4,18 +4,52 @@ OilSprings Log Collector
 Collects and aggregates logs from all OT services
 """
 
-from flask import Flask, render_template, jsonify, request
+from flask import Flask, Response, render_template, jsonify, request
 from flask_cors import CORS
 from datetime import datetime
-from collections import deque
+from aggregates import LogAggregates, RESOLUTIONS
+from forwarder import SyslogForwarder
+from threading import Lock, Thread
+from log_store import LogStore
+from search import SearchIndex, parse_query
+from segments import SegmentStore, entry_time
+from syslog_receiver import SyslogReceiver, run_syslog_server
 import json
 import os
+import time
+import zlib
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
 
 app = Flask(__name__)
 CORS(app)
 
-# Store logs in memory
-logs_buffer = deque(maxlen=5000)
+CONFIG_PATH = os.getenv('COLLECTOR_CONFIG', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'config.json'))
+
+MAX_LONG_POLL = 30
+STREAM_HEARTBEAT = 15
+STREAM_INTERVAL = 0.5
+STREAM_BATCH = 500
+MAX_BATCH_BYTES = 16 * 1024 * 1024
+EXPORT_PAGE = 1000
+EXPORT_CHUNK = 64 * 1024
+
+def load_config():
+    """Load collector settings, falling back to defaults if unreadable"""
+    try:
+        with open(CONFIG_PATH) as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"Using default config ({e})")
+        return {}
+
+config = load_config()
+
+# Store logs in memory; buffer_size in config.json sets how many are kept
+logs_buffer = LogStore(capacity=int(config.get('buffer_size', 50000)), search_index=SearchIndex())
 log_stats = {
     'total': 0,
     'info': 0,
@@ -23,6 +57,86 @@ log_stats = {
     'error': 0,
     'critical': 0
 }
+log_aggregates = LogAggregates()
+ingest_lock = Lock()
+# Stamp of the newest ingested batch, so stamps never go backwards (under ingest_lock)
+last_ingest_time = 0.0
+
+# Optional on-disk history, enabled by setting storage_dir in config.json
+segment_store = None
+if config.get('storage_dir'):
+    segment_store = SegmentStore(
+        config['storage_dir'],
+        segment_bytes=int(config.get('segment_mb', 16)) * 1024 * 1024,
+        retention_bytes=int(config.get('retention_mb', 1024)) * 1024 * 1024,
+        retention_seconds=float(config.get('retention_hours', 168)) * 3600
+    )
+
+# Forward collected logs to the IT ELK stack when syslog_enabled is set
+forwarder = None
+if config.get('syslog_enabled') and config.get('syslog_ip'):
+    forwarder = SyslogForwarder(
+        config['syslog_ip'],
+        config.get('syslog_port', 514),
+        protocol=config.get('syslog_protocol', 'udp')
+    )
+
+def parse_time(value):
+    """Parse an epoch or ISO-8601 query parameter into epoch seconds"""
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
+
+def count_logs(log_entries, ts):
+    """Add log entries to totals and time buckets (caller holds ingest_lock)"""
+    log_stats['total'] += len(log_entries)
+    keys = []
+    for log_entry in log_entries:
+        level = str(log_entry.get('level', 'info')).lower()
+        if level in log_stats:
+            log_stats[level] += 1
+        keys.append((log_entry.get('service', 'unknown'), level))
+    log_aggregates.add_many(ts, keys)
+
+def ingest_log(log_entry):
+    """Stamp a log entry, store it and update stats"""
+    ingest_logs([log_entry])
+
+def ingest_logs(log_entries):
+    """Stamp, store and count a batch of log entries"""
+    global last_ingest_time
+    # One lock keeps seq order identical in memory and on disk; stamping
+    # under it keeps time order aligned with seq order across threads
+    with ingest_lock:
+        now = last_ingest_time = max(time.time(), last_ingest_time)
+        timestamp = datetime.fromtimestamp(now).isoformat()
+        for log_entry in log_entries:
+            log_entry['timestamp'] = timestamp
+        logs_buffer.extend(log_entries, now)
+        if segment_store is not None:
+            segment_store.append(log_entries, now)
+        count_logs(log_entries, now)
+        if forwarder is not None:
+            forwarder.submit(log_entries)
+
+def restore_logs():
+    """Reload the newest persisted logs into memory after a restart"""
+    global last_ingest_time
+    if segment_store is None:
+        return
+    log_entries = segment_store.replay(logs_buffer.capacity)
+    logs_buffer.restore(log_entries, entry_time)
+    with ingest_lock:
+        for log_entry in log_entries:
+            count_logs([log_entry], entry_time(log_entry))
+        if log_entries:
+            last_ingest_time = max(last_ingest_time, entry_time(log_entries[-1]))
+    print(f"Restored {len(log_entries)} logs from {segment_store.directory}")
+
+syslog_receiver = SyslogReceiver(ingest_logs)
 
 @app.route('/')
 def index():
@@ -35,30 +149,236 @@ def handle_logs():
     if request.method == 'POST':
         # Receive log from service
         log_entry = request.json
-        log_entry['timestamp'] = datetime.now().isoformat()
-        logs_buffer.append(log_entry)
-        
-        # Update stats
-        log_stats['total'] += 1
-        level = log_entry.get('level', 'info').lower()
-        if level in log_stats:
-            log_stats[level] += 1
-        
+        ingest_log(log_entry)
         return jsonify({'status': 'received'}), 200
     else:
-        # Return recent logs
-        limit = int(request.args.get('limit', 100))
-        return jsonify(list(logs_buffer)[-limit:])
+        # Return recent logs, optionally filtered and paged by seq cursor
+        try:
+            limit = int(request.args.get('limit', 100))
+            cursor = request.args.get('cursor')
+            cursor = int(cursor) if cursor is not None else None
+            since = parse_time(request.args.get('since'))
+            until = parse_time(request.args.get('until'))
+            wait = min(float(request.args.get('wait', 0)), MAX_LONG_POLL)
+        except ValueError as e:
+            return jsonify({'error': f'Invalid query parameter: {e}'}), 400
+
+        filters = {
+            'service': request.args.get('service'),
+            'level': request.args.get('level'),
+            'since': since,
+            'until': until
+        }
+        logs = logs_buffer.query(cursor=cursor, limit=limit, **filters)
+
+        # Long-poll: with a cursor and wait=N, hold the request until new logs arrive
+        if cursor is not None and wait > 0:
+            deadline = time.time() + wait
+            last_seq = logs_buffer.last_seq
+            while not logs and time.time() < deadline:
+                last_seq = logs_buffer.wait(last_seq, deadline - time.time())
+                logs = logs_buffer.query(cursor=cursor, limit=limit, **filters)
+
+        response = jsonify(logs)
+        response.headers['X-Log-Cursor'] = str(logs[-1]['seq'] if logs else (cursor or 0))
+        return response
+
+@app.route('/api/logs/stream')
+def stream_logs():
+    """Server-Sent Events tail: push only logs newer than the client's cursor"""
+    service = request.args.get('service')
+    level = request.args.get('level')
+    cursor = request.headers.get('Last-Event-ID') or request.args.get('cursor')
+    try:
+        cursor = int(cursor) if cursor is not None else logs_buffer.last_seq
+    except ValueError:
+        return jsonify({'error': 'Invalid cursor'}), 400
+
+    def generate():
+        nonlocal cursor
+        yield 'retry: 2000\n\n'
+        last_write = time.monotonic()
+        while True:
+            scanned = logs_buffer.last_seq
+            logs = logs_buffer.query(service=service, level=level, cursor=cursor, limit=STREAM_BATCH)
+            if logs:
+                cursor = logs[-1]['seq']
+                yield f'id: {cursor}\ndata: {json.dumps(logs)}\n\n'
+                last_write = time.monotonic()
+                if len(logs) == STREAM_BATCH:
+                    continue
+                # Coalesce bursts into one event per interval
+                time.sleep(STREAM_INTERVAL)
+                continue
+            # Nothing up to scanned matched the filter; don't scan it again
+            cursor = max(cursor, scanned)
+            # Heartbeat on time since the last write, so a filtered stream
+            # over busy non-matching traffic still looks alive to proxies
+            idle = time.monotonic() - last_write
+            if idle >= STREAM_HEARTBEAT:
+                yield ': heartbeat\n\n'
+                last_write = time.monotonic()
+            else:
+                logs_buffer.wait(cursor, STREAM_HEARTBEAT - idle)
+
+    response = Response(generate(), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+@app.route('/api/logs/batch', methods=['POST'])
+def handle_log_batch():
+    """Receive newline-delimited JSON logs in one request (optionally gzip-encoded)"""
+    data = request.get_data()
+    if request.headers.get('Content-Encoding', '').lower() == 'gzip':
+        decompressor = zlib.decompressobj(31)
+        try:
+            data = decompressor.decompress(data, MAX_BATCH_BYTES)
+        except zlib.error as e:
+            return jsonify({'error': f'Invalid gzip body: {e}'}), 400
+        if decompressor.unconsumed_tail:
+            return jsonify({'error': 'Batch too large'}), 413
+
+    log_entries = []
+    for line_no, line in enumerate(data.splitlines(), 1):
+        if not line.strip():
+            continue
+        try:
+            log_entry = json.loads(line)
+        except ValueError as e:
+            return jsonify({'error': f'Invalid JSON on line {line_no}: {e}'}), 400
+        if not isinstance(log_entry, dict):
+            return jsonify({'error': f'Line {line_no} is not a JSON object'}), 400
+        log_entries.append(log_entry)
+
+    if log_entries:
+        ingest_logs(log_entries)
+    return jsonify({'status': 'received', 'count': len(log_entries)}), 200
+
+@app.route('/api/search')
+def search_logs():
+    """Full-text search: words are ANDed, "quoted phrases" match verbatim"""
+    q = request.args.get('q', '')
+    terms, phrases = parse_query(q)
+    if not terms:
+        return jsonify({'error': 'Query must contain at least one word'}), 400
+    try:
+        limit = min(int(request.args.get('limit', 50)), 1000)
+        before = request.args.get('before')
+        before = int(before) if before is not None else None
+    except ValueError as e:
+        return jsonify({'error': f'Invalid query parameter: {e}'}), 400
+
+    logs = logs_buffer.search(terms, phrases, before=before, limit=limit)
+    return jsonify({
+        'query': q,
+        'results': logs,
+        'next_before': logs[-1]['seq'] if len(logs) == limit else None
+    })
 
 @app.route('/api/stats')
 def get_stats():
     """Get log statistics"""
     return jsonify(log_stats)
 
+@app.route('/api/stats/timeseries')
+def get_stats_timeseries():
+    """Log rate per time bucket, optionally filtered by service and level"""
+    resolution = request.args.get('resolution', '1m')
+    if resolution not in log_aggregates.rings:
+        names = ', '.join(name for name, _, _ in RESOLUTIONS)
+        return jsonify({'error': f'Unsupported resolution (use one of: {names})'}), 400
+    try:
+        points = int(request.args.get('points', 60))
+    except ValueError:
+        return jsonify({'error': 'Invalid points'}), 400
+
+    level = request.args.get('level')
+    return jsonify({
+        'resolution': resolution,
+        'buckets': log_aggregates.timeseries(
+            resolution,
+            points,
+            service=request.args.get('service'),
+            level=level.lower() if level else None
+        )
+    })
+
+def iter_export(service=None, level=None, since=None, until=None):
+    """Yield matching logs oldest first without materializing the result"""
+    if segment_store is not None:
+        for log_entry in segment_store.scan(since, until):
+            if service is not None and log_entry.get('service', 'unknown') != service:
+                continue
+            if level is not None and str(log_entry.get('level', 'info')).lower() != level.lower():
+                continue
+            yield log_entry
+        return
+
+    cursor = 0
+    while True:
+        page = logs_buffer.query(service=service, level=level, since=since,
+                                 until=until, cursor=cursor, limit=EXPORT_PAGE)
+        yield from page
+        if len(page) < EXPORT_PAGE:
+            return
+        cursor = page[-1]['seq']
+
+def iter_ndjson_chunks(log_entries, compressor=None):
+    """Encode logs as NDJSON in ~64KB chunks, optionally compressing"""
+    chunk = []
+    size = 0
+    for log_entry in log_entries:
+        line = json.dumps(log_entry, separators=(',', ':')).encode() + b'\n'
+        chunk.append(line)
+        size += len(line)
+        if size >= EXPORT_CHUNK:
+            data = b''.join(chunk)
+            chunk, size = [], 0
+            if compressor is not None:
+                data = compressor.compress(data)
+            if data:
+                yield data
+
+    data = b''.join(chunk)
+    if compressor is not None:
+        data = compressor.compress(data) + compressor.flush()
+    if data:
+        yield data
+
 @app.route('/api/export')
 def export_logs():
-    """Export logs as JSON"""
-    return jsonify(list(logs_buffer))
+    """Stream logs as NDJSON, optionally gzip or zstd compressed"""
+    try:
+        since = parse_time(request.args.get('since'))
+        until = parse_time(request.args.get('until'))
+    except ValueError as e:
+        return jsonify({'error': f'Invalid query parameter: {e}'}), 400
+
+    compress = request.args.get('compress', '').lower()
+    if compress == 'gzip':
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+        mimetype, extension = 'application/gzip', '.gz'
+    elif compress == 'zstd':
+        if zstandard is None:
+            return jsonify({'error': 'zstd compression requires the zstandard package'}), 400
+        compressor = zstandard.ZstdCompressor().compressobj()
+        mimetype, extension = 'application/zstd', '.zst'
+    elif compress:
+        return jsonify({'error': f'Unsupported compression: {compress}'}), 400
+    else:
+        compressor = None
+        mimetype, extension = 'application/x-ndjson', ''
+
+    log_entries = iter_export(
+        service=request.args.get('service'),
+        level=request.args.get('level'),
+        since=since,
+        until=until
+    )
+    response = Response(iter_ndjson_chunks(log_entries, compressor), mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename=collector-logs.ndjson{extension}'
+    return response
 
 @app.route('/api/health')
 def health():
@@ -66,7 +386,10 @@ def health():
     return jsonify({
         'status': 'running',
         'logs_collected': len(logs_buffer),
-        'services_reporting': len(set(log.get('service', 'unknown') for log in logs_buffer))
+        'services_reporting': logs_buffer.service_count(),
+        'services_active_5m': log_aggregates.active_services(300),
+        'syslog': syslog_receiver.stats,
+        'forwarder': forwarder.stats if forwarder is not None else None
     })
 
 if __name__ == '__main__':
@@ -79,9 +402,18 @@ if __name__ == '__main__':
         {'service': 'IDS', 'level': 'info', 'message': 'Network monitoring active', 'timestamp': datetime.now().isoformat()},
     ]
     
-    for log in sample_logs:
-        logs_buffer.append(log)
-        log_stats['total'] += 1
-        log_stats['info'] += 1
+    restore_logs()
+    if len(logs_buffer) == 0:
+        for log in sample_logs:
+            ingest_log(log)
+
+    # Start syslog listener in background
+    syslog_host = config.get('server_ip', '0.0.0.0')
+    syslog_port = int(config.get('server_port', 514))
+    syslog_thread = Thread(target=run_syslog_server, args=(syslog_receiver, syslog_host, syslog_port), daemon=True)
+    syslog_thread.start()
+
+    if forwarder is not None:
+        forwarder.start()
     
     app.run(host='0.0.0.0', port=5000, debug=False)
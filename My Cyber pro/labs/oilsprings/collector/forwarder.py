@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+OilSprings Syslog Forwarder
+Ships collected logs to the IT ELK stack without blocking ingest
+
+Logs are queued in a bounded buffer and sent in batches by a background
+thread, as one JSON document per UDP datagram or as JSON lines over a
+persistent TCP connection (the formats the Logstash pipeline accepts).
+When the queue is full new logs are dropped and counted, so a slow or
+offline Logstash never stalls the collector. After a failed send only the
+logs that were not handed to the socket are retried, so a reconnect does
+not duplicate lines Logstash already received.
+"""
+
+from bisect import bisect_right
+from collections import deque
+from itertools import accumulate
+from threading import Condition, Thread
+import json
+import socket
+import time
+
+
+class SyslogForwarder:
+    def __init__(self, host, port, protocol='udp', queue_size=20000,
+                 batch_size=500, flush_interval=0.5, timeout=5.0):
+        self.address = (host, int(port))
+        self.protocol = protocol.lower()
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.timeout = timeout
+
+        self._queue = deque()
+        self._ready = Condition()
+        self._sock = None
+        self._backoff = 0.5
+        self.running = False
+        self.stats = {
+            'queued': 0,
+            'sent': 0,
+            'dropped': 0,
+            'batches': 0,
+            'send_errors': 0,
+            'connects': 0,
+            'connected': False,
+            'last_error': None
+        }
+
+    def submit(self, log_entries):
+        """Queue logs for forwarding; never blocks on the network"""
+        with self._ready:
+            room = self.queue_size - len(self._queue)
+            if room < len(log_entries):
+                self.stats['dropped'] += len(log_entries) - max(room, 0)
+                log_entries = log_entries[:max(room, 0)]
+            self._queue.extend(log_entries)
+            self.stats['queued'] = len(self._queue)
+            if len(self._queue) >= self.batch_size:
+                self._ready.notify()
+
+    def start(self):
+        self.running = True
+        Thread(target=self._run, daemon=True).start()
+        print(f"Forwarding logs to {self.address[0]}:{self.address[1]} ({self.protocol})")
+
+    def stop(self):
+        self.running = False
+        with self._ready:
+            self._ready.notify()
+
+    def _take_batch(self):
+        with self._ready:
+            if len(self._queue) < self.batch_size:
+                self._ready.wait(self.flush_interval)
+            count = min(len(self._queue), self.batch_size)
+            batch = [self._queue.popleft() for _ in range(count)]
+            self.stats['queued'] = len(self._queue)
+            return batch
+
+    def _requeue(self, batch):
+        """Put an unsent batch back at the front if there is room"""
+        with self._ready:
+            room = self.queue_size - len(self._queue)
+            keep = batch[-room:] if room > 0 else []
+            self.stats['dropped'] += len(batch) - len(keep)
+            self._queue.extendleft(reversed(keep))
+            self.stats['queued'] = len(self._queue)
+
+    def _connect(self):
+        if self.protocol == 'tcp':
+            sock = socket.create_connection(self.address, timeout=self.timeout)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        else:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            sock.connect(self.address)
+        self._sock = sock
+        self.stats['connected'] = True
+        self.stats['connects'] += 1
+
+    def _disconnect(self, error):
+        self.stats['send_errors'] += 1
+        self.stats['last_error'] = str(error)
+        self.stats['connected'] = False
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+
+    def _send(self, batch):
+        """Send a batch; returns (entries fully written, error or None)"""
+        lines = [json.dumps(entry, separators=(',', ':')).encode() for entry in batch]
+        send = self._sock.send
+        if self.protocol == 'tcp':
+            data = memoryview(b'\n'.join(lines) + b'\n')
+            ends = list(accumulate(len(line) + 1 for line in lines))
+            written = 0
+            try:
+                while written < len(data):
+                    written += send(data[written:])
+            except OSError as e:
+                return bisect_right(ends, written), e
+            return len(batch), None
+        for i, line in enumerate(lines):
+            try:
+                send(line)
+            except OSError as e:
+                return i, e
+        return len(batch), None
+
+    def _run(self):
+        while self.running:
+            batch = self._take_batch()
+            if not batch:
+                continue
+            try:
+                if self._sock is None:
+                    self._connect()
+                sent, error = self._send(batch)
+            except OSError as e:
+                sent, error = 0, e
+            self.stats['sent'] += sent
+            if error is not None:
+                self._disconnect(error)
+                # Lines already written are not sent again
+                self._requeue(batch[sent:])
+                # Back off while the destination is unreachable
+                time.sleep(self._backoff)
+                self._backoff = min(self._backoff * 2, 30.0)
+                continue
+
+            self._backoff = 0.5
+            self.stats['batches'] += 1
@@ -0,0 +1,298 @@
+#!/usr/bin/env python3
+"""
+OilSprings Log Store
+Bounded in-memory log buffer with service, level and time indexes
+"""
+
+from array import array
+from bisect import bisect_left
+from datetime import datetime
+from threading import Condition, Lock
+import sys
+
+# Fields held in dedicated columns; anything else is kept per entry
+CORE_FIELDS = ('service', 'level', 'message', 'timestamp', 'seq')
+
+
+class SeqIndex:
+    """Sorted array of sequence numbers with cheap eviction from the front"""
+
+    def __init__(self):
+        self.seqs = array('q')
+        self.head = 0
+
+    def __len__(self):
+        return len(self.seqs) - self.head
+
+    def append(self, seq):
+        self.seqs.append(seq)
+
+    def evict(self, seq):
+        """Drop seq if it is the oldest entry (entries are evicted in order)"""
+        if self.head < len(self.seqs) and self.seqs[self.head] == seq:
+            self.head += 1
+            # Compact once the dead prefix dominates the array
+            if self.head > 1024 and self.head * 2 > len(self.seqs):
+                del self.seqs[:self.head]
+                self.head = 0
+
+    def span(self, lo_seq, hi_seq):
+        """Return (start, end) array positions of seqs in [lo_seq, hi_seq)"""
+        start = bisect_left(self.seqs, lo_seq, self.head)
+        end = bisect_left(self.seqs, hi_seq, start)
+        return start, end
+
+
+class Dictionary:
+    """Interns repeated strings such as service and level names as small ints"""
+
+    def __init__(self):
+        self.codes = {}
+        self.names = []
+
+    def encode(self, name):
+        code = self.codes.get(name)
+        if code is None:
+            code = self.codes[name] = len(self.names)
+            self.names.append(sys.intern(name))
+        return code
+
+
+class LogStore:
+    """
+    Ring buffer of log entries addressed by a monotonically increasing seq.
+
+    Entries are kept column-wise: epoch timestamps in a float array,
+    dictionary-encoded service and level codes in int arrays, and the
+    message plus any extra fields in plain lists. Dicts and ISO timestamps
+    are only built for entries that are actually returned.
+
+    Secondary indexes per service and per level hold sorted seqs, so a
+    filtered query only touches the entries it returns. Entries are stamped
+    at ingest, which keeps seq order and time order aligned and lets time
+    bounds be resolved to seq bounds by binary search.
+    """
+
+    def __init__(self, capacity=50000, search_index=None):
+        self.capacity = capacity
+        self.search_index = search_index
+        self._times = array('d', bytes(8 * capacity))
+        self._service_codes = array('I', bytes(4 * capacity))
+        self._level_codes = array('I', bytes(4 * capacity))
+        self._messages = [None] * capacity
+        self._extras = [None] * capacity
+        self._service_names = Dictionary()
+        self._level_names = Dictionary()
+        self._first_seq = 1
+        self._next_seq = 1
+        self._by_service = {}
+        self._by_level = {}
+        self._lock = Lock()
+        self._appended = Condition(self._lock)
+
+    def __len__(self):
+        return self._next_seq - self._first_seq
+
+    @property
+    def last_seq(self):
+        return self._next_seq - 1
+
+    def append(self, entry, ts):
+        """Store entry stamped at epoch time ts and return its seq"""
+        with self._lock:
+            seq = self._append(entry, ts)
+            self._appended.notify_all()
+            return seq
+
+    def extend(self, entries, ts):
+        """Store a batch of entries under one lock acquisition"""
+        with self._lock:
+            for entry in entries:
+                self._append(entry, ts)
+            self._appended.notify_all()
+
+    def restore(self, entries, ts_of):
+        """Reload persisted entries, continuing their seq numbering"""
+        entries = entries[-self.capacity:]
+        with self._lock:
+            if entries:
+                self._first_seq = self._next_seq = entries[0]['seq']
+            for entry in entries:
+                self._append(entry, ts_of(entry))
+
+    def _append(self, entry, ts):
+        if len(self) == self.capacity:
+            self._evict_oldest()
+
+        seq = self._next_seq
+        self._next_seq += 1
+        entry['seq'] = seq
+
+        service = str(entry.get('service', 'unknown'))
+        level = str(entry.get('level', 'info')).lower()
+        message = entry.get('message', '')
+        extra = {key: value for key, value in entry.items() if key not in CORE_FIELDS}
+
+        slot = seq % self.capacity
+        service_code = self._service_names.encode(service)
+        level_code = self._level_names.encode(level)
+        self._times[slot] = ts
+        self._service_codes[slot] = service_code
+        self._level_codes[slot] = level_code
+        self._messages[slot] = message
+        self._extras[slot] = extra or None
+
+        index = self._by_service.get(service_code)
+        if index is None:
+            index = self._by_service[service_code] = SeqIndex()
+        index.append(seq)
+        index = self._by_level.get(level_code)
+        if index is None:
+            index = self._by_level[level_code] = SeqIndex()
+        index.append(seq)
+        if self.search_index is not None:
+            self.search_index.add(seq, service, level, message)
+        return seq
+
+    def _evict_oldest(self):
+        seq = self._first_seq
+        slot = seq % self.capacity
+        service_code = self._service_codes[slot]
+        level_code = self._level_codes[slot]
+        message = self._messages[slot]
+        self._messages[slot] = None
+        self._extras[slot] = None
+        self._first_seq += 1
+
+        for indexes, code in ((self._by_service, service_code), (self._by_level, level_code)):
+            index = indexes[code]
+            index.evict(seq)
+            if not index:
+                del indexes[code]
+        if self.search_index is not None:
+            self.search_index.remove(
+                seq,
+                self._service_names.names[service_code],
+                self._level_names.names[level_code],
+                message
+            )
+
+    def _entry(self, seq):
+        """Materialize the stored entry for seq as a dict"""
+        slot = seq % self.capacity
+        extra = self._extras[slot]
+        entry = dict(extra) if extra else {}
+        entry['service'] = self._service_names.names[self._service_codes[slot]]
+        entry['level'] = self._level_names.names[self._level_codes[slot]]
+        entry['message'] = self._messages[slot]
+        entry['timestamp'] = datetime.fromtimestamp(self._times[slot]).isoformat()
+        entry['seq'] = seq
+        return entry
+
+    def wait(self, after_seq, timeout):
+        """Block until an entry newer than after_seq exists; return last seq"""
+        with self._appended:
+            self._appended.wait_for(lambda: self._next_seq - 1 > after_seq, timeout)
+            return self._next_seq - 1
+
+    def service_count(self):
+        """Number of services with at least one buffered entry"""
+        return len(self._by_service)
+
+    def services(self):
+        """Names of services with at least one buffered entry"""
+        with self._lock:
+            return [self._service_names.names[code] for code in self._by_service]
+
+    def _seq_for_time(self, ts, right=False):
+        """First seq whose timestamp is >= ts (> ts when right=True)"""
+        lo, hi = self._first_seq, self._next_seq
+        times, capacity = self._times, self.capacity
+        while lo < hi:
+            mid = (lo + hi) // 2
+            t = times[mid % capacity]
+            if t < ts or (right and t == ts):
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def query(self, service=None, level=None, since=None, until=None,
+              cursor=None, limit=100):
+        """
+        Return matching entries in ingest order.
+
+        Without a cursor the newest `limit` matches are returned; with a
+        cursor the oldest `limit` matches after it are returned, so a poller
+        can page forward without gaps.
+        """
+        with self._lock:
+            lo_seq, hi_seq = self._first_seq, self._next_seq
+            if since is not None:
+                lo_seq = self._seq_for_time(since)
+            if until is not None:
+                hi_seq = self._seq_for_time(until, right=True)
+            if cursor is not None:
+                lo_seq = max(lo_seq, cursor + 1)
+            if lo_seq >= hi_seq or limit <= 0:
+                return []
+
+            candidates = []
+            service_code = level_code = None
+            if service is not None:
+                service_code = self._service_names.codes.get(service)
+                candidates.append(self._by_service.get(service_code))
+            if level is not None:
+                level_code = self._level_names.codes.get(level.lower())
+                candidates.append(self._by_level.get(level_code))
+            if None in candidates:
+                return []
+
+            if not candidates:
+                if cursor is not None:
+                    seqs = range(lo_seq, min(hi_seq, lo_seq + limit))
+                else:
+                    seqs = range(max(lo_seq, hi_seq - limit), hi_seq)
+                return [self._entry(seq) for seq in seqs]
+
+            # Walk the smallest index and check the remaining filters inline
+            index = min(candidates, key=len)
+            start, end = index.span(lo_seq, hi_seq)
+            positions = range(start, end) if cursor is not None else range(end - 1, start - 1, -1)
+            capacity = self.capacity
+            result = []
+            for pos in positions:
+                seq = index.seqs[pos]
+                if service_code is not None and self._service_codes[seq % capacity] != service_code:
+                    continue
+                if level_code is not None and self._level_codes[seq % capacity] != level_code:
+                    continue
+                result.append(self._entry(seq))
+                if len(result) >= limit:
+                    break
+            if cursor is None:
+                result.reverse()
+            return result
+
+    def search(self, terms, phrases=(), before=None, limit=50):
+        """
+        Return entries containing all terms and phrases, newest first.
+
+        Pass the seq of the last entry of a page as `before` to get the
+        next (older) page.
+        """
+        if self.search_index is None or not terms:
+            return []
+        with self._lock:
+            before = self._next_seq if before is None else min(before, self._next_seq)
+            messages, capacity = self._messages, self.capacity
+            result = []
+            for seq in self.search_index.match(terms, before):
+                if phrases:
+                    message = str(messages[seq % capacity]).lower()
+                    if not all(phrase in message for phrase in phrases):
+                        continue
+                result.append(self._entry(seq))
+                if len(result) >= limit:
+                    break
+            return result
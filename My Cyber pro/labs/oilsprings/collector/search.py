@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+OilSprings Log Search
+Incremental inverted index over log messages, services and levels
+"""
+
+from bisect import bisect_left, bisect_right
+import re
+
+from log_store import SeqIndex
+
+WORD = re.compile(r'[a-z0-9_]+(?:[.:/\-][a-z0-9_]+)*')
+QUERY_PART = re.compile(r'"([^"]*)"|(\S+)')
+SPLIT = re.compile(r'[.:/\-]')
+
+
+def tokenize(text):
+    """
+    Lower-cased terms of a message.
+
+    Compound words such as IP addresses or host:port pairs are indexed
+    whole and by part, so both `192.168.2.10:502` and `502` match.
+    """
+    terms = set()
+    for word in WORD.findall(text.lower()):
+        terms.add(word)
+        if len(word) > 1 and SPLIT.search(word):
+            terms.update(part for part in SPLIT.split(word) if part)
+    return terms
+
+
+def entry_terms(service, level, message):
+    terms = tokenize(str(message))
+    terms.add('service:' + service.lower())
+    terms.add('level:' + level)
+    return terms
+
+
+def parse_query(q):
+    """
+    Split a query into required terms and phrases.
+
+    Bare words are ANDed, "quoted text" must appear verbatim and
+    service:NAME / level:NAME restrict by field.
+    """
+    terms, phrases = set(), []
+    for phrase, word in QUERY_PART.findall(q):
+        if phrase:
+            phrases.append(phrase.lower())
+            terms.update(WORD.findall(phrase.lower()))
+        elif word.lower().startswith(('service:', 'level:')):
+            terms.add(word.lower())
+        else:
+            terms.update(WORD.findall(word.lower()))
+    return terms, phrases
+
+
+class SearchIndex:
+    """Postings lists of seqs per term, evicted in step with the log store"""
+
+    def __init__(self):
+        self.postings = {}
+
+    def add(self, seq, service, level, message):
+        postings = self.postings
+        for term in entry_terms(service, level, message):
+            index = postings.get(term)
+            if index is None:
+                index = postings[term] = SeqIndex()
+            index.append(seq)
+
+    def remove(self, seq, service, level, message):
+        postings = self.postings
+        for term in entry_terms(service, level, message):
+            index = postings.get(term)
+            if index is not None:
+                index.evict(seq)
+                if not index:
+                    del postings[term]
+
+    def match(self, terms, before):
+        """
+        Yield seqs below `before` that contain every term, newest first.
+
+        Leapfrog intersection: each list jumps straight to the current
+        candidate by binary search, so rare combinations of common terms
+        skip long runs instead of probing every seq.
+        """
+        lists = []
+        for term in terms:
+            index = self.postings.get(term)
+            if index is None:
+                return
+            lists.append(index)
+        lists.sort(key=len)
+
+        ends = [bisect_left(index.seqs, before, index.head) for index in lists]
+        candidate = before - 1
+        while True:
+            agreed, i = 0, 0
+            while agreed < len(lists):
+                index = lists[i]
+                pos = bisect_right(index.seqs, candidate, index.head, ends[i]) - 1
+                if pos < index.head:
+                    return
+                ends[i] = pos + 1
+                seq = index.seqs[pos]
+                if seq == candidate:
+                    agreed += 1
+                else:
+                    candidate, agreed = seq, 1
+                i = (i + 1) % len(lists)
+            yield candidate
+            candidate -= 1
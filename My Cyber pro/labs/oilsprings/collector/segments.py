@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+"""
+OilSprings Segment Storage
+Append-only on-disk log segments with a sparse time/offset index
+
+Each segment is an NDJSON file named after the seq of its first record
+(`00000000000000000001.seg`) with a companion `.idx` file of fixed-width
+(timestamp, seq, offset) entries written every INDEX_INTERVAL records.
+Segments roll over at `segment_bytes` and whole segments are expired by
+age or total size, so retention never rewrites live data. Appends are
+flushed to the OS per batch and a segment is fsynced when it rolls, so a
+process crash loses nothing and a power loss at most the active segment's
+unsynced tail.
+"""
+
+from datetime import datetime
+from threading import Lock, Thread
+import json
+import mmap
+import os
+import struct
+import time
+
+INDEX_ENTRY = struct.Struct('<dQQ')  # timestamp, seq, byte offset
+INDEX_INTERVAL = 256
+EXPIRE_INTERVAL = 60
+
+
+def entry_time(entry):
+    """Epoch seconds of a stored entry's ingest timestamp"""
+    try:
+        return datetime.fromisoformat(entry['timestamp']).timestamp()
+    except (KeyError, TypeError, ValueError):
+        return 0.0
+
+
+class Segment:
+    def __init__(self, directory, first_seq):
+        self.first_seq = first_seq
+        base = os.path.join(directory, f'{first_seq:020d}')
+        self.path = base + '.seg'
+        self.index_path = base + '.idx'
+
+    def size(self):
+        try:
+            return os.path.getsize(self.path)
+        except OSError:
+            return 0
+
+    def mtime(self):
+        try:
+            return os.path.getmtime(self.path)
+        except OSError:
+            return 0.0
+
+    def read_index(self):
+        """Return [(timestamp, seq, offset)] entries from the index file"""
+        try:
+            with open(self.index_path, 'rb') as f:
+                data = f.read()
+        except OSError:
+            return []
+        usable = len(data) - len(data) % INDEX_ENTRY.size
+        return list(INDEX_ENTRY.iter_unpack(data[:usable]))
+
+    def remove(self):
+        for path in (self.path, self.index_path):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+class SegmentStore:
+    """Persistent append-only log history split into size-bounded segments"""
+
+    def __init__(self, directory, segment_bytes=16 * 1024 * 1024,
+                 retention_bytes=1024 * 1024 * 1024, retention_seconds=7 * 86400):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.retention_bytes = retention_bytes
+        self.retention_seconds = retention_seconds
+        self._lock = Lock()
+        os.makedirs(directory, exist_ok=True)
+
+        self.segments = sorted(
+            (Segment(directory, int(name[:-4]))
+             for name in os.listdir(directory)
+             if name.endswith('.seg') and name[:-4].isdigit()),
+            key=lambda segment: segment.first_seq
+        )
+        self._file = None
+        self._index_file = None
+        self._offset = 0
+        self._since_index = 0
+        if self.segments:
+            self._open_active(self.segments[-1])
+        # Age-based retention must also run while no logs arrive
+        Thread(target=self._expire_periodically, daemon=True).start()
+
+    def _open_active(self, segment):
+        """Open segment for appending, dropping any torn trailing record"""
+        self._file = open(segment.path, 'ab')
+        size = self._file.tell()
+        if size:
+            with open(segment.path, 'rb') as f:
+                f.seek(max(0, size - 65536))
+                tail = f.read()
+            keep = size - len(tail) + tail.rfind(b'\n') + 1
+            if keep != size:
+                self._file.truncate(keep)
+                self._file.seek(keep)
+                size = keep
+        self._index_file = open(segment.index_path, 'ab')
+        self._offset = size
+        self._since_index = 0
+
+    def _roll(self, first_seq):
+        self.sync()
+        self.close()
+        segment = Segment(self.directory, first_seq)
+        self.segments.append(segment)
+        self._open_active(segment)
+        self._expire()
+
+    def _expire_periodically(self):
+        while True:
+            time.sleep(EXPIRE_INTERVAL)
+            with self._lock:
+                self._expire()
+
+    def _expire(self):
+        """Delete the oldest closed segments beyond the retention limits"""
+        cutoff = time.time() - self.retention_seconds
+        total = sum(segment.size() for segment in self.segments)
+        while len(self.segments) > 1:
+            oldest = self.segments[0]
+            if total <= self.retention_bytes and oldest.mtime() >= cutoff:
+                break
+            total -= oldest.size()
+            oldest.remove()
+            self.segments.pop(0)
+
+    def append(self, entries, ts):
+        """Append a batch of entries that already carry their seq"""
+        if not entries:
+            return
+        with self._lock:
+            if self._file is None or self._offset >= self.segment_bytes:
+                self._roll(entries[0]['seq'])
+
+            chunk = []
+            index_chunk = []
+            offset = self._offset
+            for entry in entries:
+                if offset >= self.segment_bytes and chunk:
+                    # A large batch rolls mid-way so no segment outgrows segment_bytes by much
+                    self._write(chunk, index_chunk, offset)
+                    self._roll(entry['seq'])
+                    chunk = []
+                    index_chunk = []
+                    offset = self._offset
+                line = json.dumps(entry, separators=(',', ':')).encode() + b'\n'
+                if self._since_index == 0:
+                    index_chunk.append(INDEX_ENTRY.pack(ts, entry['seq'], offset))
+                self._since_index = (self._since_index + 1) % INDEX_INTERVAL
+                chunk.append(line)
+                offset += len(line)
+            self._write(chunk, index_chunk, offset)
+
+    def _write(self, chunk, index_chunk, offset):
+        self._file.write(b''.join(chunk))
+        self._file.flush()
+        if index_chunk:
+            self._index_file.write(b''.join(index_chunk))
+            self._index_file.flush()
+        self._offset = offset
+
+    def replay(self, limit):
+        """
+        Return up to `limit` newest entries, oldest first.
+
+        Segments are mmap'd and walked backwards line by line, so startup
+        cost is proportional to what is replayed, not to history size.
+        """
+        with self._lock:
+            segments = list(self.segments)
+
+        batches = []
+        remaining = limit
+        for segment in reversed(segments):
+            if remaining <= 0:
+                break
+            if segment.size() == 0:
+                continue
+            with open(segment.path, 'rb') as f, \
+                    mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                lines = []
+                end = len(mm)
+                while remaining > 0 and end > 0:
+                    start = mm.rfind(b'\n', 0, end - 1) + 1
+                    lines.append(mm[start:end])
+                    end = start
+                    remaining -= 1
+            batches.append(lines[::-1])
+
+        entries = []
+        for lines in reversed(batches):
+            for line in lines:
+                try:
+                    entries.append(json.loads(line))
+                except ValueError:
+                    continue
+        return entries
+
+    def scan(self, since=None, until=None):
+        """
+        Yield stored entries in seq order within [since, until].
+
+        The sparse index locates the first block at or after `since` in
+        each segment, and segments that end before `since` are skipped.
+        """
+        with self._lock:
+            segments = list(self.segments)
+
+        for i, segment in enumerate(segments):
+            if since is not None and i + 1 < len(segments):
+                next_index = segments[i + 1].read_index()
+                if next_index and next_index[0][0] < since:
+                    continue
+
+            offset = 0
+            index = segment.read_index()
+            if index and until is not None and index[0][0] > until:
+                return
+            if since is not None:
+                for ts, _, block_offset in index:
+                    if ts >= since:
+                        break
+                    offset = block_offset
+
+            with open(segment.path, 'rb') as f:
+                f.seek(offset)
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue
+                    ts = entry_time(entry)
+                    if since is not None and ts < since:
+                        continue
+                    if until is not None and ts > until:
+                        return
+                    yield entry
+
+    def sync(self):
+        """Force the active segment and its index to disk"""
+        for f in (self._file, self._index_file):
+            if f is not None:
+                f.flush()
+                os.fsync(f.fileno())
+
+    def close(self):
+        for f in (self._file, self._index_file):
+            if f is not None:
+                f.close()
+        self._file = None
+        self._index_file = None
@@ -0,0 +1,269 @@
+#!/usr/bin/env python3
+"""
+OilSprings Syslog Receiver
+asyncio syslog listener (RFC 3164 / RFC 5424) over UDP and TCP
+
+Parsed messages are buffered and handed to the sink once per event loop
+iteration, so a burst of datagrams costs one store lock acquisition instead
+of one per line.
+"""
+
+import asyncio
+import json
+import re
+import socket
+
+# RFC 5424 severities mapped onto the collector's log levels
+SEVERITY_LEVELS = (
+    'critical',  # 0 emergency
+    'critical',  # 1 alert
+    'critical',  # 2 critical
+    'error',     # 3 error
+    'warning',   # 4 warning
+    'info',      # 5 notice
+    'info',      # 6 informational
+    'info',      # 7 debug
+)
+
+RFC3164_TIMESTAMP = re.compile(r'[A-Z][a-z]{2} [ \d]\d \d\d:\d\d:\d\d ')
+RFC3164_TAG = re.compile(r'([^\s:\[]{1,48})(?:\[[^\]]*\])?: ?')
+
+# Longest octet-counted frame accepted on TCP before the peer is dropped
+MAX_FRAME = 64 * 1024
+
+# Kernel receive buffer for the UDP socket, sized to absorb attack bursts
+UDP_RCVBUF = 4 * 1024 * 1024
+
+# Datagrams read per readiness event before yielding to the event loop
+UDP_DRAIN = 512
+
+
+def nil(value):
+    """Map the RFC 5424 NILVALUE to None"""
+    return None if value == '-' else value
+
+
+def parse_syslog(data, peer=None):
+    """
+    Parse a single syslog message into a collector log entry.
+
+    Accepts RFC 5424, RFC 3164 and bare JSON objects (the format the IT
+    Logstash pipeline uses). Unparseable input is kept as an info message
+    so nothing is silently dropped.
+    """
+    text = data.decode('utf-8', errors='replace').strip('\r\n\x00 ')
+    host = peer[0] if peer else None
+
+    if text.startswith('{'):
+        try:
+            entry = json.loads(text)
+            if isinstance(entry, dict):
+                entry.setdefault('host', host)
+                return entry
+        except ValueError:
+            pass
+
+    facility, severity = 1, 5
+    if text.startswith('<'):
+        end = text.find('>', 1, 5)
+        if end > 0 and text[1:end].isdigit():
+            pri = int(text[1:end])
+            facility, severity = pri >> 3, pri & 7
+            text = text[end + 1:]
+
+    entry = {
+        'level': SEVERITY_LEVELS[severity],
+        'facility': facility,
+        'host': host
+    }
+
+    if text.startswith('1 '):
+        # RFC 5424: VERSION TIMESTAMP HOSTNAME APP-NAME PROCID MSGID SD MSG
+        parts = text.split(' ', 6)
+        if len(parts) == 7:
+            _, timestamp, hostname, app_name, _, msgid, rest = parts
+            if rest.startswith('-'):
+                message = rest[2:]
+            else:
+                # Skip structured data elements, honouring escaped brackets
+                i = 0
+                while i < len(rest) and rest[i] == '[':
+                    while i < len(rest) and rest[i] != ']':
+                        i += 2 if rest[i] == '\\' else 1
+                    i += 1
+                message = rest[i + 1:]
+            entry['host'] = nil(hostname) or host
+            entry['service'] = nil(app_name) or entry['host'] or 'unknown'
+            entry['source_timestamp'] = nil(timestamp)
+            if nil(msgid):
+                entry['msgid'] = msgid
+            entry['message'] = message.lstrip('\ufeff')
+            return entry
+
+    # RFC 3164: TIMESTAMP HOSTNAME TAG: MSG (every part optional in practice)
+    if RFC3164_TIMESTAMP.match(text):
+        entry['source_timestamp'] = text[:15]
+        text = text[16:]
+        hostname, _, rest = text.partition(' ')
+        if hostname and not hostname.endswith(':') and rest:
+            entry['host'] = hostname
+            text = rest
+
+    tag = RFC3164_TAG.match(text)
+    if tag:
+        entry['service'] = tag.group(1)
+        text = text[tag.end():]
+    else:
+        entry['service'] = entry['host'] or 'unknown'
+    entry['message'] = text
+    return entry
+
+
+class SyslogReceiver:
+    """Collects parsed messages and flushes them to the sink in batches"""
+
+    def __init__(self, sink):
+        self.sink = sink
+        self.pending = []
+        self.flush_scheduled = False
+        self.stats = {'udp': 0, 'tcp': 0, 'tcp_connections': 0, 'framing_errors': 0}
+
+    def submit(self, data, peer, transport):
+        self.pending.append(parse_syslog(data, peer))
+        self.stats[transport] += 1
+        if not self.flush_scheduled:
+            self.flush_scheduled = True
+            asyncio.get_running_loop().call_soon(self.flush)
+
+    def flush(self):
+        self.flush_scheduled = False
+        batch, self.pending = self.pending, []
+        if batch:
+            try:
+                self.sink(batch)
+            except Exception as e:
+                print(f"Syslog sink error: {e}")
+
+
+class SyslogUDPReader:
+    """
+    Drains the UDP socket on each readiness event.
+
+    asyncio's datagram transport reads one datagram per loop iteration;
+    reading up to UDP_DRAIN datagrams per wakeup lets a burst share a
+    single flush.
+    """
+
+    def __init__(self, receiver, sock):
+        self.receiver = receiver
+        self.sock = sock
+
+    def read_ready(self):
+        recvfrom, submit = self.sock.recvfrom, self.receiver.submit
+        for _ in range(UDP_DRAIN):
+            try:
+                data, addr = recvfrom(65535)
+            except (BlockingIOError, InterruptedError):
+                break
+            except OSError as e:
+                print(f"Syslog UDP error: {e}")
+                break
+            submit(data, addr, 'udp')
+
+
+class SyslogTCPProtocol(asyncio.Protocol):
+    """TCP syslog with octet-counting (RFC 6587) or LF-delimited framing"""
+
+    def __init__(self, receiver):
+        self.receiver = receiver
+        self.buffer = bytearray()
+        self.transport = None
+        self.peer = None
+        # Decided by the first frame: a sender uses one framing per connection
+        self.octet_counting = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self.peer = transport.get_extra_info('peername')
+        self.receiver.stats['tcp_connections'] += 1
+
+    def data_received(self, data):
+        buf = self.buffer
+        buf += data
+        pos = 0
+        while pos < len(buf):
+            if self.octet_counting is not False:
+                # A length prefix is digits then a space; <PRI> and timestamps are not
+                digits = pos
+                while digits < len(buf) and digits - pos < 8 and 48 <= buf[digits] <= 57:
+                    digits += 1
+                if digits == len(buf):
+                    break  # wait for the rest of the prefix and the byte after it
+                prefixed = digits > pos and buf[digits] == 32
+                if self.octet_counting is None:
+                    self.octet_counting = prefixed
+                elif not prefixed:
+                    return self._framing_error()
+            if self.octet_counting:
+                # Octet counting: MSG-LEN SP SYSLOG-MSG
+                space = digits
+                length = int(buf[pos:space])
+                if length > MAX_FRAME:
+                    return self._framing_error()
+                end = space + 1 + length
+                if end > len(buf):
+                    break
+                self.receiver.submit(bytes(buf[space + 1:end]), self.peer, 'tcp')
+                pos = end
+            else:
+                newline = buf.find(b'\n', pos)
+                if newline < 0:
+                    if len(buf) - pos > MAX_FRAME:
+                        return self._framing_error()
+                    break
+                if newline > pos:
+                    self.receiver.submit(bytes(buf[pos:newline]), self.peer, 'tcp')
+                pos = newline + 1
+        del buf[:pos]
+
+    def _framing_error(self):
+        self.receiver.stats['framing_errors'] += 1
+        self.buffer.clear()
+        self.transport.close()
+
+    def eof_received(self):
+        if self.buffer.strip():
+            self.receiver.submit(bytes(self.buffer), self.peer, 'tcp')
+            self.buffer.clear()
+
+
+async def serve_syslog(receiver, host='0.0.0.0', port=514):
+    """Bind the UDP and TCP listeners and serve until cancelled"""
+    loop = asyncio.get_running_loop()
+    udp_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        udp_sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, UDP_RCVBUF)
+    except OSError:
+        pass
+    udp_sock.bind((host, port))
+    udp_sock.setblocking(False)
+    loop.add_reader(udp_sock.fileno(), SyslogUDPReader(receiver, udp_sock).read_ready)
+
+    tcp_server = await loop.create_server(
+        lambda: SyslogTCPProtocol(receiver), host, port
+    )
+    print(f"Syslog listener on {host}:{port} (UDP/TCP)")
+    try:
+        async with tcp_server:
+            await tcp_server.serve_forever()
+    finally:
+        loop.remove_reader(udp_sock.fileno())
+        udp_sock.close()
+
+
+def run_syslog_server(receiver, host='0.0.0.0', port=514):
+    """Thread target: run the syslog listeners on a private event loop"""
+    try:
+        asyncio.run(serve_syslog(receiver, host, port))
+    except OSError as e:
+        print(f"Syslog listener disabled: {e}")
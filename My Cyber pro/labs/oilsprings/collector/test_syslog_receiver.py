@@ -0,0 +1,64 @@
+import asyncio
+
+from syslog_receiver import SyslogReceiver, SyslogTCPProtocol
+
+
+class Transport:
+    def __init__(self):
+        self.closed = False
+
+    def get_extra_info(self, name):
+        return ('192.0.2.1', 514)
+
+    def close(self):
+        self.closed = True
+
+
+def feed(*chunks):
+    """Received messages, the receiver and the transport after feeding chunks"""
+    batches = []
+
+    async def run():
+        receiver = SyslogReceiver(batches.append)
+        protocol = SyslogTCPProtocol(receiver)
+        transport = Transport()
+        protocol.connection_made(transport)
+        for chunk in chunks:
+            protocol.data_received(chunk)
+        await asyncio.sleep(0)
+        return receiver, transport
+
+    receiver, transport = asyncio.run(run())
+    return [entry['message'] for batch in batches for entry in batch], receiver, transport
+
+
+def test_octet_counted_frames_split_across_chunks():
+    messages, _, transport = feed(b'11 hello', b' world4 ab', b'cd')
+    assert messages == ['hello world', 'abcd']
+    assert not transport.closed
+
+
+def test_lf_framing_keeps_digit_lines():
+    messages, _, _ = feed(b'2024-01-01 boot\n12 not a count\n')
+    assert messages == ['2024-01-01 boot', '12 not a count']
+
+
+def test_buffer_ending_in_eight_digits_waits():
+    messages, receiver, transport = feed(b'12345678')
+    assert messages == []
+    assert not transport.closed
+    messages, _, _ = feed(b'12345678', b'90 rest of line\n')
+    assert messages == ['1234567890 rest of line']
+
+
+def test_eight_digit_prefix_after_octet_frame_is_dropped():
+    messages, receiver, transport = feed(b'5 hello', b'12345678', b' x')
+    assert messages == ['hello']
+    assert receiver.stats['framing_errors'] == 1
+    assert transport.closed
+
+
+def test_non_numeric_prefix_after_octet_frame_is_dropped():
+    _, receiver, transport = feed(b'5 hello12a hello')
+    assert receiver.stats['framing_errors'] == 1
+    assert transport.closed
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+OilSprings IDS Capture Benchmark
+Compares per-packet cost of scapy dissection and the struct parser
+
+Usage:
+    python3 bench_capture.py [--packets N]
+    python3 bench_capture.py --live eth0 [--seconds S]
+
+The offline mode replays synthetic Modbus/S7/UDP frames through both
+paths and reports packets per second. The live mode counts frames the
+AF_PACKET engine receives on an interface while traffic is generated.
+"""
+
+import argparse
+import socket
+import struct
+import time
+
+from capture import AFPacketCapture, parse_frame
+
+
+def build_frame(src, dst, proto, sport, dport, payload=b''):
+    """Ethernet + IPv4 + TCP/UDP frame with zeroed checksums"""
+    if proto == 6:
+        l4 = struct.pack('!HHIIBBHHH', sport, dport, 1, 0, 5 << 4, 0x18, 8192, 0, 0)
+    else:
+        l4 = struct.pack('!HHHH', sport, dport, 8 + len(payload), 0)
+    ip = struct.pack(
+        '!BBHHHBBH4s4s', 0x45, 0, 20 + len(l4) + len(payload), 1, 0, 64, proto, 0,
+        socket.inet_aton(src), socket.inet_aton(dst)
+    )
+    eth = b'\x02\x00\x00\x00\x00\x01\x02\x00\x00\x00\x00\x02\x08\x00'
+    return eth + ip + l4 + payload
+
+
+def sample_frames():
+    return [
+        build_frame('192.168.3.20', '192.168.2.10', 6, 40000, 502,
+                    bytes.fromhex('000100000006010300000010')),
+        build_frame('192.168.2.10', '192.168.3.20', 6, 502, 40000,
+                    bytes.fromhex('00010000002301032000') + bytes(32)),
+        build_frame('192.168.3.11', '192.168.2.10', 6, 40001, 102,
+                    bytes.fromhex('0300001611e00000000100c0010ac1020100c2020102')),
+        build_frame('192.168.3.2', '192.168.4.40', 17, 514, 514, b'<13>router: link up'),
+    ]
+
+
+def bench(name, fn, frames, count):
+    start = time.perf_counter()
+    for i in range(count):
+        fn(frames[i % len(frames)])
+    elapsed = time.perf_counter() - start
+    pps = count / elapsed
+    print(f"{name:<28} {pps:>12,.0f} pps  ({elapsed * 1e6 / count:.2f} us/packet)")
+    return pps
+
+
+def struct_path(frame):
+    parsed = parse_frame(frame)
+    return parsed.src, parsed.dst, parsed.sport, parsed.dport, parsed.length
+
+
+def run_offline(count):
+    frames = sample_frames()
+    print(f"Parsing {count:,} synthetic frames\n")
+    fast = bench('struct parser (capture.py)', struct_path, frames, count)
+
+    try:
+        from scapy.all import Ether, IP, TCP, UDP
+    except ImportError:
+        print("scapy not installed, skipping comparison")
+        return
+
+    def scapy_path(frame):
+        packet = Ether(frame)
+        layer = packet[TCP] if TCP in packet else packet[UDP]
+        return packet[IP].src, packet[IP].dst, layer.sport, layer.dport, len(packet)
+
+    slow = bench('scapy dissection', scapy_path, frames, max(count // 20, 1000))
+    print(f"\nspeedup: {fast / slow:.1f}x")
+
+
+def run_live(interface, seconds):
+    capture = AFPacketCapture(interface)
+    print(f"Counting frames on {interface} for {seconds}s...")
+    deadline = time.time() + seconds
+    packets = 0
+    for timestamp, frame, length in capture.frames():
+        parse_frame(frame, length)
+        packets += 1
+        if timestamp >= deadline:
+            break
+    capture.close()
+    print(f"{packets:,} frames, {packets / seconds:,.0f} pps")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--packets', type=int, default=200000)
+    parser.add_argument('--live', metavar='INTERFACE')
+    parser.add_argument('--seconds', type=float, default=10)
+    args = parser.parse_args()
+
+    if args.live:
+        run_live(args.live, args.seconds)
+    else:
+        run_offline(args.packets)
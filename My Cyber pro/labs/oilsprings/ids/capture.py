@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""
+OilSprings IDS Capture Engine
+AF_PACKET capture with a kernel BPF filter and a minimal header parser
+
+scapy builds a full object tree for every packet before the monitor reads
+four header fields. This engine reads raw frames from an AF_PACKET socket
+into a reusable buffer and unpacks only the Ethernet/IPv4/TCP/UDP headers
+with struct, which is several times faster per packet.
+"""
+
+import ctypes
+import socket
+import struct
+import subprocess
+import time
+
+from pcap_reader import LINKTYPE_ETHERNET, LINKTYPE_LINUX_SLL, LINKTYPE_LINUX_SLL2
+
+ETH_P_ALL = 0x0003
+ETH_P_IP = 0x0800
+ETH_P_8021Q = 0x8100
+SO_ATTACH_FILTER = 26
+
+IPPROTO_TCP = 6
+IPPROTO_UDP = 17
+
+IPV4_HEADER = struct.Struct('!BBHHHBBH4s4s')
+PORTS = struct.Struct('!HH')
+TCP_FLAGS_OFFSET = 13
+
+# Link-layer header length and offset of its EtherType field, by linktype
+LINK_HEADERS = {
+    LINKTYPE_ETHERNET: (14, 12),
+    LINKTYPE_LINUX_SLL: (16, 14),
+    LINKTYPE_LINUX_SLL2: (20, 0),
+}
+
+# BPF instruction: code, jt, jf, k
+BPF_INSN = struct.Struct('HBBI')
+
+
+class ParsedFrame:
+    """Header fields of one IPv4 frame"""
+
+    __slots__ = ('src', 'dst', 'proto', 'sport', 'dport', 'length', 'tcp_flags', 'payload_offset', 'end')
+
+    def __init__(self, src, dst, proto, sport, dport, length, tcp_flags, payload_offset, end):
+        self.src = src
+        self.dst = dst
+        self.proto = proto
+        self.sport = sport
+        self.dport = dport
+        self.length = length
+        self.tcp_flags = tcp_flags
+        self.payload_offset = payload_offset
+        self.end = end
+
+
+def parse_frame(frame, length=None, linktype=LINKTYPE_ETHERNET):
+    """
+    Parse an Ethernet frame (bytes or memoryview) without copying it.
+    Linux cooked captures (`linktype` SLL or SLL2) are parsed the same way.
+
+    Returns a ParsedFrame for IPv4 traffic, None for anything else.
+    sport/dport/tcp_flags are None when there is no TCP/UDP header
+    (other protocols or non-first fragments). The payload is
+    frame[payload_offset:end]; end stops at the IP total length so
+    Ethernet padding is not read as payload.
+    """
+    if length is None:
+        length = len(frame)
+    offset, type_offset = LINK_HEADERS[linktype]
+    if length < offset + 20:
+        return None
+
+    ethertype = (frame[type_offset] << 8) | frame[type_offset + 1]
+    if ethertype == ETH_P_8021Q:
+        ethertype = (frame[offset + 2] << 8) | frame[offset + 3]
+        offset += 4
+    if ethertype != ETH_P_IP or length < offset + 20:
+        return None
+
+    (version_ihl, _, total_length, _, fragment, _, proto, _,
+     src, dst) = IPV4_HEADER.unpack_from(frame, offset)
+    if version_ihl >> 4 != 4:
+        return None
+    l4 = offset + (version_ihl & 0x0F) * 4
+    # Report the on-wire size even when the capture was truncated to snaplen
+    wire_length = max(length, offset + total_length)
+    end = min(length, offset + total_length)
+    src = socket.inet_ntoa(src)
+    dst = socket.inet_ntoa(dst)
+
+    sport = dport = tcp_flags = None
+    payload_offset = l4
+    if fragment & 0x1FFF == 0:
+        if proto == IPPROTO_TCP and length >= l4 + 20:
+            sport, dport = PORTS.unpack_from(frame, l4)
+            tcp_flags = frame[l4 + TCP_FLAGS_OFFSET]
+            payload_offset = l4 + (frame[l4 + 12] >> 4) * 4
+        elif proto == IPPROTO_UDP and length >= l4 + 8:
+            sport, dport = PORTS.unpack_from(frame, l4)
+            payload_offset = l4 + 8
+
+    return ParsedFrame(src, dst, proto, sport, dport, wire_length, tcp_flags, payload_offset, end)
+
+
+def default_filter(snaplen):
+    """BPF program accepting IPv4 frames, untagged or 802.1Q, truncated to snaplen"""
+    return [
+        (0x28, 0, 0, 12),           # ldh [12]
+        (0x15, 3, 0, ETH_P_IP),     # jeq #0x800, accept, next
+        (0x15, 0, 3, ETH_P_8021Q),  # jeq #0x8100, next, drop
+        (0x28, 0, 0, 16),           # ldh [16]
+        (0x15, 0, 1, ETH_P_IP),     # jeq #0x800, accept, drop
+        (0x06, 0, 0, snaplen),      # ret #snaplen
+        (0x06, 0, 0, 0),            # ret #0
+    ]
+
+
+def compile_filter(expression, snaplen):
+    """Compile a tcpdump filter expression to BPF instructions"""
+    result = subprocess.run(
+        ['tcpdump', '-ddd', '-s', str(snaplen), expression],
+        capture_output=True, text=True, timeout=10, check=True
+    )
+    lines = result.stdout.split('\n')
+    count = int(lines[0])
+    return [tuple(int(x) for x in line.split()) for line in lines[1:count + 1]]
+
+
+class AFPacketCapture:
+    """Raw frame capture from one interface with a kernel-side BPF filter"""
+
+    def __init__(self, interface, bpf_expression=None, snaplen=2048, rcvbuf=8 * 1024 * 1024):
+        self.interface = interface
+        self.snaplen = snaplen
+        self.sock = socket.socket(socket.AF_PACKET, socket.SOCK_RAW, socket.htons(ETH_P_ALL))
+        try:
+            self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, rcvbuf)
+        except OSError:
+            pass
+
+        program = default_filter(snaplen)
+        if bpf_expression:
+            try:
+                program = compile_filter(bpf_expression, snaplen)
+            except (OSError, ValueError, subprocess.SubprocessError) as e:
+                print(f"Cannot compile BPF '{bpf_expression}' ({e}), capturing IPv4 only")
+        self._attach_filter(program)
+        self.sock.bind((interface, 0))
+
+    def _attach_filter(self, program):
+        code = b''.join(BPF_INSN.pack(*insn) for insn in program)
+        # Keep the buffer referenced for the lifetime of the socket
+        self._filter = ctypes.create_string_buffer(code)
+        fprog = struct.pack('HL', len(program), ctypes.addressof(self._filter))
+        self.sock.setsockopt(socket.SOL_SOCKET, SO_ATTACH_FILTER, fprog)
+
+    def frames(self):
+        """
+        Yield (timestamp, memoryview, length) for each received frame.
+
+        The memoryview aliases a reused buffer and is only valid until the
+        next frame is requested.
+        """
+        buffer = bytearray(self.snaplen)
+        view = memoryview(buffer)
+        recv_into = self.sock.recv_into
+        while True:
+            length = recv_into(buffer)
+            yield time.time(), view, length
+
+    def close(self):
+        self.sock.close()
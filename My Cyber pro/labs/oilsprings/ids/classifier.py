@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+OilSprings IDS Protocol Classifier
+Table-driven OT protocol classification by port and payload signature
+
+Each protocol in the table may list TCP/UDP ports (matched in either
+direction) and the name of a payload signature from SIGNATURES, which
+recognises the protocol on non-standard ports. A flow is classified from
+its ports on the first packet, or from the first payloads that carry data;
+the result is cached on the flow, so the per-packet cost is one attribute
+read once a flow is decided.
+"""
+
+import struct
+
+TCP = 6
+UDP = 17
+
+# Payload packets inspected before an unrecognised flow is settled as 'other'
+PROBE_PACKETS = 3
+
+UINT16_LE = struct.Struct('<H')
+UINT32_LE = struct.Struct('<I')
+
+DEFAULT_PROTOCOLS = [
+    {'name': 'modbus', 'tcp_ports': [502], 'signature': 'modbus'},
+    {'name': 's7', 'tcp_ports': [102], 'signature': 's7comm'},
+    {'name': 'opcua', 'tcp_ports': [4840], 'signature': 'opcua'},
+]
+
+OPCUA_MESSAGES = frozenset((b'HEL', b'ACK', b'OPN', b'MSG', b'CLO', b'ERR', b'RHE'))
+ENIP_COMMANDS = frozenset((0x0001, 0x0004, 0x0063, 0x0064, 0x0065, 0x0066, 0x006F, 0x0070))
+
+
+def modbus_signature(payload, offset, end):
+    """MBAP header: protocol id 0 and a plausible length"""
+    if end - offset < 8:
+        return False
+    length = (payload[offset + 4] << 8) | payload[offset + 5]
+    return payload[offset + 2] == 0 and payload[offset + 3] == 0 and 2 <= length <= 254
+
+
+def s7comm_signature(payload, offset, end):
+    """TPKT v3 + COTP carrying S7 (data with protocol id 0x32, or a TSAP connect)"""
+    if end - offset < 8 or payload[offset] != 0x03 or payload[offset + 1] != 0x00:
+        return False
+    pdu_type = payload[offset + 5]
+    if pdu_type == 0xF0:
+        return payload[offset + 7] == 0x32
+    if pdu_type in (0xE0, 0xD0):
+        # ISO-TSAP parameters, which RDP's connection request does not carry
+        return end - offset > 11 and payload[offset + 11] in (0xC0, 0xC1, 0xC2)
+    return False
+
+
+def opcua_signature(payload, offset, end):
+    """OPC UA binary: message type, chunk type and message size"""
+    if end - offset < 8:
+        return False
+    return (bytes(payload[offset:offset + 3]) in OPCUA_MESSAGES
+            and payload[offset + 3] in b'FCA'
+            and UINT32_LE.unpack_from(payload, offset + 4)[0] >= 8)
+
+
+def dnp3_signature(payload, offset, end):
+    """DNP3 link layer start bytes 0x0564"""
+    return (end - offset >= 10 and payload[offset] == 0x05
+            and payload[offset + 1] == 0x64 and payload[offset + 2] >= 5)
+
+
+def enip_signature(payload, offset, end):
+    """EtherNet/IP encapsulation: known command and zero options"""
+    if end - offset < 24:
+        return False
+    return (UINT16_LE.unpack_from(payload, offset)[0] in ENIP_COMMANDS
+            and UINT32_LE.unpack_from(payload, offset + 20)[0] == 0)
+
+
+def bacnet_signature(payload, offset, end):
+    """BACnet/IP BVLC header"""
+    if end - offset < 4 or payload[offset] != 0x81 or payload[offset + 1] > 0x0B:
+        return False
+    length = (payload[offset + 2] << 8) | payload[offset + 3]
+    return 4 <= length <= end - offset
+
+
+SIGNATURES = {
+    'modbus': (modbus_signature, (TCP,)),
+    's7comm': (s7comm_signature, (TCP,)),
+    'opcua': (opcua_signature, (TCP,)),
+    'dnp3': (dnp3_signature, (TCP, UDP)),
+    'enip': (enip_signature, (TCP, UDP)),
+    'bacnet': (bacnet_signature, (UDP,)),
+}
+
+
+class Classifier:
+    """Classifies flows from a protocol table (see DEFAULT_PROTOCOLS)"""
+
+    def __init__(self, protocols=None):
+        protocols = DEFAULT_PROTOCOLS if protocols is None else protocols
+        self.names = [protocol['name'] for protocol in protocols] + ['other']
+        self.ports = {TCP: {}, UDP: {}}
+        self.signatures = {TCP: [], UDP: []}
+        for protocol in protocols:
+            name = protocol['name']
+            for port in protocol.get('tcp_ports', ()):
+                self.ports[TCP].setdefault(int(port), name)
+            for port in protocol.get('udp_ports', ()):
+                self.ports[UDP].setdefault(int(port), name)
+            signature = protocol.get('signature')
+            if signature:
+                if signature not in SIGNATURES:
+                    raise ValueError(f"Unknown signature '{signature}' for protocol '{name}'")
+                matcher, transports = SIGNATURES[signature]
+                for transport in transports:
+                    self.signatures[transport].append((name, matcher))
+
+    def classify(self, flow, transport, sport, dport, payload, offset, end):
+        """
+        Protocol name of a packet whose flow is not classified yet.
+
+        Sets flow.protocol once the protocol is known, or once PROBE_PACKETS
+        payloads have matched nothing.
+        """
+        ports = self.ports.get(transport)
+        if ports is None:
+            flow.protocol = 'other'
+            return 'other'
+        # The destination port of the first packet is usually the server's
+        name = ports.get(dport) or ports.get(sport)
+        if name is None:
+            if end <= offset:
+                return 'other'
+            for candidate, matcher in self.signatures[transport]:
+                if matcher(payload, offset, end):
+                    name = candidate
+                    break
+            else:
+                flow.probes += 1
+                if flow.probes >= PROBE_PACKETS:
+                    flow.protocol = 'other'
+                return 'other'
+        flow.protocol = name
+        return name
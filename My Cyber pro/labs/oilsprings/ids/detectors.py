@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+"""
+OilSprings IDS Detectors
+Fixed-memory streaming detectors for heavy talkers, scans and floods
+
+- Heavy talkers: a count-min sketch of bytes per source plus a top-K table
+- Scans: a HyperLogLog of distinct (destination, port) targets per source,
+  for at most max_sources recently active sources
+- Floods: an EWMA baseline of packets per second for each protocol
+
+Counts are kept per window; memory does not grow with the number of hosts
+or ports seen.
+"""
+
+from array import array
+from collections import OrderedDict, deque
+import math
+
+TCP = 6
+UDP = 17
+SYN = 0x02
+ACK = 0x10
+HASH_MASK = (1 << 64) - 1
+
+
+class CountMinSketch:
+    def __init__(self, width=2048, depth=4):
+        self.width = width
+        self.depth = depth
+        self.rows = [array('Q', bytes(8 * width)) for _ in range(depth)]
+
+    def add(self, key, count=1):
+        """Add count to key and return its new estimate"""
+        width = self.width
+        estimate = None
+        for i, row in enumerate(self.rows):
+            index = hash((i, key)) % width
+            value = row[index] + count
+            row[index] = value
+            if estimate is None or value < estimate:
+                estimate = value
+        return estimate
+
+    def clear(self):
+        for row in self.rows:
+            row[:] = array('Q', bytes(8 * self.width))
+
+
+class TopK:
+    """The k largest keys by sketch estimate"""
+
+    def __init__(self, k=20):
+        self.k = k
+        self.counts = {}
+        self.minimum = 0
+
+    def offer(self, key, estimate):
+        counts = self.counts
+        if key in counts:
+            counts[key] = estimate
+        elif len(counts) < self.k:
+            counts[key] = estimate
+        elif estimate > self.minimum:
+            del counts[min(counts, key=counts.get)]
+            counts[key] = estimate
+        else:
+            return
+        if len(counts) == self.k:
+            self.minimum = min(counts.values())
+
+    def items(self):
+        return sorted(self.counts.items(), key=lambda item: item[1], reverse=True)
+
+    def clear(self):
+        self.counts = {}
+        self.minimum = 0
+
+
+class HyperLogLog:
+    __slots__ = ('registers', 'estimate')
+
+    PRECISION = 8
+    SIZE = 1 << PRECISION
+    ALPHA = 0.7213 / (1 + 1.079 / SIZE)
+
+    def __init__(self):
+        self.registers = bytearray(self.SIZE)
+        self.estimate = 0
+
+    def add(self, key):
+        """Add key; returns True when the estimate changed"""
+        h = hash((key, 0x9E3779B97F4A7C15)) & HASH_MASK
+        index = h & (self.SIZE - 1)
+        rank = 64 - self.PRECISION - (h >> self.PRECISION).bit_length() + 1
+        if rank <= self.registers[index]:
+            return False
+        self.registers[index] = rank
+        self.estimate = self._estimate()
+        return True
+
+    def _estimate(self):
+        size = self.SIZE
+        estimate = self.ALPHA * size * size / sum(2.0 ** -r for r in self.registers)
+        if estimate <= 2.5 * size:
+            zeros = self.registers.count(0)
+            if zeros:
+                estimate = size * math.log(size / zeros)
+        return int(estimate)
+
+
+class RateBaseline:
+    """EWMA mean and variance of a per-second rate"""
+
+    __slots__ = ('mean', 'variance', 'samples')
+
+    def __init__(self):
+        self.mean = 0.0
+        self.variance = 0.0
+        self.samples = 0
+
+    def update(self, value, alpha):
+        if self.samples == 0:
+            self.mean = value
+        else:
+            delta = value - self.mean
+            self.mean += alpha * delta
+            self.variance = (1 - alpha) * (self.variance + alpha * delta * delta)
+        self.samples += 1
+
+
+class Detectors:
+    def __init__(self, protocols, window=60, top_k=20, heavy_hitter_bytes=50_000_000,
+                 scan_targets=100, max_sources=4096, rate_alpha=0.05, rate_sigma=4.0,
+                 rate_min_pps=100, rate_warmup=30, max_alerts=500):
+        self.window = window
+        self.heavy_hitter_bytes = heavy_hitter_bytes
+        self.scan_targets = scan_targets
+        self.max_sources = max_sources
+        self.rate_alpha = rate_alpha
+        self.rate_sigma = rate_sigma
+        self.rate_min_pps = rate_min_pps
+        self.rate_warmup = rate_warmup
+
+        self.sketch = CountMinSketch()
+        self.top = TopK(top_k)
+        self.previous_top = []
+        self.scanners = OrderedDict()
+        self.baselines = {protocol: RateBaseline() for protocol in protocols}
+        self.second_counts = dict.fromkeys(protocols, 0)
+        self.last_rates = dict.fromkeys(protocols, 0)
+        self.window_start = None
+        self.second = None
+        # (type, key) -> window start when last raised, reset every window
+        self.raised = {}
+        self.alerts = deque(maxlen=max_alerts)
+        self.alert_seq = 0
+
+    def observe(self, ts, src, dst, transport, sport, dport, length, tcp_flags, protocol):
+        second = int(ts)
+        if second != self.second:
+            self._tick(second)
+
+        estimate = self.sketch.add(src, length)
+        self.top.offer(src, estimate)
+        if estimate >= self.heavy_hitter_bytes:
+            self._raise(ts, 'heavy_talker', src, 'medium',
+                        f'{src} sent {estimate:,} bytes in {self.window}s', bytes=estimate)
+
+        # Connection attempts only: TCP SYN, or UDP towards the lower (service) port
+        if ((transport == TCP and tcp_flags is not None and tcp_flags & (SYN | ACK) == SYN)
+                or (transport == UDP and dport is not None and dport <= sport)):
+            hll = self.scanners.get(src)
+            if hll is None:
+                if len(self.scanners) >= self.max_sources:
+                    self.scanners.popitem(last=False)
+                hll = self.scanners[src] = HyperLogLog()
+            else:
+                self.scanners.move_to_end(src)
+            if hll.add((dst, dport)) and hll.estimate >= self.scan_targets:
+                self._raise(ts, 'scan', src, 'high',
+                            f'{src} probed about {hll.estimate} distinct host:port targets in {self.window}s',
+                            targets=hll.estimate)
+
+        self.second_counts[protocol] += 1
+
+    def _tick(self, second):
+        """Close the previous second(s) and, when due, the window"""
+        if self.second is not None and second > self.second:
+            # Seconds without packets count as zero, up to one window
+            for _ in range(min(second - self.second, self.window)):
+                for protocol, count in self.second_counts.items():
+                    self._check_rate(second, protocol, count)
+                    self.second_counts[protocol] = 0
+        self.second = second
+
+        if self.window_start is None:
+            self.window_start = second
+        elif second - self.window_start >= self.window:
+            self.previous_top = self.top.items()
+            self.sketch.clear()
+            self.top.clear()
+            self.scanners.clear()
+            self.raised.clear()
+            self.window_start = second
+
+    def _check_rate(self, ts, protocol, count):
+        self.last_rates[protocol] = count
+        baseline = self.baselines[protocol]
+        if baseline.samples >= self.rate_warmup and count >= self.rate_min_pps:
+            threshold = baseline.mean + self.rate_sigma * math.sqrt(baseline.variance)
+            if count > threshold:
+                self._raise(ts, 'flood', protocol, 'high',
+                            f'{protocol} at {count} pps, baseline {baseline.mean:.0f} pps',
+                            pps=count, baseline=round(baseline.mean, 1))
+                # Keep the flood out of the baseline it is measured against
+                return
+        baseline.update(count, self.rate_alpha)
+
+    def _raise(self, ts, kind, key, severity, message, **details):
+        if (kind, key) in self.raised:
+            return
+        self.raised[(kind, key)] = self.window_start
+        self.alert_seq += 1
+        alert = {'id': self.alert_seq, 'timestamp': ts, 'type': kind, 'severity': severity,
+                 'source': key, 'message': message}
+        alert.update(details)
+        self.alerts.append(alert)
+
+    def alerts_since(self, cursor):
+        """Alerts with id > cursor, oldest first"""
+        return [alert for alert in self.alerts if alert['id'] > cursor]
+
+    def import_alerts(self, alerts):
+        """Append alerts raised elsewhere (pipeline workers), renumbering them"""
+        for alert in alerts:
+            self.alert_seq += 1
+            alert['id'] = self.alert_seq
+            self.alerts.append(alert)
+
+    def snapshot(self):
+        return {
+            'heavy_hitters': [{'src': src, 'bytes': count} for src, count in self.top.items()],
+            'previous_heavy_hitters': [{'src': src, 'bytes': count} for src, count in self.previous_top],
+            'tracked_sources': len(self.scanners),
+            'rates': {
+                protocol: {'pps': self.last_rates[protocol],
+                           'baseline': round(baseline.mean, 1),
+                           'stddev': round(math.sqrt(baseline.variance), 1)}
+                for protocol, baseline in self.baselines.items()
+            }
+        }
+
+
+def merge_snapshots(snapshots, top_k=20):
+    """Combine detector snapshots from several pipeline workers"""
+    merged = {'heavy_hitters': [], 'previous_heavy_hitters': [], 'tracked_sources': 0, 'rates': {}}
+    for key in ('heavy_hitters', 'previous_heavy_hitters'):
+        totals = {}
+        for snapshot in snapshots:
+            for entry in snapshot[key]:
+                totals[entry['src']] = totals.get(entry['src'], 0) + entry['bytes']
+        merged[key] = [{'src': src, 'bytes': count}
+                       for src, count in sorted(totals.items(), key=lambda item: item[1], reverse=True)[:top_k]]
+    for snapshot in snapshots:
+        merged['tracked_sources'] += snapshot['tracked_sources']
+        for protocol, rate in snapshot['rates'].items():
+            total = merged['rates'].setdefault(protocol, {'pps': 0, 'baseline': 0.0, 'stddev': 0.0})
+            total['pps'] += rate['pps']
+            total['baseline'] = round(total['baseline'] + rate['baseline'], 1)
+            total['stddev'] = round(math.hypot(total['stddev'], rate['stddev']), 1)
+    return merged
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+OilSprings IDS Flow Table
+Bidirectional flows keyed on the normalized 5-tuple
+"""
+
+from collections import OrderedDict, deque
+from heapq import nlargest
+
+TCP_FLAG_NAMES = 'FSRPAUEC'
+
+
+def flag_string(flags):
+    return ''.join(name for bit, name in enumerate(TCP_FLAG_NAMES) if flags & (1 << bit))
+
+
+class Flow:
+    """
+    One conversation; the first packet seen defines the forward direction.
+
+    `protocol` is None until the classifier has decided it.
+    """
+
+    __slots__ = ('src', 'dst', 'sport', 'dport', 'transport', 'protocol', 'probes',
+                 'first_seen', 'last_seen', 'packets_fwd', 'packets_rev',
+                 'bytes_fwd', 'bytes_rev', 'tcp_flags')
+
+    def __init__(self, ts, src, dst, sport, dport, transport):
+        self.src = src
+        self.dst = dst
+        self.sport = sport
+        self.dport = dport
+        self.transport = transport
+        self.protocol = None
+        self.probes = 0
+        self.first_seen = ts
+        self.last_seen = ts
+        self.packets_fwd = 0
+        self.packets_rev = 0
+        self.bytes_fwd = 0
+        self.bytes_rev = 0
+        self.tcp_flags = 0
+
+    @property
+    def packets(self):
+        return self.packets_fwd + self.packets_rev
+
+    @property
+    def bytes(self):
+        return self.bytes_fwd + self.bytes_rev
+
+    def to_dict(self):
+        return {
+            'src': self.src,
+            'dst': self.dst,
+            'sport': self.sport,
+            'dport': self.dport,
+            'transport': self.transport,
+            'protocol': self.protocol or 'other',
+            'first_seen': self.first_seen,
+            'last_seen': self.last_seen,
+            'duration': self.last_seen - self.first_seen,
+            'packets': self.packets,
+            'bytes': self.bytes,
+            'packets_fwd': self.packets_fwd,
+            'packets_rev': self.packets_rev,
+            'bytes_fwd': self.bytes_fwd,
+            'bytes_rev': self.bytes_rev,
+            'tcp_flags': flag_string(self.tcp_flags)
+        }
+
+
+class FlowTable:
+    """
+    Active flows in least-recently-seen order.
+
+    A flow ends when it has been idle for `idle_timeout`, when it has been
+    open for `active_timeout` (long conversations are reported in slices),
+    or when the table is full and it is the least recently seen.
+    """
+
+    def __init__(self, idle_timeout=60.0, active_timeout=300.0, max_flows=50000, finished=1000):
+        self.idle_timeout = idle_timeout
+        self.active_timeout = active_timeout
+        self.max_flows = max_flows
+        self.flows = OrderedDict()
+        self.finished = deque(maxlen=finished)
+        self.next_expiry = 0.0
+        self.stats = {'created': 0, 'expired_idle': 0, 'expired_active': 0, 'evicted': 0}
+
+    def __len__(self):
+        return len(self.flows)
+
+    def update(self, ts, src, dst, sport, dport, transport, length, tcp_flags=None):
+        if (src, sport) <= (dst, dport):
+            key = (transport, src, sport, dst, dport)
+        else:
+            key = (transport, dst, dport, src, sport)
+
+        flow = self.flows.get(key)
+        if flow is not None and ts - flow.first_seen >= self.active_timeout:
+            self._finish(key, 'expired_active')
+            flow = None
+        if flow is None:
+            if len(self.flows) >= self.max_flows:
+                self._finish(next(iter(self.flows)), 'evicted')
+            flow = self.flows[key] = Flow(ts, src, dst, sport, dport, transport)
+            self.stats['created'] += 1
+        else:
+            self.flows.move_to_end(key)
+
+        flow.last_seen = ts
+        if src == flow.src and sport == flow.sport:
+            flow.packets_fwd += 1
+            flow.bytes_fwd += length
+        else:
+            flow.packets_rev += 1
+            flow.bytes_rev += length
+        if tcp_flags:
+            flow.tcp_flags |= tcp_flags
+
+        if ts >= self.next_expiry:
+            self.expire(ts)
+        return flow
+
+    def _finish(self, key, reason):
+        self.finished.append(self.flows.pop(key))
+        self.stats[reason] += 1
+
+    def expire(self, now):
+        """End flows idle for longer than idle_timeout (oldest first)"""
+        cutoff = now - self.idle_timeout
+        flows = self.flows
+        while flows:
+            key, flow = next(iter(flows.items()))
+            if flow.last_seen >= cutoff:
+                break
+            self._finish(key, 'expired_idle')
+        self.next_expiry = now + 1.0
+
+    def top(self, n=20, by='bytes', include_finished=False):
+        flows = list(self.flows.values())
+        if include_finished:
+            flows.extend(self.finished)
+        return nlargest(n, flows, key=lambda flow: getattr(flow, by))
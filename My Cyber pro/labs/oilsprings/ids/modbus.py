@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+"""
+OilSprings IDS Modbus/TCP Inspection
+MBAP/PDU decoding with request/response matching per flow
+
+Decoding reads fields straight from the captured frame (bytes or
+memoryview) with struct; per packet it only updates counters and the
+pending-request table. Segments are inspected one at a time, so an ADU
+split across TCP segments is counted as truncated rather than reassembled.
+"""
+
+from collections import OrderedDict, deque
+import struct
+
+MODBUS_PORT = 502
+MBAP = struct.Struct('!HHHBB')
+RANGE = struct.Struct('!HH')
+
+FUNCTION_CODES = {
+    1: 'read_coils',
+    2: 'read_discrete_inputs',
+    3: 'read_holding_registers',
+    4: 'read_input_registers',
+    5: 'write_single_coil',
+    6: 'write_single_register',
+    7: 'read_exception_status',
+    8: 'diagnostics',
+    15: 'write_multiple_coils',
+    16: 'write_multiple_registers',
+    17: 'report_server_id',
+    22: 'mask_write_register',
+    23: 'read_write_multiple_registers',
+    43: 'encapsulated_interface'
+}
+WRITE_CODES = frozenset((5, 6, 15, 16, 22, 23))
+
+
+def function_name(code):
+    return FUNCTION_CODES.get(code, f'fc_{code}')
+
+
+def request_range(code, pdu, offset, end):
+    """(address, quantity) addressed by a request PDU, or (None, 0)"""
+    if code in (1, 2, 3, 4, 15, 16) and end - offset >= 4:
+        return RANGE.unpack_from(pdu, offset)
+    if code in (5, 6, 22) and end - offset >= 4:
+        return RANGE.unpack_from(pdu, offset)[0], 1
+    if code == 23 and end - offset >= 8:
+        # Report the written range of a read/write request
+        return RANGE.unpack_from(pdu, offset + 4)
+    return None, 0
+
+
+class ModbusTracker:
+    """
+    Per-server Modbus counters and response latency.
+
+    Requests are remembered by (client, client port, server, transaction id)
+    until the matching response arrives or `timeout` seconds pass.
+    """
+
+    def __init__(self, timeout=5.0, max_pending=10000, recent=200):
+        self.timeout = timeout
+        self.max_pending = max_pending
+        self.pending = OrderedDict()
+        # (server, unit, code) -> [requests, lowest address, highest address]
+        self.requests = {}
+        # (server, code, exception code) -> count
+        self.exceptions = {}
+        # server -> [responses, total seconds, max seconds]
+        self.latency = {}
+        self.recent_writes = deque(maxlen=recent)
+        self.stats = {'requests': 0, 'responses': 0, 'unmatched': 0, 'timeouts': 0,
+                      'malformed': 0, 'truncated': 0}
+
+    def process(self, ts, src, dst, sport, dport, payload, offset, end, server_port=MODBUS_PORT):
+        """Decode every ADU in payload[offset:end]; server_port tells requests from responses"""
+        while end - offset >= MBAP.size:
+            tid, protocol_id, length, unit, code = MBAP.unpack_from(payload, offset)
+            if protocol_id != 0 or length < 2:
+                self.stats['malformed'] += 1
+                return
+            adu_end = offset + 6 + length
+            if adu_end > end:
+                self.stats['truncated'] += 1
+                adu_end = end
+            data = offset + MBAP.size
+            if dport == server_port:
+                self._request(ts, src, sport, dst, tid, unit, code, payload, data, adu_end)
+            elif sport == server_port:
+                self._response(ts, dst, dport, src, tid, code, payload, data, adu_end)
+            offset = adu_end
+
+    def _request(self, ts, client, client_port, server, tid, unit, code, payload, data, end):
+        self.stats['requests'] += 1
+        address, quantity = request_range(code, payload, data, end)
+        key = (server, unit, code)
+        counter = self.requests.get(key)
+        if counter is None:
+            counter = self.requests[key] = [0, None, None]
+        counter[0] += 1
+        if address is not None:
+            if counter[1] is None or address < counter[1]:
+                counter[1] = address
+            last = address + max(quantity, 1) - 1
+            if counter[2] is None or last > counter[2]:
+                counter[2] = last
+        if code in WRITE_CODES:
+            self.recent_writes.append((ts, client, server, unit, code, address, quantity))
+
+        pending = self.pending
+        pending[(client, client_port, server, tid)] = ts
+        if len(pending) >= self.max_pending or next(iter(pending.values())) < ts - self.timeout:
+            self.expire(ts)
+
+    def _response(self, ts, client, client_port, server, tid, code, payload, data, end):
+        self.stats['responses'] += 1
+        if code & 0x80:
+            exception = payload[data] if data < end else 0
+            key = (server, code & 0x7F, exception)
+            self.exceptions[key] = self.exceptions.get(key, 0) + 1
+
+        sent = self.pending.pop((client, client_port, server, tid), None)
+        if sent is None:
+            self.stats['unmatched'] += 1
+            return
+        elapsed = max(ts - sent, 0.0)
+        latency = self.latency.get(server)
+        if latency is None:
+            latency = self.latency[server] = [0, 0.0, 0.0]
+        latency[0] += 1
+        latency[1] += elapsed
+        if elapsed > latency[2]:
+            latency[2] = elapsed
+
+    def expire(self, now):
+        """Drop requests that have waited longer than timeout (or over the cap)"""
+        pending = self.pending
+        cutoff = now - self.timeout
+        while pending:
+            key, sent = next(iter(pending.items()))
+            if sent >= cutoff and len(pending) < self.max_pending:
+                break
+            del pending[key]
+            self.stats['timeouts'] += 1
+
+    def snapshot(self):
+        """JSON-serializable view of the counters"""
+        servers = {}
+
+        def server_entry(server):
+            entry = servers.get(server)
+            if entry is None:
+                entry = servers[server] = {'function_codes': {}, 'exceptions': {}}
+            return entry
+
+        for (server, unit, code), (count, low, high) in self.requests.items():
+            codes = server_entry(server)['function_codes']
+            name = function_name(code)
+            entry = codes.get(name)
+            if entry is None:
+                entry = codes[name] = {'requests': 0, 'units': [], 'low': None, 'high': None}
+            entry['requests'] += count
+            entry['units'].append(unit)
+            if low is not None:
+                entry['low'] = low if entry['low'] is None else min(entry['low'], low)
+                entry['high'] = high if entry['high'] is None else max(entry['high'], high)
+        for (server, code, exception), count in self.exceptions.items():
+            key = f'{function_name(code)}:{exception}'
+            server_entry(server)['exceptions'][key] = count
+        for server, (count, total, maximum) in self.latency.items():
+            server_entry(server)['latency'] = {
+                'responses': count,
+                'total_ms': total * 1000,
+                'avg_ms': total * 1000 / count,
+                'max_ms': maximum * 1000
+            }
+
+        return {
+            'stats': dict(self.stats, pending=len(self.pending)),
+            'servers': servers,
+            'recent_writes': [
+                {'timestamp': ts, 'src': client, 'dst': server, 'unit': unit,
+                 'function': function_name(code), 'address': address, 'quantity': quantity}
+                for ts, client, server, unit, code, address, quantity in self.recent_writes
+            ]
+        }
+
+
+def merge_snapshots(snapshots):
+    """Combine snapshots from several trackers (one per pipeline worker)"""
+    merged = {'stats': {}, 'servers': {}, 'recent_writes': []}
+    for snapshot in snapshots:
+        for key, value in snapshot['stats'].items():
+            merged['stats'][key] = merged['stats'].get(key, 0) + value
+        merged['recent_writes'].extend(snapshot['recent_writes'])
+        for server, entry in snapshot['servers'].items():
+            target = merged['servers'].setdefault(server, {'function_codes': {}, 'exceptions': {}})
+            for name, codes in entry['function_codes'].items():
+                current = target['function_codes'].get(name)
+                if current is None:
+                    target['function_codes'][name] = dict(codes, units=list(codes['units']))
+                    continue
+                current['requests'] += codes['requests']
+                current['units'] = sorted(set(current['units']) | set(codes['units']))
+                for bound, pick in (('low', min), ('high', max)):
+                    if codes[bound] is not None:
+                        current[bound] = codes[bound] if current[bound] is None else pick(current[bound], codes[bound])
+            for key, count in entry['exceptions'].items():
+                target['exceptions'][key] = target['exceptions'].get(key, 0) + count
+            if 'latency' in entry:
+                latency = target.setdefault('latency', {'responses': 0, 'total_ms': 0.0, 'max_ms': 0.0})
+                latency['responses'] += entry['latency']['responses']
+                latency['total_ms'] += entry['latency']['total_ms']
+                latency['max_ms'] = max(latency['max_ms'], entry['latency']['max_ms'])
+                latency['avg_ms'] = latency['total_ms'] / latency['responses']
+    merged['recent_writes'].sort(key=lambda write: write['timestamp'])
+    return merged
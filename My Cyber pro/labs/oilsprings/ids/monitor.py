@@ -5,91 +5,543 @@ Real-time network traffic monitoring for OT/ICS protocols
 """
 
 from scapy.all import sniff, IP, TCP, UDP
-from flask import Flask, render_template, jsonify
+from flask import Flask, Response, render_template, jsonify, request
 from flask_cors import CORS
-from threading import Thread
-from collections import deque
+from threading import Lock, Thread
+from capture import LINK_HEADERS, AFPacketCapture, parse_frame
+from classifier import Classifier
+from detectors import Detectors, merge_snapshots as merge_detector_snapshots
+from flows import FlowTable
+from heapq import nlargest
+from modbus import ModbusTracker, merge_snapshots as merge_modbus_snapshots
+from packet_ring import PacketRing, ReorderBuffer
+from pcap_reader import LINKTYPE_ETHERNET, read_pcap
+from pipeline import REPORT_INTERVAL, Pipeline
+from shipper import EventShipper
+import argparse
+import atexit
+import json
 import time
 import os
 
 app = Flask(__name__)
 CORS(app)
 
-# Store recent packets
-packets_buffer = deque(maxlen=1000)
-protocol_stats = {
-    'modbus': 0,
-    's7': 0,
-    'opcua': 0,
-    'other': 0
-}
-
-def detect_protocol(packet):
-    """Detect industrial protocol from packet"""
-    if TCP in packet:
-        port = packet[TCP].dport
-        if port == 502:
-            return 'modbus'
-        elif port == 102:
-            return 's7'
-        elif port == 4840:
-            return 'opcua'
-    return 'other'
+CONFIG_PATH = os.getenv('MONITOR_CONFIG', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'config.json'))
+
+def load_config():
+    """Load IDS configuration"""
+    try:
+        with open(CONFIG_PATH, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+config = load_config()
+
+# Protocols to classify, from the 'protocols' table in config.json
+classifier = Classifier(config.get('protocols'))
+
+# Store recent packets; written only by the capture thread, read without locking
+packet_ring = PacketRing(int(os.getenv('MONITOR_PACKET_BUFFER', '100000')), classifier.names)
+# Guards the analysis state below
+packets_lock = Lock()
+protocol_stats = {name: 0 for name in classifier.names}
+
+# Conversations, updated under packets_lock
+flow_table = FlowTable(
+    idle_timeout=float(os.getenv('MONITOR_FLOW_IDLE', '60')),
+    active_timeout=float(os.getenv('MONITOR_FLOW_ACTIVE', '300')),
+    max_flows=int(os.getenv('MONITOR_MAX_FLOWS', '50000'))
+)
+
+# Modbus/TCP requests, responses and latency, updated under packets_lock
+modbus_tracker = ModbusTracker()
+
+# Heavy talker, scan and flood detection, updated under packets_lock
+detectors = Detectors(classifier.names, **config.get('detectors', {}))
+
+# Multi-process capture, started when MONITOR_WORKERS > 0
+pipeline = None
+# Latest flow, Modbus and detector snapshots from each pipeline worker, keyed by pid
+worker_snapshots = {}
+REPORT_FLOWS = 200
+REPORT_PACKETS = 20000
+FLOW_REPORT_INTERVAL = 1.0
+report_cursor = 0
+alert_cursor = 0
+# Worker packet batches, merged in timestamp order before they reach packet_ring
+packet_reorder = None
+next_flow_report = 0.0
+
+# Alerts and periodic summaries sent to the collector when syslog_enabled is set
+shipper = None
+if config.get('syslog_enabled'):
+    syslog_ip = config.get('syslog_ip')
+    if config.get('ship_transport', 'http') == 'syslog':
+        if syslog_ip:
+            shipper = EventShipper(syslog_address=(syslog_ip, int(config.get('syslog_port', 514))),
+                                   syslog_protocol=config.get('ship_protocol', 'tcp'),
+                                   rate=config.get('ship_rate', 100))
+    else:
+        collector_url = config.get('collector_url') or (syslog_ip and f"http://{syslog_ip}:5000")
+        if collector_url:
+            shipper = EventShipper(url=collector_url, rate=config.get('ship_rate', 100))
+    if shipper is None:
+        print("Event shipping disabled: config.json has no syslog_ip")
+SUMMARY_INTERVAL = float(config.get('summary_interval', 60))
+ALERT_LEVELS = {'high': 'critical', 'medium': 'warning', 'low': 'info'}
+
+# Capture file replays run on the file's clock; None when capturing live
+replay_time = None
+
+def analysis_time():
+    """Current time as seen by the traffic being analysed"""
+    return time.time() if replay_time is None else replay_time
+
+def record_packet(timestamp, src, dst, transport, sport, dport, length,
+                  tcp_flags=None, payload=b'', offset=0, end=0):
+    """
+    Add a packet to its flow, classify it (once per flow), count it, add
+    it to the packet ring and feed Modbus payloads to the tracker, on any
+    port the classifier recognised Modbus. Returns the protocol name.
+    """
+    with packets_lock:
+        flow = flow_table.update(timestamp, src, dst, sport or 0, dport or 0,
+                                 transport, length, tcp_flags)
+        protocol = flow.protocol
+        if protocol is None:
+            protocol = classifier.classify(flow, transport, sport, dport, payload, offset, end)
+        protocol_stats[protocol] += 1
+        detectors.observe(timestamp, src, dst, transport, sport, dport, length, tcp_flags, protocol)
+        packet_ring.append(timestamp, src, dst, protocol, length, sport, dport, transport)
+        if protocol == 'modbus' and transport == 6 and end > offset:
+            modbus_tracker.process(timestamp, src, dst, sport, dport, payload, offset, end,
+                                   modbus_server_port(flow, sport, dport))
+    return protocol
+
+def modbus_server_port(flow, sport, dport):
+    """The server side of a Modbus flow: a configured Modbus port, else the first packet's destination"""
+    ports = classifier.ports[6]
+    if ports.get(dport) == 'modbus':
+        return dport
+    if ports.get(sport) == 'modbus':
+        return sport
+    return flow.dport
 
 def packet_callback(packet):
     """Process captured packets"""
     if IP in packet:
-        protocol = detect_protocol(packet)
-        protocol_stats[protocol] += 1
-        
-        packet_info = {
-            'timestamp': time.time(),
-            'src': packet[IP].src,
-            'dst': packet[IP].dst,
-            'protocol': protocol,
-            'length': len(packet)
-        }
-        
+        timestamp = time.time()
+        src, dst = packet[IP].src, packet[IP].dst
+        sport = dport = tcp_flags = None
+        payload = b''
         if TCP in packet:
-            packet_info['sport'] = packet[TCP].sport
-            packet_info['dport'] = packet[TCP].dport
+            layer = packet[TCP]
+            sport, dport, tcp_flags = layer.sport, layer.dport, int(layer.flags)
+            payload = bytes(layer.payload)
         elif UDP in packet:
-            packet_info['sport'] = packet[UDP].sport
-            packet_info['dport'] = packet[UDP].dport
-            
-        packets_buffer.append(packet_info)
+            layer = packet[UDP]
+            sport, dport = layer.sport, layer.dport
+            payload = bytes(layer.payload)
+        record_packet(timestamp, src, dst, packet[IP].proto, sport, dport, len(packet),
+                      tcp_flags, payload, 0, len(payload))
+
+def frame_callback(timestamp, frame, length, linktype=LINKTYPE_ETHERNET):
+    """Process a raw Ethernet frame from the AF_PACKET engine (or a capture file)"""
+    parsed = parse_frame(frame, length, linktype)
+    if parsed is None:
+        return
+    record_packet(timestamp, parsed.src, parsed.dst, parsed.proto, parsed.sport, parsed.dport,
+                  parsed.length, parsed.tcp_flags, frame, parsed.payload_offset, parsed.end)
+
+def worker_report():
+    """
+    Runs in a pipeline worker: protocol counts and packets since the last
+    report, plus the worker's largest flows about once a second.
+    """
+    global report_cursor, alert_cursor, next_flow_report
+    report = {'worker': os.getpid(), 'stats': {}}
+    for protocol, count in protocol_stats.items():
+        if count:
+            report['stats'][protocol] = count
+            protocol_stats[protocol] = 0
+    # Packet columns since the last report, newest REPORT_PACKETS if behind
+    first, report['packets'] = packet_ring.window(
+        after=max(report_cursor, packet_ring.count - REPORT_PACKETS), limit=REPORT_PACKETS
+    )
+    report_cursor = first + len(report['packets']['timestamp']) - 1
+    with packets_lock:
+        report['alerts'] = detectors.alerts_since(alert_cursor)
+        alert_cursor = detectors.alert_seq
+
+    now = time.time()
+    if now >= next_flow_report:
+        next_flow_report = now + FLOW_REPORT_INTERVAL
+        with packets_lock:
+            flow_table.expire(now)
+            modbus_tracker.expire(now)
+            # Flows are sharded by worker, so the union of each worker's top
+            # flows contains the global top flows
+            flows = set(flow_table.top(REPORT_FLOWS, 'bytes'))
+            flows.update(flow_table.top(REPORT_FLOWS, 'packets'))
+            report['snapshot'] = {
+                'flows': {
+                    'active': len(flow_table),
+                    'stats': dict(flow_table.stats),
+                    'top': [flow.to_dict() for flow in flows]
+                },
+                'modbus': modbus_tracker.snapshot(),
+                'detectors': detectors.snapshot()
+            }
+    elif not report['stats']:
+        return None
+    return report
+
+def merge_results():
+    """Fold reports from pipeline workers into the shared state"""
+    for result in pipeline.results_iter(timeout=REPORT_INTERVAL):
+        if result is not None:
+            for protocol, count in result['stats'].items():
+                protocol_stats[protocol] += count
+            packet_reorder.add(result['worker'], result['packets'])
+            if result['alerts']:
+                with packets_lock:
+                    detectors.import_alerts(result['alerts'])
+            if 'snapshot' in result:
+                worker_snapshots[result['worker']] = result['snapshot']
+        columns = packet_reorder.release(time.time())
+        if columns is not None:
+            packet_ring.extend(columns)
+
+def packets_since(cursor, limit):
+    """Return up to `limit` of the newest packets with seq > cursor, oldest first"""
+    first, columns = packet_ring.window(after=max(cursor, packet_ring.count - limit), limit=limit)
+    return packet_ring.to_dicts(first, columns)
+
+def start_pipeline():
+    """
+    Fork the capture pipeline when MONITOR_WORKERS > 0. Must run before any
+    thread is started: fork copies only the calling thread, so a lock held
+    by another thread at that moment would stay locked in every worker.
+    """
+    global pipeline, packet_reorder
+    workers = int(os.getenv('MONITOR_WORKERS', '0'))
+    if workers <= 0:
+        return
+    interface = os.getenv('MONITOR_INTERFACE', 'eth0')
+    print(f"Starting packet capture on {interface} (afpacket, {workers} workers)...")
+    pipeline = Pipeline(interface, workers, frame_callback, worker_report,
+                        bpf_expression=os.getenv('MONITOR_BPF'))
+    packet_reorder = ReorderBuffer(workers)
+    atexit.register(pipeline.stop)
+    pipeline.start()
 
 def start_sniffer():
     """Start packet capture in background"""
+    if pipeline is not None:
+        # Capture and analysis run in the forked workers; this thread only merges
+        merge_results()
+        return
+
     interface = os.getenv('MONITOR_INTERFACE', 'eth0')
-    print(f"Starting packet capture on {interface}...")
-    sniff(iface=interface, prn=packet_callback, store=False)
+    engine = os.getenv('MONITOR_ENGINE', 'scapy').lower()
+    print(f"Starting packet capture on {interface} ({engine})...")
+    if engine == 'afpacket':
+        capture = AFPacketCapture(interface, bpf_expression=os.getenv('MONITOR_BPF'))
+        for timestamp, frame, length in capture.frames():
+            frame_callback(timestamp, frame, length)
+    else:
+        sniff(iface=interface, prn=packet_callback, store=False, filter=os.getenv('MONITOR_BPF'))
+
+def replay_pcap(path, realtime=False, speed=1.0):
+    """
+    Run the analysis over a .pcap/.pcapng file, as fast as possible or at
+    the original timing (scaled by speed). Returns replay counters, with
+    an 'error' when no frame had a supported link type.
+    """
+    global replay_time
+    frames = skipped = 0
+    unsupported = set()
+    first = None
+    started = time.time()
+    for timestamp, frame, length, linktype in read_pcap(path):
+        if linktype not in LINK_HEADERS:
+            skipped += 1
+            unsupported.add(linktype)
+            continue
+        if realtime:
+            if first is None:
+                first = timestamp
+            delay = started + (timestamp - first) / speed - time.time()
+            if delay > 0:
+                time.sleep(delay)
+        replay_time = timestamp
+        frame_callback(timestamp, frame, length, linktype)
+        frames += 1
+    elapsed = time.time() - started
+    replay = {
+        'file': path,
+        'frames': frames,
+        'skipped': skipped,
+        'elapsed': elapsed,
+        'pps': frames / elapsed if elapsed > 0 else 0.0
+    }
+    if skipped and not frames:
+        replay['error'] = (f"unsupported link type {', '.join(map(str, sorted(unsupported)))}; "
+                           "Ethernet and Linux cooked (SLL/SLL2) captures can be replayed")
+    return replay
+
+def analysis_report(limit=20):
+    """Protocol counts, largest flows and Modbus activity as one JSON-able dict"""
+    with packets_lock:
+        return {
+            'stats': dict(protocol_stats),
+            'flows': {
+                'active': len(flow_table),
+                'stats': dict(flow_table.stats),
+                'top_bytes': [flow.to_dict() for flow in flow_table.top(limit, 'bytes', include_finished=True)],
+                'top_packets': [flow.to_dict() for flow in flow_table.top(limit, 'packets', include_finished=True)]
+            },
+            'modbus': modbus_tracker.snapshot(),
+            'detectors': detectors.snapshot(),
+            'alerts': list(detectors.alerts)
+        }
+
+def top_flows(limit, by):
+    """(active flow count, flow table stats, top flows as dicts)"""
+    if pipeline is not None:
+        snapshots = [snapshot['flows'] for snapshot in list(worker_snapshots.values())]
+        flows = nlargest(limit, (flow for snapshot in snapshots for flow in snapshot['top']),
+                         key=lambda flow: flow[by])
+        active = sum(snapshot['active'] for snapshot in snapshots)
+        stats = {}
+        for snapshot in snapshots:
+            for key, value in snapshot['stats'].items():
+                stats[key] = stats.get(key, 0) + value
+        return active, stats, flows
+    with packets_lock:
+        flow_table.expire(analysis_time())
+        return len(flow_table), dict(flow_table.stats), [flow.to_dict() for flow in flow_table.top(limit, by)]
+
+def ship_events():
+    """Queue new alerts, and a traffic summary every SUMMARY_INTERVAL, for the collector"""
+    source = config.get('ns_id', 'ids')
+    cursor = 0
+    last_stats = dict(protocol_stats)
+    next_summary = time.time() + SUMMARY_INTERVAL
+    while True:
+        time.sleep(1.0)
+        with packets_lock:
+            alerts = detectors.alerts_since(cursor)
+        events = []
+        for alert in alerts:
+            cursor = alert['id']
+            event = {key: value for key, value in alert.items() if key not in ('id', 'timestamp', 'message')}
+            event.update({
+                'service': 'ids',
+                'level': ALERT_LEVELS.get(alert['severity'], 'warning'),
+                'message': f"[{alert['type']}] {alert['message']}",
+                'sensor': source,
+                'event_time': alert['timestamp']
+            })
+            events.append(event)
+
+        now = time.time()
+        if now >= next_summary:
+            next_summary = now + SUMMARY_INTERVAL
+            stats = dict(protocol_stats)
+            delta = {protocol: stats[protocol] - last_stats.get(protocol, 0) for protocol in stats}
+            last_stats = stats
+            active, _, flows = top_flows(5, 'bytes')
+            total = sum(delta.values())
+            breakdown = ', '.join(f'{protocol} {count}' for protocol, count in delta.items() if count)
+            events.append({
+                'service': 'ids',
+                'level': 'info',
+                'message': f"Summary: {total} packets in {SUMMARY_INTERVAL:.0f}s ({breakdown or 'idle'}), "
+                           f"{active} active flows",
+                'sensor': source,
+                'protocols': delta,
+                'active_flows': active,
+                'top_flows': [
+                    {key: flow[key] for key in ('src', 'dst', 'sport', 'dport', 'protocol', 'bytes', 'packets')}
+                    for flow in flows
+                ]
+            })
+
+        if events:
+            shipper.submit(events)
+
+def write_report(replay, path=None):
+    report = {'replay': replay}
+    report.update(analysis_report())
+    text = json.dumps(report, indent=2)
+    if path:
+        with open(path, 'w') as f:
+            f.write(text + '\n')
+        print(f"Report written to {path}")
+    else:
+        print(text)
 
 @app.route('/')
 def index():
     """Main dashboard"""
     return render_template('index.html')
 
+MAX_PACKETS = 10000
+
 @app.route('/api/packets')
 def get_packets():
-    """Get recent packets"""
-    return jsonify(list(packets_buffer)[-100:])
+    """
+    Get a window of packets, oldest first: the newest `limit` by default,
+    those after seq `after` or before seq `before`, or those captured
+    between `since` and `until` (epoch seconds).
+    """
+    try:
+        limit = min(max(int(request.args.get('limit', 100)), 1), MAX_PACKETS)
+        after = request.args.get('after', type=int)
+        before = request.args.get('before', type=int)
+        since = request.args.get('since', type=float)
+        until = request.args.get('until', type=float)
+    except ValueError:
+        return jsonify({'error': 'Invalid limit'}), 400
+    if since is not None:
+        after = packet_ring.seq_at(since) - 1
+    if until is not None:
+        before = packet_ring.seq_at(until) if before is None else min(before, packet_ring.seq_at(until))
+    first, columns = packet_ring.window(after=after, before=before, limit=limit)
+    packets = packet_ring.to_dicts(first, columns)
+    if after is not None and before is not None:
+        packets = [packet for packet in packets if packet['seq'] < before]
+    return jsonify(packets)
+
+STREAM_HEARTBEAT = 15
+STREAM_INTERVAL = 0.5
+STREAM_BATCH = 200
+
+@app.route('/api/packets/stream')
+def stream_packets():
+    """Server-Sent Events tail: push packets newer than the client's cursor"""
+    cursor = request.headers.get('Last-Event-ID') or request.args.get('cursor')
+    try:
+        cursor = int(cursor) if cursor is not None else packet_ring.count
+    except ValueError:
+        return jsonify({'error': 'Invalid cursor'}), 400
+
+    def generate():
+        nonlocal cursor
+        yield 'retry: 2000\n\n'
+        idle = 0.0
+        while True:
+            # Packets arriving within one interval are coalesced into one event
+            packets = packets_since(cursor, STREAM_BATCH)
+            if packets:
+                cursor = packets[-1]['seq']
+                idle = 0.0
+                yield f'id: {cursor}\ndata: {json.dumps(packets)}\n\n'
+            elif idle >= STREAM_HEARTBEAT:
+                idle = 0.0
+                yield ': heartbeat\n\n'
+            time.sleep(STREAM_INTERVAL)
+            idle += STREAM_INTERVAL
+
+    response = Response(generate(), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
 
 @app.route('/api/stats')
 def get_stats():
     """Get protocol statistics"""
     return jsonify(protocol_stats)
 
+@app.route('/api/flows')
+def get_flows():
+    """Top active flows by bytes or packets"""
+    by = request.args.get('by', 'bytes')
+    if by not in ('bytes', 'packets'):
+        return jsonify({'error': 'by must be bytes or packets'}), 400
+    try:
+        limit = min(max(int(request.args.get('limit', 20)), 1), REPORT_FLOWS)
+    except ValueError:
+        return jsonify({'error': 'Invalid limit'}), 400
+
+    active, stats, flows = top_flows(limit, by)
+    return jsonify({'active': active, 'stats': stats, 'flows': flows})
+
+@app.route('/api/modbus')
+def get_modbus():
+    """Modbus function code counters, register ranges and response latency per PLC"""
+    if pipeline is not None:
+        return jsonify(merge_modbus_snapshots(
+            [snapshot['modbus'] for snapshot in list(worker_snapshots.values())]
+        ))
+    with packets_lock:
+        modbus_tracker.expire(analysis_time())
+        return jsonify(modbus_tracker.snapshot())
+
+@app.route('/api/alerts')
+def get_alerts():
+    """Alerts newer than `cursor` (alert id), plus heavy talkers and protocol rates"""
+    try:
+        cursor = int(request.args.get('cursor', 0))
+        limit = min(max(int(request.args.get('limit', 100)), 1), 500)
+    except ValueError:
+        return jsonify({'error': 'Invalid cursor or limit'}), 400
+    with packets_lock:
+        alerts = detectors.alerts_since(cursor)[-limit:]
+        if pipeline is None:
+            status = detectors.snapshot()
+    if pipeline is not None:
+        status = merge_detector_snapshots(
+            [snapshot['detectors'] for snapshot in list(worker_snapshots.values())]
+        )
+    status['alerts'] = alerts
+    return jsonify(status)
+
 @app.route('/api/health')
 def health():
     """Health check"""
-    return jsonify({'status': 'running', 'packets_captured': len(packets_buffer)})
+    status = {'status': 'running', 'packets_captured': packet_ring.count,
+              'packets_buffered': len(packet_ring)}
+    if pipeline is not None:
+        status['pipeline'] = pipeline.stats()
+    if shipper is not None:
+        status['shipper'] = dict(shipper.stats, destination=shipper.destination)
+    return jsonify(status)
 
 if __name__ == '__main__':
-    # Start packet sniffer in background
-    sniffer_thread = Thread(target=start_sniffer, daemon=True)
+    parser = argparse.ArgumentParser(description='OilSprings Network Monitor')
+    parser.add_argument('--read', metavar='PCAP', help='analyze a .pcap/.pcapng file instead of capturing live')
+    parser.add_argument('--realtime', action='store_true',
+                        help='with --read, replay at the original timing and serve the dashboard')
+    parser.add_argument('--speed', type=float, default=1.0, help='replay speed multiplier for --realtime')
+    parser.add_argument('--report', metavar='FILE', help='write the --read JSON report to FILE instead of stdout')
+    args = parser.parse_args()
+
+    if args.read and not args.realtime:
+        replay = replay_pcap(args.read)
+        if 'error' in replay:
+            raise SystemExit(f"{args.read}: {replay['error']}")
+        write_report(replay, args.report)
+        raise SystemExit(0)
+
+    if args.read:
+        def replay():
+            print(f"Replaying {args.read} at {args.speed}x...")
+            write_report(replay_pcap(args.read, realtime=True, speed=args.speed), args.report)
+        sniffer_thread = Thread(target=replay, daemon=True)
+    else:
+        start_pipeline()
+        # Start packet sniffer in background
+        sniffer_thread = Thread(target=start_sniffer, daemon=True)
     sniffer_thread.start()
-    
+
+    if shipper is not None:
+        shipper.start()
+        Thread(target=ship_events, daemon=True).start()
+
     # Start web server
     print("Starting Network Monitor on port 8000...")
     app.run(host='0.0.0.0', port=8000, debug=False)
@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+"""
+OilSprings IDS Packet Ring
+Preallocated columnar ring of packet summaries with lock-free snapshot reads
+
+One array per field (27 bytes per packet, against about 600 for a dict)
+and a single writer. The writer announces the highest seq it is about
+to write, fills the slots and only then publishes the new packet count;
+readers copy column slices without locking and discard any rows the writer
+may have overwritten while they were copying, so every row returned is
+consistent.
+"""
+
+from array import array
+from bisect import bisect_right
+import socket
+import struct
+
+IPV4 = struct.Struct('!I')
+HAS_PORTS = 0x01
+
+# name, array typecode
+COLUMNS = (
+    ('timestamp', 'd'),
+    ('src', 'I'),
+    ('dst', 'I'),
+    ('sport', 'H'),
+    ('dport', 'H'),
+    ('length', 'I'),
+    ('protocol', 'B'),
+    ('transport', 'B'),
+    ('flags', 'B'),
+)
+
+
+def ip_to_int(address):
+    return IPV4.unpack(socket.inet_aton(address))[0]
+
+
+def int_to_ip(value):
+    return socket.inet_ntoa(IPV4.pack(value))
+
+
+class PacketRing:
+    def __init__(self, capacity, protocols):
+        self.capacity = capacity
+        # Protocol names by id; ids are positions in the classifier's table
+        self.protocols = list(protocols)
+        self.protocol_ids = {name: i for i, name in enumerate(self.protocols)}
+        for name, typecode in COLUMNS:
+            setattr(self, name, array(typecode, bytes(array(typecode).itemsize * capacity)))
+        # Packets ever written; packet n (1-based seq) lives in slot (n - 1) % capacity
+        self.count = 0
+        # Highest seq the writer has started to write (count while idle)
+        self.reserved = 0
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    def append(self, timestamp, src, dst, protocol, length, sport=None, dport=None, transport=0):
+        """Writer only: store one packet and return its seq"""
+        slot = self.count % self.capacity
+        self.reserved = self.count + 1
+        self.timestamp[slot] = timestamp
+        self.src[slot] = ip_to_int(src)
+        self.dst[slot] = ip_to_int(dst)
+        if sport is not None:
+            self.sport[slot] = sport
+            self.dport[slot] = dport
+            self.flags[slot] = HAS_PORTS
+        else:
+            self.flags[slot] = 0
+        self.length[slot] = length
+        self.protocol[slot] = self.protocol_ids[protocol]
+        self.transport[slot] = transport
+        # Publish only after the slot is complete
+        self.count += 1
+        return self.count
+
+    def _copy(self, first, last):
+        """Column copies for seqs first..last (inclusive) and the first seq still valid"""
+        capacity = self.capacity
+        start = (first - 1) % capacity
+        stop = start + (last - first + 1)
+        columns = {}
+        for name, _ in COLUMNS:
+            column = getattr(self, name)
+            if stop <= capacity:
+                columns[name] = column[start:stop]
+            else:
+                columns[name] = column[start:] + column[:stop - capacity]
+        # Rows the writer reached during the copy may be half overwritten
+        valid = max(first, self.reserved - capacity + 1)
+        return columns, valid
+
+    def window(self, after=None, before=None, limit=100):
+        """
+        Snapshot of up to `limit` packets as column arrays.
+
+        With `after`, the oldest packets with seq > after; otherwise the
+        newest packets with seq < before (or the newest overall).
+        Returns (first seq, columns).
+        """
+        count = self.count
+        oldest = max(self.reserved - self.capacity + 1, 1)
+        if after is not None:
+            first = max(after + 1, oldest)
+            last = min(first + limit - 1, count)
+        else:
+            last = count if before is None else min(before - 1, count)
+            first = max(last - limit + 1, oldest)
+        if last < first:
+            return first, {name: array(typecode) for name, typecode in COLUMNS}
+        columns, valid = self._copy(first, last)
+        if valid > first:
+            skip = valid - first
+            columns = {name: column[skip:] for name, column in columns.items()}
+            first = valid
+        return first, columns
+
+    def seq_at(self, timestamp):
+        """Seq of the first retained packet at or after timestamp (timestamps are non-decreasing)"""
+        count = self.count
+        low = max(self.reserved - self.capacity + 1, 1)
+        high = count + 1
+        while low < high:
+            middle = (low + high) // 2
+            if self.timestamp[(middle - 1) % self.capacity] < timestamp:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def extend(self, columns):
+        """
+        Writer only: append packets from window() of a ring in another
+        process with the same protocol table (a forked pipeline worker).
+        """
+        total = len(columns['timestamp'])
+        done = 0
+        while done < total:
+            slot = self.count % self.capacity
+            take = min(total - done, self.capacity - slot)
+            self.reserved = self.count + take
+            for name, _ in COLUMNS:
+                getattr(self, name)[slot:slot + take] = columns[name][done:done + take]
+            self.count += take
+            done += take
+
+    def to_dicts(self, first, columns):
+        """Materialize a window as packet_info dicts for the API"""
+        protocols = self.protocols
+        packets = []
+        for i in range(len(columns['timestamp'])):
+            packet_info = {
+                'seq': first + i,
+                'timestamp': columns['timestamp'][i],
+                'src': int_to_ip(columns['src'][i]),
+                'dst': int_to_ip(columns['dst'][i]),
+                'protocol': protocols[columns['protocol'][i]],
+                'length': columns['length'][i]
+            }
+            if columns['flags'][i] & HAS_PORTS:
+                packet_info['sport'] = columns['sport'][i]
+                packet_info['dport'] = columns['dport'][i]
+            packets.append(packet_info)
+        return packets
+
+
+class ReorderBuffer:
+    """
+    Merges packet batches from several writers (pipeline workers) into
+    timestamp order before they are appended to a PacketRing, so seq_at's
+    binary search holds. Each writer's batches are already in order; rows
+    are held until all `writers` have reported past them, or at most `delay`
+    seconds when a writer is quiet. Rows arriving later than that are
+    appended as they come and only blur the edge of a since/until window.
+    """
+
+    def __init__(self, writers, delay=1.0):
+        self.writers = writers
+        self.delay = delay
+        self.pending = {}
+        self.latest = {}
+
+    def add(self, writer, columns):
+        if not len(columns['timestamp']):
+            return
+        pending = self.pending.get(writer)
+        if pending is None:
+            self.pending[writer] = columns
+        else:
+            for name, _ in COLUMNS:
+                pending[name] += columns[name]
+        self.latest[writer] = columns['timestamp'][-1]
+
+    def release(self, now):
+        """Held rows up to the watermark as columns in timestamp order, or None"""
+        if not self.pending:
+            return None
+        watermark = now - self.delay
+        if len(self.latest) >= self.writers:
+            watermark = max(min(self.latest.values()), watermark)
+        parts = []
+        for writer, columns in list(self.pending.items()):
+            cut = bisect_right(columns['timestamp'], watermark)
+            if not cut:
+                continue
+            parts.append({name: column[:cut] for name, column in columns.items()})
+            if cut == len(columns['timestamp']):
+                del self.pending[writer]
+            else:
+                self.pending[writer] = {name: column[cut:] for name, column in columns.items()}
+        if len(parts) <= 1:
+            return parts[0] if parts else None
+        merged = {name: array(typecode) for name, typecode in COLUMNS}
+        for part in parts:
+            for name, column in merged.items():
+                column += part[name]
+        # The parts are sorted runs, which sorted() merges in linear time
+        order = sorted(range(len(merged['timestamp'])), key=merged['timestamp'].__getitem__)
+        return {name: array(typecode, map(merged[name].__getitem__, order))
+                for name, typecode in COLUMNS}
@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+OilSprings IDS Capture File Reader
+Streams frames from .pcap and .pcapng files through mmap
+
+Frames are yielded as memoryview slices of the mapped file, so a capture
+of any size is read without loading it into memory or copying packets.
+"""
+
+import mmap
+import struct
+
+LINKTYPE_ETHERNET = 1
+LINKTYPE_LINUX_SLL = 113   # tcpdump -i any
+LINKTYPE_LINUX_SLL2 = 276  # tcpdump -i any on libpcap 1.10+
+
+PCAP_MAGIC = {
+    b'\xd4\xc3\xb2\xa1': ('<', 1e-6),
+    b'\xa1\xb2\xc3\xd4': ('>', 1e-6),
+    b'\x4d\x3c\xb2\xa1': ('<', 1e-9),
+    b'\xa1\xb2\x3c\x4d': ('>', 1e-9),
+}
+PCAPNG_SHB = 0x0A0D0D0A
+PCAPNG_IDB = 1
+PCAPNG_SPB = 3
+PCAPNG_EPB = 6
+PCAPNG_BYTE_ORDER = 0x1A2B3C4D
+IF_TSRESOL = 9
+
+
+class PcapError(ValueError):
+    pass
+
+
+def read_pcap(path):
+    """
+    Yield (timestamp, frame, captured_length, linktype) for each packet.
+
+    `frame` is a memoryview into the mapped file and is only valid until
+    the next packet is requested.
+    """
+    with open(path, 'rb') as f:
+        try:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            return  # empty file
+    view = memoryview(mm)
+    try:
+        magic = bytes(view[:4])
+        if magic in PCAP_MAGIC:
+            yield from _read_classic(view, *PCAP_MAGIC[magic])
+        elif len(view) >= 12 and struct.unpack_from('<I', view)[0] == PCAPNG_SHB:
+            yield from _read_ng(view)
+        else:
+            raise PcapError(f"{path}: not a pcap or pcapng file")
+    finally:
+        view.release()
+        try:
+            mm.close()
+        except BufferError:
+            # A consumer still holds a frame; the map is freed with it
+            pass
+
+
+def _read_classic(view, order, resolution):
+    if len(view) < 24:
+        raise PcapError("truncated pcap header")
+    linktype = struct.unpack_from(order + 'I', view, 20)[0] & 0x0FFFFFFF
+    record = struct.Struct(order + 'IIII')
+    offset, size = 24, len(view)
+    while offset + record.size <= size:
+        seconds, fraction, captured, _ = record.unpack_from(view, offset)
+        offset += record.size
+        if offset + captured > size:
+            break  # truncated last record
+        yield seconds + fraction * resolution, view[offset:offset + captured], captured, linktype
+        offset += captured
+
+
+def _read_ng(view):
+    size = len(view)
+    offset = 0
+    order = '<'
+    interfaces = []  # (linktype, seconds per timestamp unit)
+    timestamp = 0.0
+    while offset + 12 <= size:
+        block_type, block_length = struct.unpack_from(order + 'II', view, offset)
+        if block_type == PCAPNG_SHB:
+            # The byte-order magic decides how this section is read
+            if struct.unpack_from('<I', view, offset + 8)[0] == PCAPNG_BYTE_ORDER:
+                order = '<'
+            elif struct.unpack_from('>I', view, offset + 8)[0] == PCAPNG_BYTE_ORDER:
+                order = '>'
+            else:
+                raise PcapError("bad pcapng byte-order magic")
+            block_length = struct.unpack_from(order + 'I', view, offset + 4)[0]
+            interfaces = []
+        if block_length < 12 or offset + block_length > size:
+            break  # truncated or corrupt block
+        body = offset + 8
+        end = offset + block_length - 4
+
+        if block_type == PCAPNG_IDB:
+            linktype = struct.unpack_from(order + 'H', view, body)[0]
+            interfaces.append((linktype, _ng_resolution(view, order, body + 8, end)))
+        elif block_type == PCAPNG_EPB:
+            interface, high, low, captured = struct.unpack_from(order + 'IIII', view, body)
+            if interface < len(interfaces):
+                linktype, resolution = interfaces[interface]
+                timestamp = ((high << 32) | low) * resolution
+                data = body + 20
+                yield timestamp, view[data:data + captured], captured, linktype
+        elif block_type == PCAPNG_SPB and interfaces:
+            # Simple packets carry no timestamp or captured length
+            original = struct.unpack_from(order + 'I', view, body)[0]
+            data = body + 4
+            captured = min(original, end - data)
+            yield timestamp, view[data:data + captured], captured, interfaces[0][0]
+
+        offset += block_length
+
+
+def _ng_resolution(view, order, offset, end):
+    """Seconds per timestamp unit from an interface block's if_tsresol option"""
+    while offset + 4 <= end:
+        code, length = struct.unpack_from(order + 'HH', view, offset)
+        if code == 0:
+            break
+        if code == IF_TSRESOL and length >= 1:
+            value = view[offset + 4]
+            return 2.0 ** -(value & 0x7F) if value & 0x80 else 10.0 ** -value
+        offset += 4 + (length + 3) // 4 * 4
+    return 1e-6
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+OilSprings IDS Pipeline
+Multi-process capture and analysis
+
+    capture process --(shared-memory rings, one per worker)--> workers
+    workers --(periodic result batches)--> API process
+
+The capture process only reads frames and copies them into the ring of
+the worker chosen by a symmetric flow hash, so both directions of a
+conversation are analysed by the same worker. Workers are forked from the
+API process, so they run the monitor's own frame handler against their
+private copy of its state and send a report every REPORT_INTERVAL seconds,
+which keeps the API process out of the per-packet path.
+"""
+
+import multiprocessing
+import queue
+import signal
+import time
+
+from capture import ETH_P_8021Q, IPPROTO_TCP, IPPROTO_UDP, AFPacketCapture
+from shm_ring import FrameRing
+
+REPORT_INTERVAL = 0.25
+IDLE_SLEEP = 0.001
+
+
+def flow_worker(frame, workers):
+    """Pick a worker from the IPv4 addresses and ports, same for both directions"""
+    if len(frame) < 34:
+        return 0
+    ip = 18 if (frame[12] << 8) | frame[13] == ETH_P_8021Q else 14
+    if len(frame) < ip + 20:
+        return 0
+    src = int.from_bytes(frame[ip + 12:ip + 16], 'big')
+    dst = int.from_bytes(frame[ip + 16:ip + 20], 'big')
+    l4 = ip + (frame[ip] & 0x0F) * 4
+    ports = 0
+    # Fragments hash on addresses alone so every fragment of a datagram goes together
+    fragment = ((frame[ip + 6] << 8) | frame[ip + 7]) & 0x3FFF
+    if frame[ip + 9] in (IPPROTO_TCP, IPPROTO_UDP) and not fragment and len(frame) >= l4 + 4:
+        ports = int.from_bytes(frame[l4:l4 + 2], 'big') ^ int.from_bytes(frame[l4 + 2:l4 + 4], 'big')
+    return (src ^ dst ^ ports) % workers
+
+
+def capture_main(interface, bpf_expression, rings):
+    """Capture process: fan raw frames out to the worker rings"""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    capture = AFPacketCapture(interface, bpf_expression=bpf_expression,
+                              snaplen=rings[0].slot_size)
+    workers = len(rings)
+    for timestamp, frame, length in capture.frames():
+        ring = rings[flow_worker(frame[:length], workers)] if workers > 1 else rings[0]
+        ring.push(timestamp, frame, length)
+
+
+def worker_main(ring, results, handle, report):
+    """
+    Worker process: analyze frames from one ring.
+
+    `handle(timestamp, frame, length)` is called for every frame and
+    `report()` once per REPORT_INTERVAL; its result, when not None, is sent
+    to the API process.
+    """
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    next_report = time.time() + REPORT_INTERVAL
+    while True:
+        handled = ring.consume(handle)
+        now = time.time()
+        if now >= next_report:
+            result = report()
+            if result is not None:
+                results.put(result)
+            next_report = now + REPORT_INTERVAL
+        if not handled:
+            time.sleep(IDLE_SLEEP)
+
+
+class Pipeline:
+    """Owns the rings and child processes of a multi-process capture"""
+
+    def __init__(self, interface, workers, handle, report, bpf_expression=None,
+                 ring_slots=65536, snaplen=2048):
+        self.context = multiprocessing.get_context('fork')
+        self.rings = [FrameRing(ring_slots, snaplen) for _ in range(workers)]
+        self.results = self.context.Queue(maxsize=workers * 64)
+        self.processes = [
+            self.context.Process(target=worker_main, args=(ring, self.results, handle, report),
+                                 name=f'ids-worker-{i}', daemon=True)
+            for i, ring in enumerate(self.rings)
+        ]
+        self.processes.append(
+            self.context.Process(target=capture_main, args=(interface, bpf_expression, self.rings),
+                                 name='ids-capture', daemon=True)
+        )
+
+    def start(self):
+        for process in self.processes:
+            process.start()
+
+    def results_iter(self, timeout=None):
+        """Yield result batches from the workers, or None after `timeout` seconds without one"""
+        while True:
+            try:
+                yield self.results.get(timeout=timeout)
+            except queue.Empty:
+                yield None
+
+    def stats(self):
+        return {
+            'workers': len(self.rings),
+            'alive': sum(process.is_alive() for process in self.processes),
+            'rings': [ring.stats() for ring in self.rings],
+            'ring_overruns': sum(ring.stats()['overruns'] for ring in self.rings)
+        }
+
+    def stop(self):
+        for process in self.processes:
+            if process.is_alive():
+                process.terminate()
+        for process in self.processes:
+            process.join(timeout=2)
+        for ring in self.rings:
+            ring.close()
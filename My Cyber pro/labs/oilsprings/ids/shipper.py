@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""
+OilSprings IDS Event Shipper
+Sends alerts and summaries to the OilSprings collector without blocking capture
+
+Events are rate-limited by a token bucket, queued in a bounded buffer and
+sent in batches by a background thread: as gzip-compressed NDJSON to the
+collector's /api/logs/batch, or as JSON lines to its syslog port. Events
+over the rate or queue limits are dropped and counted, so a slow or
+offline collector never backs up packet processing. Batches the collector
+rejects with a 4xx status are dropped and counted rather than retried.
+"""
+
+from collections import deque
+from threading import Condition, Thread
+import json
+import socket
+import time
+import urllib.error
+import urllib.request
+import zlib
+
+
+class TokenBucket:
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def take(self, count=1):
+        """Return how many of `count` tokens are available and consume them"""
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        granted = min(count, int(self.tokens))
+        self.tokens -= granted
+        return granted
+
+
+def gzip_lines(events):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    body = b'\n'.join(json.dumps(event, separators=(',', ':')).encode() for event in events)
+    return compressor.compress(body + b'\n') + compressor.flush()
+
+
+class EventShipper:
+    def __init__(self, url=None, syslog_address=None, syslog_protocol='tcp', queue_size=10000,
+                 batch_size=200, flush_interval=1.0, rate=100, burst=500, timeout=5.0):
+        self.url = url.rstrip('/') + '/api/logs/batch' if url else None
+        self.syslog_address = syslog_address
+        self.syslog_protocol = syslog_protocol.lower()
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.timeout = timeout
+        self.bucket = TokenBucket(rate, burst)
+
+        self._queue = deque()
+        self._ready = Condition()
+        self._sock = None
+        self._backoff = 0.5
+        self.running = False
+        self.stats = {
+            'queued': 0,
+            'sent': 0,
+            'dropped': 0,
+            'rate_limited': 0,
+            'batches': 0,
+            'bytes_sent': 0,
+            'send_errors': 0,
+            'rejected': 0,
+            'last_error': None
+        }
+
+    @property
+    def destination(self):
+        if self.url:
+            return self.url
+        return f'{self.syslog_address[0]}:{self.syslog_address[1]} ({self.syslog_protocol})'
+
+    def submit(self, events):
+        """Queue events for shipping; never blocks on the network"""
+        with self._ready:
+            allowed = self.bucket.take(len(events))
+            if allowed < len(events):
+                self.stats['rate_limited'] += len(events) - allowed
+                events = events[:allowed]
+            room = self.queue_size - len(self._queue)
+            if room < len(events):
+                self.stats['dropped'] += len(events) - max(room, 0)
+                events = events[:max(room, 0)]
+            self._queue.extend(events)
+            self.stats['queued'] = len(self._queue)
+            if len(self._queue) >= self.batch_size:
+                self._ready.notify()
+
+    def start(self):
+        self.running = True
+        Thread(target=self._run, daemon=True).start()
+        print(f"Shipping IDS events to {self.destination}")
+
+    def stop(self):
+        self.running = False
+        with self._ready:
+            self._ready.notify()
+
+    def _take_batch(self):
+        with self._ready:
+            if len(self._queue) < self.batch_size:
+                self._ready.wait(self.flush_interval)
+            count = min(len(self._queue), self.batch_size)
+            batch = [self._queue.popleft() for _ in range(count)]
+            self.stats['queued'] = len(self._queue)
+            return batch
+
+    def _requeue(self, batch):
+        """Put an unsent batch back at the front if there is room"""
+        with self._ready:
+            room = self.queue_size - len(self._queue)
+            keep = batch[-room:] if room > 0 else []
+            self.stats['dropped'] += len(batch) - len(keep)
+            self._queue.extendleft(reversed(keep))
+            self.stats['queued'] = len(self._queue)
+
+    def _send_http(self, batch):
+        body = gzip_lines(batch)
+        request = urllib.request.Request(self.url, data=body, method='POST', headers={
+            'Content-Type': 'application/x-ndjson',
+            'Content-Encoding': 'gzip'
+        })
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            response.read()
+        return len(body)
+
+    def _send_syslog(self, batch):
+        if self._sock is None:
+            if self.syslog_protocol == 'tcp':
+                self._sock = socket.create_connection(self.syslog_address, timeout=self.timeout)
+            else:
+                self._sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+                self._sock.connect(self.syslog_address)
+        lines = [json.dumps(event, separators=(',', ':')).encode() for event in batch]
+        if self.syslog_protocol == 'tcp':
+            data = b'\n'.join(lines) + b'\n'
+            self._sock.sendall(data)
+            return len(data)
+        for line in lines:
+            self._sock.send(line)
+        return sum(len(line) for line in lines)
+
+    def _run(self):
+        while self.running:
+            batch = self._take_batch()
+            if not batch:
+                continue
+            try:
+                sent = self._send_http(batch) if self.url else self._send_syslog(batch)
+            except urllib.error.HTTPError as e:
+                e.close()
+                self.stats['last_error'] = str(e)
+                if e.code < 500:
+                    # Resending a batch the collector refused would fail forever
+                    self.stats['rejected'] += len(batch)
+                    continue
+                self.stats['send_errors'] += 1
+                self._requeue(batch)
+                time.sleep(self._backoff)
+                self._backoff = min(self._backoff * 2, 30.0)
+                continue
+            except (OSError, urllib.error.URLError) as e:
+                self.stats['send_errors'] += 1
+                self.stats['last_error'] = str(e)
+                if self._sock is not None:
+                    self._sock.close()
+                    self._sock = None
+                self._requeue(batch)
+                # Back off while the collector is unreachable
+                time.sleep(self._backoff)
+                self._backoff = min(self._backoff * 2, 30.0)
+                continue
+
+            self._backoff = 0.5
+            self.stats['sent'] += len(batch)
+            self.stats['bytes_sent'] += sent
+            self.stats['batches'] += 1
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+OilSprings IDS Frame Ring
+Single-producer/single-consumer ring of raw frames in shared memory
+
+Layout: a header with the write index, read index and overrun counter on
+separate cache lines, followed by fixed-size slots of
+(timestamp, length, frame bytes). The producer only writes the write index
+and the consumer only writes the read index, so no lock is needed.
+"""
+
+from multiprocessing import shared_memory
+import struct
+
+INDEX = struct.Struct('<Q')
+SLOT_HEADER = struct.Struct('<dI4x')
+WRITE_OFFSET = 0
+READ_OFFSET = 64
+OVERRUN_OFFSET = 128
+HEADER_SIZE = 192
+
+
+class FrameRing:
+    def __init__(self, slots=65536, slot_size=2048):
+        self.slots = slots
+        self.slot_size = slot_size
+        self.stride = SLOT_HEADER.size + slot_size
+        self.shm = shared_memory.SharedMemory(create=True, size=HEADER_SIZE + slots * self.stride)
+        self.buf = self.shm.buf
+        self.buf[:HEADER_SIZE] = bytes(HEADER_SIZE)
+        self._write = 0
+        self._read = 0
+        self._overruns = 0
+
+    def _index(self, offset):
+        return INDEX.unpack_from(self.buf, offset)[0]
+
+    def push(self, timestamp, frame, length):
+        """Producer: copy a frame into the next slot; False if the ring is full"""
+        write = self._write
+        if write - self._index(READ_OFFSET) >= self.slots:
+            self._overruns += 1
+            INDEX.pack_into(self.buf, OVERRUN_OFFSET, self._overruns)
+            return False
+        length = min(length, self.slot_size)
+        offset = HEADER_SIZE + (write % self.slots) * self.stride
+        SLOT_HEADER.pack_into(self.buf, offset, timestamp, length)
+        start = offset + SLOT_HEADER.size
+        self.buf[start:start + length] = frame[:length]
+        # Publish the slot only after its contents are written
+        self._write = write + 1
+        INDEX.pack_into(self.buf, WRITE_OFFSET, self._write)
+        return True
+
+    def consume(self, handler, limit=1024):
+        """
+        Consumer: call handler(timestamp, frame, length) for up to `limit`
+        pending frames and return how many were handled.
+
+        `frame` is a memoryview into shared memory, valid only during the call.
+        """
+        read = self._read
+        available = min(self._index(WRITE_OFFSET) - read, limit)
+        buf, slots, stride = self.buf, self.slots, self.stride
+        header_size = SLOT_HEADER.size
+        for i in range(available):
+            offset = HEADER_SIZE + ((read + i) % slots) * stride
+            timestamp, length = SLOT_HEADER.unpack_from(buf, offset)
+            start = offset + header_size
+            handler(timestamp, buf[start:start + length], length)
+        if available:
+            self._read = read + available
+            INDEX.pack_into(buf, READ_OFFSET, self._read)
+        return available
+
+    def stats(self):
+        """Occupancy and overrun counters, readable from any process"""
+        write = self._index(WRITE_OFFSET)
+        return {
+            'pending': write - self._index(READ_OFFSET),
+            'written': write,
+            'overruns': self._index(OVERRUN_OFFSET),
+            'slots': self.slots
+        }
+
+    def close(self):
+        self.buf = None
+        self.shm.close()
+        try:
+            self.shm.unlink()
+        except FileNotFoundError:
+            pass
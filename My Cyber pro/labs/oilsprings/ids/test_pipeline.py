@@ -0,0 +1,44 @@
+import socket
+import struct
+
+from pipeline import flow_worker
+
+IPV4 = struct.Struct('!BBHHHBBH4s4s')
+
+
+def frame(src, dst, sport, dport, vlan=None, options=b''):
+    """Ethernet frame of one TCP segment, optionally 802.1Q tagged or with IP options"""
+    tcp = struct.pack('!HHIIBBHHH', sport, dport, 0, 0, 0x50, 0x18, 0, 0, 0)
+    ihl = 5 + len(options) // 4
+    ip = IPV4.pack(0x40 | ihl, 0, ihl * 4 + len(tcp), 0, 0, 64, 6, 0,
+                   socket.inet_aton(src), socket.inet_aton(dst)) + options
+    ethernet = b'\x02' * 12
+    if vlan is not None:
+        ethernet += struct.pack('!HH', 0x8100, vlan)
+    return ethernet + b'\x08\x00' + ip + tcp
+
+
+def conversation(client_port, **layout):
+    request = frame('10.0.0.5', '192.168.2.10', client_port, 502, **layout)
+    response = frame('192.168.2.10', '10.0.0.5', 502, client_port, **layout)
+    return request, response
+
+
+def test_both_directions_map_to_one_worker():
+    for layout in ({}, {'vlan': 20}, {'options': b'\x01' * 4}, {'vlan': 20, 'options': b'\x01' * 8}):
+        for client_port in range(40000, 40064):
+            request, response = conversation(client_port, **layout)
+            for workers in (2, 3, 4, 8):
+                assert flow_worker(request, workers) == flow_worker(response, workers)
+
+
+def test_vlan_tag_and_options_do_not_change_the_worker():
+    for client_port in range(40000, 40064):
+        plain = flow_worker(conversation(client_port)[0], 4)
+        assert flow_worker(conversation(client_port, vlan=20)[0], 4) == plain
+        assert flow_worker(conversation(client_port, options=b'\x01' * 4)[0], 4) == plain
+
+
+def test_memoryview_frames():
+    request, response = conversation(40001, vlan=7)
+    assert flow_worker(memoryview(request), 4) == flow_worker(memoryview(response), 4)